@@ -0,0 +1,72 @@
+"""How long the JSON tests of a directive take on a response, per response,
+for a directive with a test for each item of a list in the body, and for one
+with a single test of every item using a wildcard.
+
+    python benchmarks/json_tests.py [number of items] [number of responses]
+"""
+from __future__ import print_function
+
+import json
+import sys
+import time
+
+from requests.models import Response
+
+from smoketest.tests import get_json_tests
+
+
+def make_element(n_items, wildcard=False):
+    if wildcard:
+        tests = [{'selector': 'data.items.*.name', 'startswith': 'item'}]
+    else:
+        tests = [
+            {'selector': 'data.items.{0}.name'.format(i), 'startswith': 'item'}
+            for i in range(n_items)
+        ]
+    tests.append({'selector': 'data.name', 'equals': 'Page'})
+    return {'url': 'http://www.usnews.com/api', 'json': tests}
+
+
+def make_body(n_items):
+    return json.dumps({
+        'data': {
+            'name': 'Page',
+            'items': [
+                {'id': i, 'name': 'item {0}'.format(i)}
+                for i in range(n_items)
+            ],
+        },
+    }).encode('utf-8')
+
+
+def make_response(body):
+    response = Response()
+    response._content = body
+    response.headers['Content-Type'] = 'application/json'
+    return response
+
+
+def microseconds_per_response(json_tests, body, n_responses):
+    # Responses go once they've been tested, as in a run
+    started = time.time()
+    for _ in range(n_responses):
+        response = make_response(body)
+        assert all([test.get_result(response) for test in json_tests])
+    return (time.time() - started) * 1e6 / n_responses
+
+
+def main():
+    n_items = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_responses = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    body = make_body(n_items)
+
+    for wildcard in (False, True):
+        json_tests = get_json_tests(make_element(n_items, wildcard), None)
+        print('{0} JSON tests: {1:.1f}us per response'.format(
+            len(json_tests),
+            microseconds_per_response(json_tests, body, n_responses),
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""How long it takes to read a plain list of URLs, per million URLs: just
+picking the lines apart, and making directives out of them as well.
+
+    python benchmarks/load_plain_list.py [number of URLs]
+"""
+from __future__ import print_function
+
+import os
+import sys
+import tempfile
+import time
+
+from smoketest import parse_args
+from smoketest.directives import FileParser
+from smoketest.plaintext import read_lines
+
+from memory_per_url import write_urls
+
+
+def per_million(seconds, n_urls):
+    return seconds * 1e6 / n_urls
+
+
+def main():
+    n_urls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        write_urls(f, n_urls)
+    try:
+        started = time.time()
+        n_lines = sum(1 for _ in read_lines(f.name))
+        reading = time.time() - started
+
+        options = parse_args([f.name, '--dry-run'])
+        started = time.time()
+        n_directives = len(list(FileParser(f.name, options).generate_directives()))
+        loading = time.time() - started
+    finally:
+        os.unlink(f.name)
+    assert n_lines == n_directives == n_urls
+    print('Reading lines: {0:.2f}s per million URLs'.format(
+        per_million(reading, n_urls),
+    ))
+    print('Making directives: {0:.2f}s per million URLs'.format(
+        per_million(loading, n_urls),
+    ))
+
+
+if __name__ == '__main__':
+    main()
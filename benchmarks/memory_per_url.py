@@ -0,0 +1,47 @@
+"""How much memory a plain list of URLs takes once it's been read into
+directives, per URL.
+
+    python benchmarks/memory_per_url.py [number of URLs]
+
+Needs Python 3, for tracemalloc.
+"""
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from smoketest import parse_args
+from smoketest.directives import FileParser
+
+
+def write_urls(f, n_urls):
+    for i in range(n_urls):
+        if i % 10 == 0:
+            f.write('301 http://www.usnews.com/old/{0} -> '
+                    'http://www.usnews.com/new/{0}\n'.format(i))
+        else:
+            f.write('http://www.usnews.com/page/{0}\n'.format(i))
+
+
+def main():
+    n_urls = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        write_urls(f, n_urls)
+    try:
+        options = parse_args([f.name, '--dry-run'])
+        gc.collect()
+        tracemalloc.start()
+        directives = list(FileParser(f.name, options).generate_directives())
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        os.unlink(f.name)
+    print('{0} URLs: {1:.1f} MB, {2:.0f} bytes per URL'.format(
+        len(directives), size / 1e6, float(size) / len(directives),
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""How long it takes to get the tests for an element, and to make a
+directive out of one, per directive, for a mix of plain URLs and elements
+with tests of each kind.
+
+    python benchmarks/parse_elements.py [number of directives]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from smoketest import parse_args
+from smoketest.directives import CheckDirective
+from smoketest.tests import get_tests_from_element
+
+
+ELEMENTS = [
+    {'url': 'http://www.usnews.com/page/{0}'},
+    {'url': 'http://www.usnews.com/page/{0}', 'status': '404'},
+    {
+        'url': 'http://www.usnews.com/old/{0}',
+        'redirect': {'location': 'http://www.usnews.com/new/{0}'},
+    },
+    {
+        'url': 'http://www.usnews.com/page/{0}',
+        'html': [{'selector': 'h1', 'contains': 'Page'}],
+    },
+    {
+        'url': 'http://www.usnews.com/api/{0}',
+        'json': [{'selector': 'data.name', 'equals': 'Page'}],
+        'headers': [{'header': 'Content-Type', 'contains': 'json'}],
+    },
+]
+
+
+def make_elements(n_directives):
+    elements = []
+    for i in range(n_directives):
+        elem = dict(ELEMENTS[i % len(ELEMENTS)])
+        elem['url'] = elem['url'].format(i)
+        elements.append(elem)
+    return elements
+
+
+def microseconds_each(seconds, n_directives):
+    return seconds * 1e6 / n_directives
+
+
+def main():
+    n_directives = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    options = parse_args(['-', '--dry-run'])
+    elements = make_elements(n_directives)
+
+    # Keep what's made, as a run would, so that shared tests stay shared
+    started = time.time()
+    tests = [get_tests_from_element(elem, options) for elem in elements]
+    parsing = time.time() - started
+
+    started = time.time()
+    directives = [CheckDirective(elem, options) for elem in elements]
+    making = time.time() - started
+    assert len(tests) == len(directives) == n_directives
+
+    print('Getting tests: {0:.2f}us per directive'.format(
+        microseconds_each(parsing, n_directives),
+    ))
+    print('Making directives: {0:.2f}us per directive'.format(
+        microseconds_each(making, n_directives),
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""How long smoketest takes to start: importing it, and a dry run of a
+one-line plain list, each in a fresh interpreter, less the time the
+interpreter takes to start by itself. Fails if either goes over budget, or
+if the dry run imported any of the dependencies that only some directives
+need.
+
+    python benchmarks/startup.py [budget in ms] [number of runs]
+"""
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Dependencies that should only be imported once something needs them
+HEAVY_MODULES = (
+    'httpx',
+    'jsonschema',
+    'lxml',
+    'requests',
+    'yaml',
+)
+
+IMPORT = 'import smoketest'
+
+DRY_RUN = '''
+import sys
+sys.argv = ['smoketest', {0!r}, '--dry-run']
+import smoketest
+try:
+    smoketest.main()
+except SystemExit:
+    pass
+heavy = [m for m in {1!r} if m in sys.modules]
+if heavy:
+    sys.exit('Imported ' + ', '.join(heavy))
+'''
+
+
+# The smoketest these benchmarks sit next to, rather than an installed one
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def median_ms(code, n_runs, cwd):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [p for p in [env.get('PYTHONPATH')] if p]
+    )
+    times = []
+    for _ in range(n_runs):
+        started = time.time()
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(
+                [sys.executable, '-c', code],
+                cwd=cwd,
+                env=env,
+                stdout=devnull,
+            )
+        times.append((time.time() - started) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_runs = int(sys.argv[2]) if len(sys.argv) > 2 else 11
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'urls.txt')
+    with open(filename, 'w') as f:
+        f.write('http://www.usnews.com/\n')
+    try:
+        interpreter = median_ms('pass', n_runs, directory)
+        importing = median_ms(IMPORT, n_runs, directory) - interpreter
+        dry_run = median_ms(
+            DRY_RUN.format(filename, HEAVY_MODULES),
+            n_runs,
+            directory,
+        ) - interpreter
+    finally:
+        os.unlink(filename)
+        os.rmdir(directory)
+    print('Interpreter: {0:.0f}ms'.format(interpreter))
+    print('import smoketest: {0:.0f}ms'.format(importing))
+    print('Dry run of one URL: {0:.0f}ms'.format(dry_run))
+    if max(importing, dry_run) > budget:
+        sys.exit('Over the startup budget of {0:.0f}ms'.format(budget))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""How long URL transforms take, per million URLs, with the level, a
+cachebuster and some special cases to apply.
+
+    python benchmarks/transform_urls.py [number of URLs] [number of special cases]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from smoketest import settings
+from smoketest.utils import (
+    get_url_transformer,
+    transform_url,
+)
+
+
+def main():
+    n_urls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    n_special_cases = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    settings._SETTINGS = {
+        'special_cases_url_transforms': dict(
+            ('/old-section-{0}/'.format(i), '/section-{0}/'.format(i))
+            for i in range(n_special_cases)
+        ),
+    }
+    urls = [
+        'https://www.usnews.com/old-section-{0}/page-{1}?x=1'.format(
+            i % (n_special_cases or 1), i,
+        )
+        for i in range(n_urls)
+    ]
+    kwargs = dict(level='stag', cachebust=True)
+
+    started = time.time()
+    for url in urls:
+        transform_url(url, **kwargs)
+    one_at_a_time = time.time() - started
+
+    started = time.time()
+    get_url_transformer(**kwargs).transform_all(urls)
+    all_at_once = time.time() - started
+
+    print('One at a time: {0:.2f}s per million URLs'.format(
+        one_at_a_time * 1e6 / n_urls,
+    ))
+    print('All at once: {0:.2f}s per million URLs'.format(
+        all_at_once * 1e6 / n_urls,
+    ))
+
+
+if __name__ == '__main__':
+    main()
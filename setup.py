@@ -22,6 +22,9 @@ config = {
         'six',
         'requests',
     ],
+    'extras_require': {
+        'http2': ['httpx[http2]'],
+    },
     'tests_require': [
         'coverage',
         'mock==1.0.1',
@@ -1,37 +1,91 @@
-import imp
+import copy
 import io
-from time import sleep
+import json
+import socket
 import sys
+import time
 
 import argparse
+from six.moves import zip_longest
 
+from smoketest.changes import enable_change_detection
 from smoketest.directives import (
     InputFileError,
     generate_directives_from_file,
 )
+from smoketest.distributed import (
+    Coordinator,
+    Worker,
+    parse_address,
+)
 from smoketest.loggers import (
     Constants as LoggingConstants,
     get_logger,
 )
+from smoketest.nodes import (
+    fan_out,
+    parse_nodes,
+)
+from smoketest.plugins import (
+    PluginError,
+    get_plugin_registry,
+    load_plugins,
+)
+from smoketest.reports import merge_json_reports
+from smoketest.resolver import (
+    enable_connect_to,
+    enable_dns_cache,
+    get_hosts,
+)
+from smoketest.retries import retry_count
 from smoketest.settings import (
+    get_default_connect_to,
     get_default_threads,
     get_default_user_agent,
-    get_plugin_names,
+    get_dns_cache_ttl,
+    get_result_store_filename,
+)
+from smoketest.sharding import (
+    make_sharder,
+    parse_shard,
+    save_costs,
+    set_sharder,
+)
+from smoketest.store import open_result_store
+from smoketest.tallies import (
+    Tally,
+    TallyingLogger,
 )
+from smoketest.tests import unknown_element_keys
 from smoketest.threads import (
     alive_threads,
     get_threads_and_stop_event,
 )
+from smoketest.throttling import get_rate_limiters
+from smoketest.tls import get_ssl_context
+from smoketest.transports import (
+    TransportUnavailable,
+    get_origins,
+    transport_keys,
+    use_transport,
+)
 
 
-def load_plugins():
-    for plugin_name in get_plugin_names():
-        f, path, desc = imp.find_module(plugin_name, ['plugins'])
-        imp.load_module(plugin_name, f, path, desc)
+def _summarize_throttling(logger):
+    rate_limiters = get_rate_limiters()
+    if rate_limiters:
+        logger.add_to_summary(
+            'Time spent throttled',
+            sum(r.throttled_time for r in rate_limiters),
+        )
+        logger.add_to_summary(
+            'Number of throttled requests',
+            sum(r.throttled_count for r in rate_limiters),
+        )
 
 
-def parse_args():
-    parser = argparse.ArgumentParser()
+def get_argument_parser(prog=None):
+    parser = argparse.ArgumentParser(prog=prog)
     parser.add_argument(
         'input_filenames', nargs='+'
     )
@@ -47,7 +101,8 @@ def parse_args():
         '-l', '--level',
         dest='level',
         default='live',
-        help='Transform live-site URLs to target a particular server (e.g., dev, stag)'
+        help='Transform live-site URLs to target a particular server (e.g., dev, stag); '
+             'give several, separated by commas, to test them all at once'
     )
     parser.add_argument(
         '-p', '--port',
@@ -73,6 +128,68 @@ def parse_args():
         action='store_false', dest='cachebust', default=True,
         help='Disable cachebusting',
     )
+    parser.add_argument(
+        '--skip-unchanged',
+        action='store_true', dest='skip_unchanged',
+        help="Reuse earlier results of body tests when a response hasn't "
+             "changed, instead of parsing it again"
+    )
+    parser.add_argument(
+        '--shard',
+        dest='shard', default=None,
+        help='Only run shard I of N of the input, given as I/N (e.g. 2/5); '
+             'shards are numbered from 1'
+    )
+    parser.add_argument(
+        '--shard-costs',
+        dest='shard_costs', default=None,
+        help='File of past response times, written by --save-shard-costs, '
+             'to balance shards by; every shard must be given the same file'
+    )
+    parser.add_argument(
+        '--input-slice',
+        dest='input_slice', default=None,
+        help='Only read slice I of N of plain text input files, given as I/N '
+             '(e.g. 2/5), splitting them up by bytes rather than by URL; '
+             'for running a huge list across several processes without each '
+             'of them reading all of it'
+    )
+    parser.add_argument(
+        '--transport',
+        dest='transport', default='requests',
+        help='How to make requests; choices: {0}, or one a plugin provides; '
+             '"http2" uses HTTP/2 where servers support it and needs '
+             'httpx[http2]; default: requests'.format(
+                 ', '.join(transport_keys())
+             )
+    )
+    parser.add_argument(
+        '--dns-cache-ttl',
+        dest='dns_cache_ttl', default=get_dns_cache_ttl(), type=float,
+        help='Cache host name lookups for this many seconds, and look up '
+             'every host before each pass; default: "dns_cache_ttl" in '
+             'settings.yaml, or no caching'
+    )
+    parser.add_argument(
+        '--connect-to',
+        dest='connect_to', action='append', metavar='HOST:PORT:IP:PORT',
+        help='Connect to IP:PORT for requests to HOST:PORT, leaving URLs, '
+             'Host headers and TLS server names alone; can be used multiple '
+             'times, and added to "connect_to" in settings.yaml'
+    )
+    parser.add_argument(
+        '--nodes',
+        dest='nodes', default=None, metavar='IP[:PORT],...',
+        help='Run every test against each of these backend nodes at once, '
+             'connecting to them directly, and compare how they did'
+    )
+    parser.add_argument(
+        '--warm-up-connections',
+        dest='warm_up_connections', default=0, type=int,
+        help='Number of connections to open to each host before each pass, '
+             'so that the first requests to it are not slowed down by '
+             'connecting; default: 0'
+    )
     parser.add_argument(
         '--dry-run',
         action='store_true', dest='dry_run',
@@ -112,45 +229,286 @@ def parse_args():
         dest='passes', default=1, type=int,
         help='Number of passes'
     )
+    parser.add_argument(
+        '--retries',
+        dest='retries', default=None, type=int,
+        help='Number of times to retry a request that hits a transient '
+             'error, within a pass; default: 0, or "retry" in settings.yaml'
+    )
     parser.add_argument(
         '--delay-between-passes',
         dest='delay_between_passes', default=0, type=int,
         help='Number of seconds to wait between passes; default: 0'
     )
 
-    args = parser.parse_args()
-    args.threads = args.threads or get_default_threads(args.level)
+    # Result store settings
+    parser.add_argument(
+        '--store',
+        dest='store', default=get_result_store_filename(),
+        help='SQLite file to record results in; default: "result_store" '
+             'in settings.yaml'
+    )
+    parser.add_argument(
+        '--run-label',
+        dest='run_label', default=None,
+        help='Label to record this run under in the result store'
+    )
+    parser.add_argument(
+        '--diff-against',
+        dest='diff_against', default=None,
+        help='Report regressions and timing changes since an earlier run in '
+             'the result store, given by ID, label, or "last"'
+    )
+    parser.add_argument(
+        '--timing-threshold',
+        dest='timing_threshold', default=1.0, type=float,
+        help='Smallest change in response time, in seconds, that '
+             '--diff-against reports; default: 1.0'
+    )
+    parser.add_argument(
+        '--save-shard-costs',
+        dest='save_shard_costs', default=None,
+        help='Write the response times in the result store to a file for '
+             '--shard-costs at the end of the run'
+    )
+    parser.add_argument(
+        '--skip-passed-within',
+        dest='skip_passed_within', default=None, type=float,
+        help="Skip URLs whose results in the result store were all passing "
+             "over this many seconds"
+    )
+
+    return parser
+
+
+def parse_args(argv=None, parser=None):
+    parser = parser or get_argument_parser()
+    args = parser.parse_args(argv)
+    args.levels = [level.strip() for level in args.level.split(',')]
+    if len(args.levels) == 1:
+        args.threads = args.threads or get_default_threads(args.level)
+    else:
+        # Every level gets its own share of the threads
+        args.threads = sum(
+            args.threads or get_default_threads(level)
+            for level in args.levels
+        )
+    if args.transport not in transport_keys():
+        # Plugins only get looked for if it isn't one of smoketest's own
+        try:
+            found = get_plugin_registry().load('transports', args.transport)
+        except PluginError as e:
+            parser.error(str(e))
+        if not found:
+            parser.error('Unknown transport {0}; choices: {1}'.format(
+                args.transport,
+                ', '.join(transport_keys() + get_plugin_registry().keys(
+                    'transports'
+                )),
+            ))
+    if (args.diff_against or args.skip_passed_within) and not args.store:
+        parser.error('--diff-against and --skip-passed-within need --store')
+    if args.save_shard_costs and not args.store:
+        parser.error('--save-shard-costs needs --store')
+    if args.shard_costs and not args.shard:
+        parser.error('--shard-costs needs --shard')
+    if args.shard:
+        try:
+            parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.input_slice:
+        try:
+            parse_shard(args.input_slice, 'Input slice')
+        except ValueError as e:
+            parser.error(str(e))
+    if args.nodes:
+        try:
+            parse_nodes(args.nodes)
+        except ValueError as e:
+            parser.error(str(e))
     return args
 
 
+def _load_directives(args):
+    input_slice = None
+    if args.input_slice:
+        input_slice = parse_shard(args.input_slice, 'Input slice')
+    by_level = []
+    for level in args.levels:
+        if level == args.level:
+            level_args = args
+        else:
+            level_args = copy.copy(args)
+            level_args.level = level
+        directives = []
+        for filename in args.input_filenames:
+            try:
+                directives.extend(
+                    generate_directives_from_file(
+                        filename, level_args, input_slice,
+                    )
+                )
+            except InputFileError as e:
+                print('Smoketest had a problem with the input file "{0}":'.format(
+                    e.filename
+                ))
+                print(e)
+                sys.exit(1)
+            except PluginError as e:
+                print('Smoketest had a problem with a plugin:')
+                print(e)
+                sys.exit(1)
+        by_level.append(directives)
+    unknown_keys = unknown_element_keys()
+    if unknown_keys:
+        sys.stderr.write(
+            'Smoketest ignored these keys in the input, which nothing looks '
+            'for: {0}\n'.format(', '.join(unknown_keys))
+        )
+    # Interleave the levels, so that they're tested at the same time rather
+    # than one after another
+    return [
+        directive
+        for directives in zip_longest(*by_level)
+        for directive in directives
+        if directive is not None
+    ]
+
+
 def main():
+    # Some modes do something other than run tests
+    if len(sys.argv) > 1 and sys.argv[1] in _MODES:
+        return _MODES[sys.argv[1]](sys.argv[2:])
+
     load_plugins()
     args = parse_args()
 
     if args.output:
         sys.stdout = io.open(args.output, 'w')
 
-    directives = []
-    for filename in args.input_filenames:
+    try:
+        transport = use_transport(args.transport)
+    except TransportUnavailable as e:
+        print(e)
+        sys.exit(1)
+
+    store = None
+    if args.store and not args.dry_run:
+        store = open_result_store(args)
+        if args.diff_against:
+            try:
+                baseline_run_id = store.find_run(args.diff_against)
+            except KeyError as e:
+                print(e.args[0])
+                sys.exit(1)
+        if args.skip_passed_within:
+            store.skip_recently_passed(args.skip_passed_within)
+
+    if args.shard:
         try:
-            directives.extend(generate_directives_from_file(filename, args))
-        except InputFileError as e:
-            print('Smoketest had a problem with the input file "{0}":'.format(
-                e.filename
+            set_sharder(make_sharder(args))
+        except (IOError, ValueError) as e:
+            print('Smoketest had a problem with the shard costs "{0}":'.format(
+                args.shard_costs,
             ))
             print(e)
             sys.exit(1)
 
+    directives = _load_directives(args)
+
+    levels = []
+    if len(args.levels) > 1:
+        levels = [Tally(level) for level in args.levels]
+        tallies = dict((tally.name, tally) for tally in levels)
+        for directive in directives:
+            directive.logger = TallyingLogger(
+                directive.logger,
+                tallies[directive.options.level],
+            )
+
+    verdict_cache = None
+    if args.skip_unchanged:
+        verdict_cache = enable_change_detection()
+
+    connect_to = None
+    connect_to_values = (args.connect_to or []) + get_default_connect_to()
+    # Nodes are connected to through connect-to, with or without mappings
+    if connect_to_values and not args.dry_run or args.nodes:
+        try:
+            connect_to = enable_connect_to(connect_to_values)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+
+    nodes = []
+    n_threads = args.threads
+    if args.nodes:
+        nodes = parse_nodes(args.nodes)
+        directives = fan_out(directives, nodes)
+        # So that all the nodes are tested in the time it takes to test one
+        n_threads *= len(nodes)
+
+    dns_cache = None
+    if args.dns_cache_ttl and not args.dry_run:
+        dns_cache = enable_dns_cache(args.dns_cache_ttl)
+        hosts = [
+            host for host in get_hosts(directives)
+            # No need to look up hosts that are connected to elsewhere
+            if not (nodes or connect_to and connect_to.covers(host))
+        ]
+
+    origins = None
+    # Nodes' connections are their own, so there's nothing to share
+    if args.warm_up_connections and not args.dry_run and not nodes:
+        # Warm connections are only any use if directives share them
+        transport.share_connections(
+            max(args.threads, args.warm_up_connections)
+        )
+        origins = get_origins(directives)
+
+    ssl_context = get_ssl_context()
+
     logger = get_logger(args)
     logger.start()
     failed = True
     for pass_ in range(args.passes):
         if pass_:
-            sleep(args.delay_between_passes)
+            time.sleep(args.delay_between_passes)
         logger.start_pass()
+        for rate_limiter in get_rate_limiters():
+            rate_limiter.reset_stats()
+        retry_count.reset()
+        transport.stats.reset()
+        ssl_context.reset_stats()
+        if store:
+            store.start_pass()
+        if verdict_cache:
+            verdict_cache.reset_stats()
+        if dns_cache:
+            dns_cache.reset_stats()
+            # Resolve up front so no request waits on a slow resolver
+            dns_cache.resolve_all(hosts, n_threads)
+        if origins:
+            start = time.time()
+            warmed_up = transport.warm_up(
+                origins,
+                args.warm_up_connections,
+                args.threads,
+            )
+            logger.add_to_summary(
+                'Time spent warming up connections',
+                time.time() - start,
+            )
+            logger.add_to_summary(
+                'Number of connections warmed up',
+                warmed_up,
+            )
+        for tally in levels + nodes:
+            tally.reset_stats()
         threads, stop_event = get_threads_and_stop_event(
             directives,
-            args.threads,
+            n_threads,
         )
 
         # Start the tests
@@ -163,7 +521,7 @@ def main():
             # keyboard interrupt sometimes results in the program hanging...
             # not sure why.
             while any(alive_threads(threads)):
-                sleep(0.01)
+                time.sleep(0.01)
         except KeyboardInterrupt:
             # Write to console even if output is going to file
             sys.__stdout__.write('\nWaiting for {0} thread{1} to stop...'.format(
@@ -179,6 +537,49 @@ def main():
             sys.__stdout__.flush()
             break
 
+        _summarize_throttling(logger)
+        for label, value in transport.summary().items():
+            logger.add_to_summary(label, value)
+        for level in levels:
+            logger.add_to_summary(
+                'Level {0}'.format(level.name),
+                level.summary(),
+            )
+        for node in nodes:
+            logger.add_to_summary(
+                'Node {0}'.format(node.name),
+                node.summary(),
+            )
+        if ssl_context.handshake_count:
+            logger.add_to_summary(
+                'Number of TLS handshakes',
+                ssl_context.handshake_count,
+            )
+            logger.add_to_summary(
+                'TLS session resumption rate',
+                '{0:.0%}'.format(ssl_context.resumption_rate),
+            )
+        if dns_cache:
+            logger.add_to_summary(
+                'Time spent resolving host names',
+                dns_cache.resolution_time,
+            )
+            logger.add_to_summary(
+                'Number of host name lookups',
+                dns_cache.lookup_count,
+            )
+        if retry_count.value:
+            logger.add_to_summary('Number of retries', retry_count.value)
+        if verdict_cache:
+            logger.add_to_summary(
+                'Number of results reused from unchanged responses',
+                verdict_cache.reused_count,
+            )
+        if store and store.skipped_count:
+            logger.add_to_summary(
+                'Number of URLs skipped for passing recently',
+                store.skipped_count,
+            )
         logger.end_pass()
 
         directives = [d for d in directives if getattr(d, 'failed', True)]
@@ -186,10 +587,267 @@ def main():
             failed = False
             break
 
+    if store:
+        if args.diff_against:
+            regressions, timing_deltas = store.diff(
+                baseline_run_id,
+                args.timing_threshold,
+            )
+            logger.log_diff(baseline_run_id, regressions, timing_deltas)
+            # What matters now is whether anything got worse
+            failed = bool(regressions)
+        if args.save_shard_costs:
+            save_costs(store.unit_costs(), args.save_shard_costs)
+        store.close()
+
     logger.end()
+    for directive in directives:
+        close = getattr(directive, 'close', None)
+        if close:
+            close()
+    transport.close()
 
     sys.exit(1) if failed else sys.exit(0)
 
 
+def parse_merge_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='smoketest merge',
+        description='Merge the JSON output of several shards of a smoketest '
+                    'run into one report',
+    )
+    parser.add_argument(
+        'report_filenames', nargs='+'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        dest='output', default='', type=str,
+        help='Output to file'
+    )
+    return parser.parse_args(argv)
+
+
+def merge(argv):
+    args = parse_merge_args(argv)
+
+    reports = []
+    for filename in args.report_filenames:
+        try:
+            with io.open(filename) as f:
+                reports.append(json.load(f))
+        except (IOError, ValueError) as e:
+            print('Smoketest had a problem with the report "{0}":'.format(
+                filename
+            ))
+            print(e)
+            sys.exit(1)
+
+    if args.output:
+        sys.stdout = io.open(args.output, 'w')
+    merged = merge_json_reports(reports)
+    sys.stdout.write(json.dumps(merged, indent=4, separators=(',', ': ')))
+    sys.stdout.write('\n')
+    sys.stdout.flush()
+
+    # Fail if any shard was still failing on its last pass
+    failed = any(
+        float(report['results'][-1]['summary']['Number of failures']) or
+        float(report['results'][-1]['summary']['Number of errors'])
+        for report in reports
+        if report.get('results')
+    )
+    sys.exit(1) if failed else sys.exit(0)
+
+
+def parse_coordinator_args(argv):
+    parser = get_argument_parser(prog='smoketest coordinator')
+    parser.add_argument(
+        '--listen',
+        dest='listen', default='127.0.0.1:7357',
+        help='Address to listen for workers on, as host:port; '
+             'default: 127.0.0.1:7357'
+    )
+    parser.add_argument(
+        '--lease-size',
+        dest='lease_size', default=20, type=int,
+        help='Number of (URL, platform) pairs to hand a worker at a time; '
+             'default: 20'
+    )
+    parser.add_argument(
+        '--heartbeat-timeout',
+        dest='heartbeat_timeout', default=10.0, type=float,
+        help="Seconds to wait to hear from a worker before handing its "
+             "work to another; default: 10"
+    )
+    args = parse_args(argv, parser)
+    if len(args.levels) > 1:
+        parser.error('Coordinators test one level at a time')
+    try:
+        args.listen = parse_address(args.listen)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def coordinate(argv):
+    load_plugins()
+    args = parse_coordinator_args(argv)
+
+    if args.output:
+        sys.stdout = io.open(args.output, 'w')
+
+    directives = _load_directives(args)
+
+    logger = get_logger(args)
+    coordinator = Coordinator(
+        directives,
+        args,
+        logger,
+        address=args.listen,
+        lease_size=args.lease_size,
+        heartbeat_timeout=args.heartbeat_timeout,
+    )
+    coordinator.start()
+    sys.stderr.write('Waiting for workers on {0}:{1}\n'.format(
+        *coordinator.address
+    ))
+
+    logger.start()
+    failed = True
+    for pass_ in range(args.passes):
+        if pass_:
+            time.sleep(args.delay_between_passes)
+        logger.start_pass()
+        try:
+            coordinator.run_pass()
+        except KeyboardInterrupt:
+            sys.__stdout__.write('\nSmoketest cancelled by user.\n')
+            sys.__stdout__.flush()
+            break
+        if coordinator.released_count:
+            logger.add_to_summary(
+                'Number of leases handed out again',
+                coordinator.released_count,
+            )
+        logger.end_pass()
+        if not coordinator.failed:
+            failed = False
+            break
+
+    coordinator.stop()
+    logger.end()
+    sys.exit(1) if failed else sys.exit(0)
+
+
+def parse_compare_args(argv):
+    from smoketest.comparison import DEFAULT_HEADERS
+    parser = get_argument_parser(prog='smoketest compare')
+    parser.description = (
+        'Fetch every URL on two levels and report the ones whose responses '
+        'differ'
+    )
+    parser.add_argument(
+        '--header',
+        dest='compare_headers', action='append', metavar='NAME',
+        help='Response header to compare; can be used multiple times; '
+             'default: {0}'.format(', '.join(DEFAULT_HEADERS))
+    )
+    parser.add_argument(
+        '--ignore',
+        dest='ignore', action='append', default=[], metavar='SELECTOR',
+        help='Part of a response body to leave out of the comparison: a CSS '
+             'selector for HTML or a dotted path, which can include "*", for '
+             'JSON; can be used multiple times'
+    )
+    args = parse_args(argv, parser)
+    if len(args.levels) != 2:
+        parser.error('Give two levels to compare, like --level=live,stag')
+    return args
+
+
+def compare(argv):
+    # Only compare needs comparison, and it brings lxml.html with it
+    from smoketest.comparison import (
+        DEFAULT_HEADERS,
+        Comparison,
+    )
+    load_plugins()
+    args = parse_compare_args(argv)
+
+    if args.output:
+        sys.stdout = io.open(args.output, 'w')
+
+    first_args = copy.copy(args)
+    first_args.level = args.levels[0]
+    first_args.levels = args.levels[:1]
+    directives = _load_directives(first_args)
+
+    comparison = Comparison(
+        directives,
+        args,
+        headers=args.compare_headers or DEFAULT_HEADERS,
+        ignore=args.ignore,
+    )
+    comparison.run(args.threads)
+    comparison.report(lambda line: sys.stdout.write(line + '\n'))
+    sys.stdout.flush()
+
+    failed = comparison.differences or comparison.errors
+    sys.exit(1) if failed else sys.exit(0)
+
+
+def parse_worker_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='smoketest worker',
+        description='Run tests handed out by a smoketest coordinator',
+    )
+    parser.add_argument(
+        'coordinator',
+        help='Address of the coordinator, as host:port'
+    )
+    parser.add_argument(
+        '-t', '--threads',
+        dest='threads', type=int,
+        help='Number of threads to use; default: the default for the level '
+             'being tested'
+    )
+    parser.add_argument(
+        '--name',
+        dest='name', default=None,
+        help='Name to give the coordinator; default: the host name'
+    )
+    args = parser.parse_args(argv)
+    try:
+        args.coordinator = parse_address(args.coordinator)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def work(argv):
+    load_plugins()
+    args = parse_worker_args(argv)
+    worker = Worker(args.coordinator, threads=args.threads, name=args.name)
+    try:
+        worker.run()
+    except socket.error as e:
+        print('Smoketest could not reach the coordinator at {0}:{1}: {2}'.format(
+            args.coordinator[0], args.coordinator[1], e,
+        ))
+        sys.exit(1)
+    except TransportUnavailable as e:
+        print(e)
+        sys.exit(1)
+    sys.exit(0)
+
+
+_MODES = {
+    'compare': compare,
+    'coordinator': coordinate,
+    'merge': merge,
+    'worker': work,
+}
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,134 @@
+"""Transport adapters for requests, which count what they do and make
+every connection with the process's SSL context.
+
+These live apart from transports so that requests only gets imported by
+runs that make requests with it.
+"""
+import socket
+import ssl
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connectionpool import (
+    HTTPConnectionPool,
+    HTTPSConnectionPool,
+)
+from requests.packages.urllib3.util.connection import is_connection_dropped
+
+from smoketest.tls import get_ssl_context
+
+
+def _counting_pool_class(pool_class, stats):
+    # Pools reconnect the connection objects they keep when the server has
+    # closed them, so count connects rather than connection objects
+    class CountingConnection(pool_class.ConnectionCls):
+        def connect(self):
+            super(CountingConnection, self).connect()
+            stats.add(connections=1)
+
+    class CountingPool(pool_class):
+        ConnectionCls = CountingConnection
+    return CountingPool
+
+
+def _cert_reqs():
+    if get_ssl_context().verify_mode == ssl.CERT_NONE:
+        return 'CERT_NONE'
+    return 'CERT_REQUIRED'
+
+
+class CountingAdapter(HTTPAdapter):
+    """Adapter that counts connections and requests, and makes them all
+    with the process's SSL context.
+
+    Whether certificates are checked, and against what, is up to that
+    context, so the verify argument requests passes along is ignored. Left
+    to requests, a CA path would be loaded again for every new connection.
+    """
+
+    def __init__(self, stats, **kwargs):
+        self._stats = stats
+        super(CountingAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = get_ssl_context()
+        super(CountingAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool_class(HTTPConnectionPool, self._stats),
+            'https': _counting_pool_class(HTTPSConnectionPool, self._stats),
+        }
+
+    def send(self, request, **kwargs):
+        self._stats.add(requests=1)
+        return super(CountingAdapter, self).send(request, **kwargs)
+
+    def build_connection_pool_key_attributes(self, request, verify,
+                                             cert=None):
+        host_params, pool_kwargs = super(
+            CountingAdapter, self,
+        ).build_connection_pool_key_attributes(request, False, cert)
+        pool_kwargs['cert_reqs'] = _cert_reqs()
+        return host_params, pool_kwargs
+
+    def cert_verify(self, conn, url, verify, cert):
+        super(CountingAdapter, self).cert_verify(conn, url, False, cert)
+        conn.cert_reqs = _cert_reqs()
+
+    def get_pool(self, url):
+        # The pool requests would use for the URL
+        try:
+            get_connection_with_tls_context = (
+                self.get_connection_with_tls_context
+            )
+        except AttributeError:
+            pool = self.get_connection(url)
+            self.cert_verify(pool, url, True, None)
+            return pool
+        request = requests.Request('GET', url).prepare()
+        return get_connection_with_tls_context(request, True)
+
+
+def connect(connection):
+    if connection.sock is not None:
+        if not is_connection_dropped(connection):
+            # Still warm from last time
+            return
+        connection.close()
+    try:
+        connection.connect()
+    except Exception:
+        # Left for the requests to report
+        connection.close()
+        return
+    _read_session_tickets(connection)
+
+
+def _read_session_tickets(connection, wait=0.05):
+    # TLS 1.3 servers send session tickets just after the handshake. Unread,
+    # they make an idle connection look like the server has closed it, and it
+    # gets thrown away the first time the pool hands it out.
+    sock = connection.sock
+    if not isinstance(sock, ssl.SSLSocket):
+        return
+    timeout = sock.gettimeout()
+    sock.settimeout(wait)
+    try:
+        sock.recv(1)
+    except (socket.timeout, ssl.SSLError):
+        # Nothing but tickets, if anything
+        return
+    finally:
+        sock.settimeout(timeout)
+    # Either closed or sending things nobody asked for
+    connection.close()
+
+
+class SharedAdapter(CountingAdapter):
+    """Adapter shared by many sessions, which outlives them.
+    """
+
+    def close(self):
+        pass
+
+    def really_close(self):
+        super(SharedAdapter, self).close()
@@ -0,0 +1,86 @@
+"""Getting at response bodies as bytes, and as text without guessing.
+
+requests' response.text guesses the character set of bodies whose
+Content-Type doesn't give one, by running statistical detection over the
+whole body, which is slow on big ones. Here the body is decoded with the
+character set the Content-Type header gives, or for HTML the one a meta tag
+gives, or else UTF-8, and the result is kept for the other tests on the same
+response. Tests that hand the body to a parser that understands bytes, like
+lxml or json, should give it the bytes instead.
+"""
+import codecs
+import re
+import weakref
+
+
+# Browsers look this far into HTML for a meta tag giving a character set
+_META_PRESCAN_BYTES = 1024
+
+_META_CHARSET = re.compile(
+    br'''<meta[^>]+charset\s*=\s*["']?\s*([-\w.:]+)''',
+    re.IGNORECASE,
+)
+
+_CONTENT_TYPE_CHARSET = re.compile(
+    r'''charset\s*=\s*["']?\s*([-\w.:]+)''',
+    re.IGNORECASE,
+)
+
+# Dictionary of response: body as text. Entries go when their responses do.
+_TEXT_CACHE = weakref.WeakKeyDictionary()
+
+
+def get_body_bytes(response):
+    """Return the body of a response as bytes.
+
+    Responses that only have text, like those from distributed workers,
+    have it encoded as UTF-8.
+    """
+    content = getattr(response, 'content', None)
+    if isinstance(content, bytes):
+        return content
+    return response.text.encode('utf-8')
+
+
+def _codec(name):
+    # The name of the codec for a character set, or None if there isn't one
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def get_charset(response):
+    """Return the character set a response says its body is in: the one
+    the Content-Type header gives, or for HTML the one a meta tag near the
+    start of the body gives. None if it doesn't say, or says something
+    there's no codec for.
+    """
+    content_type = response.headers.get('Content-Type') or ''
+    match = _CONTENT_TYPE_CHARSET.search(content_type)
+    if match:
+        return _codec(match.group(1))
+    if 'html' in content_type:
+        match = _META_CHARSET.search(
+            get_body_bytes(response)[:_META_PRESCAN_BYTES]
+        )
+        if match:
+            return _codec(match.group(1).decode('ascii'))
+    return None
+
+
+def get_body_text(response):
+    """Return the body of a response as text, decoded with the character
+    set it says it's in, or UTF-8. Bytes that don't decode are replaced.
+    """
+    try:
+        return _TEXT_CACHE[response]
+    except KeyError:
+        pass
+    content = getattr(response, 'content', None)
+    if isinstance(content, bytes):
+        text = content.decode(get_charset(response) or 'utf-8', 'replace')
+    else:
+        text = response.text
+    _TEXT_CACHE[response] = text
+    return text
@@ -0,0 +1,78 @@
+import threading
+
+from smoketest.utils import (
+    fingerprint_response,
+    uncachebust,
+)
+
+
+class VerdictCache(object):
+    """Remembers test verdicts by response fingerprint, so that tests that
+    only look at a response's body don't need to parse it again when it
+    hasn't changed since the last time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (url, platform name): (fingerprint, {test: (passed, description)})
+        self._verdicts = {}
+        self.reused_count = 0
+
+    def fingerprint(self, response):
+        return fingerprint_response(response)
+
+    def get(self, url, platform, fingerprint):
+        """Return the cached verdicts for the URL on the platform, as a
+        dictionary of test: (passed, description), if the response still has
+        the same fingerprint.
+        """
+        try:
+            cached_fingerprint, verdicts = self._verdicts[
+                (uncachebust(url), platform.name)
+            ]
+        except KeyError:
+            return {}
+        if cached_fingerprint != fingerprint:
+            return {}
+        return verdicts
+
+    def put(self, url, platform, fingerprint, verdicts):
+        key = (uncachebust(url), platform.name)
+        with self._lock:
+            try:
+                cached_fingerprint, cached_verdicts = self._verdicts[key]
+            except KeyError:
+                cached_fingerprint, cached_verdicts = None, {}
+            if cached_fingerprint == fingerprint:
+                cached_verdicts.update(verdicts)
+            else:
+                self._verdicts[key] = (fingerprint, dict(verdicts))
+
+    def count_reuse(self):
+        with self._lock:
+            self.reused_count += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.reused_count = 0
+
+
+# Set by enable_change_detection when the user asks for it
+_VERDICT_CACHE = None
+
+
+def enable_change_detection():
+    global _VERDICT_CACHE
+    _VERDICT_CACHE = VerdictCache()
+    return _VERDICT_CACHE
+
+
+def get_verdict_cache():
+    """Return the verdict cache, or None if change detection is off.
+    """
+    return _VERDICT_CACHE
+
+
+def clear():
+    global _VERDICT_CACHE
+    _VERDICT_CACHE = None
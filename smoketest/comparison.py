@@ -0,0 +1,309 @@
+"""Comparing what two levels serve for the same URLs.
+
+Responses are compared on their status, some of their headers and their
+bodies. Bodies are compared by hash first, which settles most pages. Only
+when the hashes differ are they normalised, with noisy parts taken out, and
+hashed again; only when those differ too is there a diff to show.
+"""
+from collections import OrderedDict
+import copy
+import difflib
+import functools
+import hashlib
+import json
+import re
+import socket
+import threading
+
+import lxml.html
+from lxml.cssselect import (
+    CSSSelector,
+    SelectorError,
+)
+from requests.exceptions import RequestException
+from six import string_types
+
+from smoketest.bodies import get_body_bytes
+from smoketest.directives import (
+    CheckDirective,
+    _SessionError,
+    get_session,
+)
+from smoketest.threads import run_all
+
+
+DEFAULT_HEADERS = ('Content-Type', )
+
+# How many lines of a body diff to show
+MAX_DIFF_LINES = 40
+
+
+def _digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _kind(response):
+    content_type = response.headers.get('Content-Type', '')
+    if 'json' in content_type:
+        return 'json'
+    if 'html' in content_type:
+        return 'html'
+    return 'text'
+
+
+def _drop_json_path(document, path):
+    # "*" matches every key or index at its level
+    if not path:
+        return
+    key, rest = path[0], path[1:]
+    if isinstance(document, dict):
+        keys = list(document) if key == '*' else [key]
+    elif isinstance(document, list):
+        if key == '*':
+            keys = list(range(len(document)))
+        else:
+            try:
+                keys = [int(key)]
+            except ValueError:
+                return
+    else:
+        return
+    for k in reversed(keys):
+        try:
+            if rest:
+                _drop_json_path(document[k], rest)
+            else:
+                del document[k]
+        except (KeyError, IndexError):
+            pass
+
+
+def _json_lines(content, ignore):
+    document = json.loads(content.decode('utf-8'))
+    for selector in ignore:
+        _drop_json_path(document, selector.split('.'))
+    return json.dumps(
+        document, sort_keys=True, indent=1, separators=(',', ': '),
+    ).splitlines()
+
+
+def _squeeze(text):
+    return ' '.join((text or '').split())
+
+
+def compile_css(ignore):
+    """Return CSSSelectors for those of the ignore selectors that are valid
+    CSS. The others can only be meant for JSON, so HTML bodies don't use them.
+    """
+    selectors = []
+    for selector in ignore:
+        try:
+            selectors.append(CSSSelector(selector))
+        except SelectorError:
+            pass
+    return selectors
+
+
+def _html_lines(content, css_ignore):
+    tree = lxml.html.fromstring(content)
+    for selector in css_ignore:
+        for element in selector(tree):
+            if element.getparent() is not None:
+                element.drop_tree()
+    lines = []
+
+    def add(element, depth):
+        if not isinstance(element.tag, string_types):
+            # Comments and processing instructions
+            return
+        attributes = ''.join(
+            ' {0}="{1}"'.format(name, value)
+            for name, value in sorted(element.attrib.items())
+        )
+        lines.append(u'{0}<{1}{2}> {3}'.format(
+            '  ' * depth, element.tag, attributes, _squeeze(element.text),
+        ))
+        for child in element:
+            add(child, depth + 1)
+            tail = _squeeze(child.tail)
+            if tail:
+                lines.append(u'{0}{1}'.format('  ' * (depth + 1), tail))
+
+    add(tree, 0)
+    return lines
+
+
+def normalise(response, ignore=(), css_ignore=None):
+    """Return the lines of a response's body with the parts matched by the
+    ignore selectors taken out: CSS selectors for HTML, dotted paths like
+    those of JSON tests for JSON. HTML comes out one element per line and
+    JSON with its keys sorted, so that only structure and content matter.
+
+    css_ignore is what compile_css returns for ignore, for callers
+    normalising many responses; it's compiled here if not given.
+    """
+    content = get_body_bytes(response)
+    kind = _kind(response)
+    try:
+        if kind == 'json':
+            return _json_lines(content, ignore)
+        if kind == 'html':
+            if css_ignore is None:
+                css_ignore = compile_css(ignore)
+            return _html_lines(content, css_ignore)
+    except (ValueError, lxml.etree.ParserError):
+        # Not what it said it was; compare it as text
+        pass
+    return content.decode('utf-8', 'replace').splitlines()
+
+
+def compare_responses(first, second, headers=DEFAULT_HEADERS, ignore=(),
+                      labels=('first', 'second'), css_ignore=None):
+    """Return a list of lines describing how the responses differ, which is
+    empty if they don't, and whether they only matched after normalising.
+    """
+    differences = []
+    if first.status_code != second.status_code:
+        differences.append('status: {0} != {1}'.format(
+            first.status_code, second.status_code,
+        ))
+    for header in headers:
+        values = (first.headers.get(header), second.headers.get(header))
+        if values[0] != values[1]:
+            differences.append('header {0}: {1} != {2}'.format(
+                header, *values
+            ))
+
+    if _digest(get_body_bytes(first)) == _digest(get_body_bytes(second)):
+        return differences, False
+    if css_ignore is None:
+        css_ignore = compile_css(ignore)
+    lines = (
+        normalise(first, ignore, css_ignore),
+        normalise(second, ignore, css_ignore),
+    )
+    digests = [_digest(u'\n'.join(l).encode('utf-8')) for l in lines]
+    if digests[0] == digests[1]:
+        return differences, True
+    diff = list(difflib.unified_diff(
+        lines[0], lines[1], labels[0], labels[1], n=1, lineterm='',
+    ))
+    differences.append('body:')
+    differences.extend('    ' + line for line in diff[:MAX_DIFF_LINES])
+    if len(diff) > MAX_DIFF_LINES:
+        differences.append('    ... and {0} more lines'.format(
+            len(diff) - MAX_DIFF_LINES,
+        ))
+    return differences, False
+
+
+class Comparison(object):
+    """Fetches the URLs of directives on two levels and compares the
+    responses.
+
+    options has the two levels in options.levels; the directives are the
+    ones for the first level, and their counterparts on the second are made
+    from the same input.
+    """
+
+    def __init__(self, directives, options, headers=DEFAULT_HEADERS,
+                 ignore=()):
+        self.options = options
+        self.headers = headers
+        self.ignore = ignore
+        self._css_ignore = compile_css(ignore)
+        self.levels = options.levels
+        second_options = copy.copy(options)
+        second_options.level = self.levels[1]
+        self._pairs = [
+            (directive, CheckDirective(directive.elem, second_options))
+            for directive in directives
+            if isinstance(directive, CheckDirective)
+        ]
+        self._lock = threading.Lock()
+        # (url, other url, platform name): lines about how they differ
+        self.differences = OrderedDict()
+        self.errors = OrderedDict()
+        self.same_count = 0
+        self.same_after_normalising_count = 0
+
+    def run(self, n_threads):
+        work = []
+        for first, second in self._pairs:
+            work.append(functools.partial(self._compare_pair, first, second))
+        run_all(work, n_threads)
+
+    def _compare_pair(self, first, second):
+        try:
+            for directive in (first, second):
+                directive.session = get_session(
+                    directive.elem, directive.options,
+                )
+        except _SessionError as e:
+            with self._lock:
+                self.errors[(e.url, None, None)] = str(e)
+            return
+        try:
+            for platform in first.platforms:
+                # Levels can be given URLs of their own, so pair them up
+                # by position
+                for url, other_url in zip(first.urls, second.urls):
+                    self._compare_unit(
+                        first, second, url, other_url, platform,
+                    )
+        finally:
+            first.close()
+            second.close()
+
+    def _compare_unit(self, first, second, url, other_url, platform):
+        key = (url, other_url, platform.name)
+        try:
+            responses = [
+                first.get_response(url, platform.headers),
+                second.get_response(other_url, platform.headers),
+            ]
+        except (RequestException, socket.timeout) as e:
+            with self._lock:
+                self.errors[key] = str(e)
+            return
+        differences, normalised = compare_responses(
+            responses[0],
+            responses[1],
+            headers=self.headers,
+            ignore=self.ignore,
+            labels=self.levels,
+            css_ignore=self._css_ignore,
+        )
+        with self._lock:
+            if differences:
+                self.differences[key] = differences
+            else:
+                self.same_count += 1
+                self.same_after_normalising_count += int(normalised)
+
+    def report(self, write):
+        """Write a report of the differences, a line at a time.
+        """
+        write('Comparing {0} with {1}'.format(*self.levels))
+        for (url, other_url, platform), lines in self.differences.items():
+            write('')
+            write('DIFFERENT on {0}: {1} and {2}'.format(
+                platform, url, other_url,
+            ))
+            for line in lines:
+                write('    ' + line)
+        for (url, other_url, platform), error in self.errors.items():
+            write('')
+            write('ERRORED{0}: {1}{2}: {3}'.format(
+                ' on ' + platform if platform else '',
+                url,
+                ' and ' + other_url if other_url else '',
+                re.sub(r'\s+', ' ', error),
+            ))
+        write('')
+        write('Number of URLs the same: {0}'.format(self.same_count))
+        write('Number the same only after normalising: {0}'.format(
+            self.same_after_normalising_count,
+        ))
+        write('Number of URLs different: {0}'.format(len(self.differences)))
+        write('Number of errors: {0}'.format(len(self.errors)))
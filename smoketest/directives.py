@@ -1,36 +1,70 @@
+from collections import OrderedDict
+import copy
 import datetime
+import functools
 import json
 import os
 import re
-import socket
 import sys
+import threading
 from xml.etree import ElementTree
 
-import requests
-from requests.exceptions import RequestException
-import yaml
-
+from smoketest.changes import get_verdict_cache
 from smoketest.loggers import get_logger
-from smoketest.platforms import get_platforms_from_element
+from smoketest.plaintext import (
+    EncodingError,
+    read_lines,
+    slice_range,
+)
+from smoketest.platforms import (
+    Desktop,
+    get_platforms_from_element,
+)
+from smoketest.retries import (
+    get_retry_policy,
+    retry_count,
+)
 from smoketest.settings import (
     get_ca_path,
     get_default_request_timeout,
 )
+from smoketest.sharding import get_sharder
+from smoketest.store import get_result_store
+from smoketest.throttling import get_rate_limiter
+from smoketest.transports import (
+    get_transport,
+    request_errors,
+)
 from smoketest.utils import (
+    get_url_transformer_based_on_options,
     transform_url_based_on_options,
     transform_url,
 )
 from smoketest.tests import (
+    element_keys,
     get_tests_from_element,
-    RedirectTest,
-    StatusTest,
+    ReusedTestResult,
 )
 
 
 SITEMAP_NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
 
+# The element keys directives look for themselves, rather than their tests
+element_keys(
+    'auth_cookie_instructions',
+    'basic_auth_instructions',
+    'directive',
+    'follow_redirects',
+    'only_levels',
+    'platforms',
+    'retry',
+    'timeout',
+    'url',
+    'urls',
+)
+
 
-def _get_single_url(elem, options):
+def _get_single_url(elem, options, transform):
     do_transforms = True
     # If given a choice of URLs, pick based on level.
     try:
@@ -46,20 +80,19 @@ def _get_single_url(elem, options):
         url = elem
 
     if do_transforms:
-        url = transform_url_based_on_options(url, options)
+        url = transform(url)
     return url
 
 
 def get_urls_from_element(elem, options):
-    urls = []
+    transform = get_url_transformer_based_on_options(options)
     try:
         # User gives list of urls
-        for x in elem['urls']:
-            urls.append(_get_single_url(x, options))
+        elems = elem['urls']
     except KeyError:
         # User gives one url
-        urls.append(_get_single_url(elem['url'], options))
-    return urls
+        elems = [elem['url']]
+    return [_get_single_url(x, options, transform) for x in elems]
 
 
 class _SessionError(Exception):
@@ -92,24 +125,29 @@ class _DummyResponse(object):
         self.headers = {}
         self.request = _DummyRequest()
         self.text = ''
+        self.content = b''
 
 
-def get_session(elem, options):
+def get_session(elem, options, private=False):
     if options.dry_run:
         return _DummySession()
 
-    session = requests.Session()
+    basic_auth_instructions = elem.get('basic_auth_instructions')
+    auth_cookie_instructions = elem.get('auth_cookie_instructions')
+    session = get_transport().new_session(
+        private=bool(
+            private or basic_auth_instructions or auth_cookie_instructions
+        ),
+    )
     if options.user_agent:
         session.headers['User-Agent'] = options.user_agent
 
-    basic_auth_instructions = elem.get('basic_auth_instructions')
     if basic_auth_instructions:
         session.auth = (
             basic_auth_instructions['username'],
             basic_auth_instructions['password'],
         )
 
-    auth_cookie_instructions = elem.get('auth_cookie_instructions')
     if auth_cookie_instructions:
         url = transform_url_based_on_options(
             auth_cookie_instructions['url'],
@@ -140,6 +178,32 @@ class CheckDirective(object):
     options (argparse.Namespace): The parsed command line arguments
     """
 
+    # A list of URLs makes one of these per line, so no per-instance
+    # __dict__ for the attributes every directive has. There's still one for
+    # plugins and tests that want to hang something else on a directive; it
+    # only gets made if they do.
+    __slots__ = (
+        'options',
+        'elem',
+        'timeout',
+        'urls',
+        'tests',
+        'logger',
+        'platforms',
+        'follow_redirects',
+        'retry_policy',
+        'session',
+        'private_session',
+        'finished',
+        'failed',
+        '_lock',
+        '_rerun',
+        '_failures',
+        '_retries',
+        '_outstanding_retries',
+        '__dict__',
+    )
+
     def __init__(self, elem, options):
         self.options = options
         self.elem = elem
@@ -151,12 +215,25 @@ class CheckDirective(object):
         self.follow_redirects = elem.get(
             'follow_redirects', False
         )
+        self.retry_policy = get_retry_policy(elem, options)
+        self.session = None
+        # Whether to keep connections to itself instead of sharing them with
+        # other directives
+        self.private_session = False
+        self.finished = False
+        # (url, platform, tests) to run on the next pass; None means
+        # everything, and tests of None means all of them
+        self._rerun = None
 
     def get_response(self, url, extra_headers):
         if self.options.dry_run:
             response = _DummyResponse()
             return response
 
+        rate_limiter = get_rate_limiter(self.options.level)
+        if rate_limiter:
+            rate_limiter.wait(url)
+
         response = self.session.get(
             url,
             verify=get_ca_path(),
@@ -167,48 +244,193 @@ class CheckDirective(object):
         return response
 
     def run(self):
-        try:
-            self.session = get_session(self.elem, self.options)
-        except _SessionError as e:
-            # This probably means some credentials were bad or a login URL is
-            # unavailable. Just log the error and use a dumb session instead.
-            self.logger.log_error(e.url, e, None)
-            self.session = requests.Session()
+        """Run the tests against the URLs on the platforms.
+
+        The first time through, that means all of them. After that only the
+        (url, platform) pairs that failed are fetched again, and only the
+        tests that failed on them are run; the tests that passed keep their
+        results from before.
+
+        Returns a list of (delay, callable) pairs for requests that hit a
+        transient problem and should be retried later.
+        """
+        if self.session is None:
+            try:
+                self.session = get_session(
+                    self.elem,
+                    self.options,
+                    private=self.private_session,
+                )
+            except _SessionError as e:
+                # This probably means some credentials were bad or a login URL
+                # is unavailable. Just log the error and use a dumb session
+                # instead.
+                self.logger.log_error(e.url, e, None)
+                self.session = get_transport().new_session(
+                    private=self.private_session,
+                )
 
+        # Made here rather than in __init__, so that directives still waiting
+        # their turn don't each hold one
+        self._lock = threading.Lock()
         self.failed = False
-        # Use a set for de-duplication
-        failed_urls_ = set()
-        for platform in self.platforms:
-            # Union time
-            failed_urls_ |= self._run_for_platform(platform)
+        self.finished = False
+        self._failures = OrderedDict()
+        self._retries = []
+        self._outstanding_retries = 0
+        if self._rerun is None:
+            for platform in self.platforms:
+                self._run_for_platform(platform)
+        else:
+            store = get_result_store()
+            for url, platform, tests in self._rerun:
+                # Units picked out by keep_units or only_run haven't been
+                # run yet, so they can be skipped for passing recently
+                if (
+                    tests is None and store and
+                    store.should_skip(url, platform)
+                ):
+                    continue
+                self._run_unit(url, platform, tests)
+        return self._finish(0)
+
+    def keep_units(self, keep):
+        """Only run the (url, platform) pairs for which keep(url, platform)
+        is true. Returns whether there's anything left to run.
+        """
+        return self.only_run([
+            (url, platform)
+            for platform in self.platforms
+            for url in self.urls
+            if keep(url, platform)
+        ])
+
+    def only_run(self, units):
+        """Only run the given (url, platform) pairs. Returns whether there's
+        anything to run.
+        """
+        self._rerun = [(url, platform, None) for url, platform in units]
+        self.urls = list(OrderedDict.fromkeys(url for url, _ in units))
+        return bool(self._rerun)
+
+    def copy(self):
+        """Return a directive with the same URLs and tests but a session and
+        results of its own, to run alongside this one.
+        """
+        directive = copy.copy(self)
+        directive.session = None
+        directive.finished = False
+        return directive
 
-        # Set urls to a list of only failed URLs in case passes > 1
-        self.urls = list(failed_urls_)
-        self.session.close()
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
 
     def _run_for_platform(self, platform):
-        extra_headers = platform.headers
-        # Use a set for de-duplication
-        failed_urls = set()
+        store = get_result_store()
         for url in self.urls:
-            try:
-                response = self.get_response(url, extra_headers)
-            except (RequestException, socket.timeout) as e:
-                self.logger.log_error(url, e, platform)
-                failed_urls.add(url)
-                self.failed = True
+            if store and store.should_skip(url, platform):
                 continue
+            self._run_unit(url, platform)
 
-            for test in self.tests:
-                if self.options.dry_run:
-                    result = test.get_always_passing_result(response)
-                else:
-                    result = test.get_result(response)
-                self.logger.log_test_result(url, test, result, response, platform, self.follow_redirects)
-                if not result:
-                    failed_urls.add(url)
-                    self.failed = True
-        return failed_urls
+    def _run_unit(self, url, platform, tests=None, attempt=1):
+        """Fetch one URL on one platform and run tests against the response,
+        all of them unless told which.
+
+        Returns True if the tests passed and False if any failed. If the
+        request hit a problem the retry policy considers transient, a retry
+        gets scheduled instead and None is returned.
+        """
+        if tests is None:
+            tests = self.tests
+        store = get_result_store()
+        try:
+            response = self.get_response(url, platform.headers)
+        except request_errors() as e:
+            if self.retry_policy.should_retry_error(e, attempt):
+                self._schedule_retry(url, platform, tests, attempt)
+                return None
+            self.logger.log_error(url, e, platform)
+            if store:
+                store.record_error(url, platform, e)
+            self._record_failure(url, platform, tests)
+            return False
+
+        if self.retry_policy.should_retry_response(response, attempt):
+            self._schedule_retry(url, platform, tests, attempt)
+            return None
+
+        verdict_cache = get_verdict_cache()
+        if verdict_cache and not self.options.dry_run:
+            fingerprint = verdict_cache.fingerprint(response)
+            cached_verdicts = verdict_cache.get(url, platform, fingerprint)
+            new_verdicts = {}
+        else:
+            verdict_cache = None
+
+        failed_tests = []
+        for test in tests:
+            if self.options.dry_run:
+                result = test.get_always_passing_result(response)
+            elif verdict_cache and test in cached_verdicts:
+                result = ReusedTestResult(
+                    test, response, *cached_verdicts[test]
+                )
+                verdict_cache.count_reuse()
+            else:
+                result = test.get_result(response)
+            passed = bool(result)
+            if verdict_cache and test.reusable:
+                new_verdicts[test] = (passed, result.description)
+            self.logger.log_test_result(url, test, result, response, platform, self.follow_redirects)
+            if store:
+                store.record_result(url, platform, test, result, response)
+            if not passed:
+                failed_tests.append(test)
+        if verdict_cache:
+            verdict_cache.put(url, platform, fingerprint, new_verdicts)
+        if failed_tests:
+            self._record_failure(url, platform, failed_tests)
+            return False
+        return True
+
+    def _record_failure(self, url, platform, tests):
+        with self._lock:
+            self.failed = True
+            self._failures[(url, platform.name)] = (url, platform, tests)
+
+    def _schedule_retry(self, url, platform, tests, attempt):
+        retry_count.increment()
+        retry = functools.partial(
+            self._retry, url, platform, tests, attempt + 1
+        )
+        with self._lock:
+            self._retries.append((self.retry_policy.get_delay(attempt), retry))
+
+    def _retry(self, url, platform, tests, attempt):
+        self._run_unit(url, platform, tests, attempt)
+        return self._finish(1)
+
+    def _finish(self, n_retries_done):
+        """Hand over newly scheduled retries, and wrap up the pass once no
+        retries are left outstanding.
+        """
+        with self._lock:
+            retries, self._retries = self._retries, []
+            self._outstanding_retries += len(retries) - n_retries_done
+            finished = not self._outstanding_retries
+        if finished:
+            self.finished = True
+            # Only what failed needs to run again in case passes > 1. Hang on
+            # to the session for that.
+            self._rerun = list(self._failures.values())
+            self.urls = list(OrderedDict.fromkeys(
+                url for url, _, _ in self._rerun
+            ))
+            if not self.failed:
+                self.close()
+        return retries
 
     @property
     def directives(self):
@@ -233,8 +455,8 @@ class IncludeDirective(object):
         return generate_directives_from_file(self.filename, self.options)
 
 
-def generate_directives_from_file(filename, options):
-    return FileParser(filename, options).generate_directives()
+def generate_directives_from_file(filename, options, input_slice=None):
+    return FileParser(filename, options, input_slice).generate_directives()
 
 
 class InputFileError(Exception):
@@ -263,25 +485,36 @@ class FileParser(object):
         'include': IncludeDirective,
     }
 
-    def __init__(self, filename, options):
+    def __init__(self, filename, options, input_slice=None):
+        """input_slice is (index, count) to read only slice index of count of
+        a plain text file, split up by bytes.
+        """
         self.filename = filename
         self.options = options
+        self.input_slice = input_slice
 
     def generate_directives(self):
-        # protect against circular references
-        if self.filename in self._visited_files:
+        # protect against circular references. Files are expanded once for
+        # every level being tested.
+        key = (getattr(self.options, 'level', None), self.filename)
+        if key in self._visited_files:
             message = "Skipping {0}, someone's already done that".format(
                 self.filename
             )
             sys.stderr.write(message)
             sys.stderr.flush()
             return []
-        self._visited_files.add(self.filename)
+        self._visited_files.add(key)
 
         # dispatch on type
         parts = self.filename.rpartition('.')
         if parts[0]:
             filetype = parts[-1]
+            if self.input_slice and filetype in ['json', 'yaml', 'yml', 'xml']:
+                raise InputFileError(
+                    self.filename,
+                    'Only plain text files can be read a slice at a time',
+                )
             if filetype in ['json', 'yaml', 'yml']:
                 return self._generate_directives_from_json_or_yaml()
             elif filetype == 'xml':
@@ -302,6 +535,7 @@ class FileParser(object):
                         # This happens if the JSON was invalid.
                         raise InputFileError(self.filename, str(e))
                 else:
+                    import yaml
                     try:
                         input_ = yaml.safe_load(file_)
                     except yaml.error.YAMLError as e:
@@ -311,6 +545,7 @@ class FileParser(object):
             raise InputFileError(self.filename, str(e))
 
         # Parse input
+        sharder = get_sharder()
         directives = []
         for elem in input_:
             try:
@@ -338,7 +573,14 @@ class FileParser(object):
             if directive_type is IncludeDirective:
                 self._absolutize_element_filename(elem)
 
-            directive = directive_type(elem, self.options)
+            try:
+                directive = directive_type(elem, self.options)
+            except ValueError as e:
+                # Something in the element has a value that makes no sense
+                raise InputFileError(self.filename, str(e))
+            if directive_type is CheckDirective and sharder:
+                if not directive.keep_units(sharder.owns):
+                    continue
             directives += directive.directives
 
         for directive in directives:
@@ -360,12 +602,13 @@ class FileParser(object):
                 raise InputFileError(self.filename, str(e))
         else:
             # Fetch remote sitemap and parse it
+            import requests
             url = self.filename
             response = requests.get(url)
             if response.status_code != 200:
                 raise InputFileError(self.filename, 'URL returned {} response'.format(response.status_code))
             try:
-                root = ElementTree.fromstring(response.text)
+                root = ElementTree.fromstring(response.content)
             except ElementTree.ParseError as e:
                 raise InputFileError(self.filename, 'Could not parse response to XML. Error: {0}'.format(str(e)))
 
@@ -393,6 +636,8 @@ class FileParser(object):
         for loc in root.iterfind('./ns:sitemap/ns:loc', {
             'ns': SITEMAP_NAMESPACE
         }):
+            if not self._owns_url(loc.text):
+                continue
             elem = {
                 'directive': 'check',
                 'follow_redirects': False,
@@ -423,6 +668,8 @@ class FileParser(object):
         for loc in root.iterfind('./ns:url/ns:loc', {
             'ns': SITEMAP_NAMESPACE
         }):
+            if not self._owns_url(loc.text):
+                continue
             elem = {
                 'directive': 'check',
                 'follow_redirects': False,
@@ -438,13 +685,26 @@ class FileParser(object):
     def _generate_directives_from_dumb_list(self):
         directives = []
         try:
-            with open(self.filename, 'r') as f:
-                for line in f:
+            if self.input_slice:
+                start, end = slice_range(self.filename, *self.input_slice)
+            else:
+                start, end = 0, None
+            for status, url, redirect_to, include, line in read_lines(
+                    self.filename, start, end):
+                if url:
+                    directive = self._get_directive_from_dumb_list_parts(
+                        status, url, redirect_to,
+                    )
+                elif include:
+                    directive = self._get_include_directive(include)
+                else:
+                    # Something read_lines couldn't make sense of; see what
+                    # the slow way makes of it
                     directive = self._get_directive_from_dumb_list_line(line)
-                    if directive:
-                        directives.extend(directive.directives)
-        except IOError as e:
-            # This happens if the file doesn't exist.
+                if directive:
+                    directives.extend(directive.directives)
+        except (IOError, OSError, EncodingError) as e:
+            # This happens if the file doesn't exist, or isn't UTF-8.
             raise InputFileError(self.filename, str(e))
 
         for directive in directives:
@@ -471,38 +731,57 @@ class FileParser(object):
             else:
                 status = '200'
                 url = cleaned
-
-            # Accommodate lines like:
-            # 30X_live http://premium.usnews.com/best-colleges/myfit
-            # If we're testing against live, use the status given, otherwise 200.
-            if status.endswith('_live'):
-                if self.options.level == 'live':
-                    status = status.replace('_live', '')
-                else:
-                    status = '200'
-
-            elem = {"url": url}
-            directive = CheckDirective(elem, self.options)
-            if redirect_to:
-                transformed_redirect_to = transform_url(
-                    redirect_to,
-                    scheme=self.options.scheme,
-                    port=self.options.port,
-                    level=self.options.level,
-                    cachebust=False,
-                )
-                directive.tests = [RedirectTest(status, transformed_redirect_to, False)]
-            else:
-                directive.tests = [StatusTest(status)]
-            return directive
+            return self._get_directive_from_dumb_list_parts(
+                status, url, redirect_to,
+            )
 
         # Accommodate lines like:
         # #include static.txt
         elif line.startswith('#include'):
-            elem = {"filename": line.split()[1]}
-            self._absolutize_element_filename(elem)
-            directive = IncludeDirective(elem, self.options)
-            return directive
+            return self._get_include_directive(line.split()[1])
+
+    def _get_directive_from_dumb_list_parts(self, status, url, redirect_to):
+        # Accommodate lines like:
+        # 30X_live http://premium.usnews.com/best-colleges/myfit
+        # If we're testing against live, use the status given, otherwise 200.
+        if status.endswith('_live'):
+            if self.options.level == 'live':
+                status = status.replace('_live', '')
+            else:
+                status = '200'
+
+        if not self._owns_url(url):
+            return None
+
+        # Spell the test out in the element, same as JSON or YAML input
+        # would, so the element alone describes the directive.
+        elem = {"url": url}
+        if redirect_to:
+            elem['redirect'] = {'status': status, 'location': redirect_to}
+        else:
+            elem['status'] = status
+        return CheckDirective(elem, self.options)
+
+    def _get_include_directive(self, filename):
+        elem = {"filename": filename}
+        self._absolutize_element_filename(elem)
+        return IncludeDirective(elem, self.options)
+
+    def _owns_url(self, url):
+        # Whether this shard tests the URL, for inputs that can only give a
+        # single URL on desktop. Figuring that out before making a directive
+        # saves parsing tests for URLs another shard will handle.
+        sharder = get_sharder()
+        if sharder is None:
+            return True
+        url = transform_url(
+            url,
+            scheme=self.options.scheme,
+            port=self.options.port,
+            level=self.options.level,
+            cachebust=False,
+        )
+        return sharder.owns(url, Desktop)
 
     def _absolutize_element_filename(self, elem):
         if elem['filename'].startswith('http'):
@@ -0,0 +1,576 @@
+"""Running one smoketest across several machines.
+
+A coordinator parses the input and hands out leases, small batches of
+(url, platform) units, to workers that connect to it over TCP. Workers run
+the tests and send back their results, which the coordinator logs as if it
+had run them itself. Workers send heartbeats; if one goes quiet or hangs up,
+its unfinished leases go to someone else.
+
+Messages are JSON objects, one per line, with a "type" key:
+
+    worker -> coordinator: hello, ready, heartbeat, result
+    coordinator -> worker: setup, lease, done
+"""
+from collections import (
+    OrderedDict,
+    deque,
+)
+import argparse
+import datetime
+import itertools
+import json
+import socket
+import threading
+import time
+
+from smoketest.bodies import get_body_text
+from smoketest.changes import enable_change_detection
+from smoketest.directives import CheckDirective
+from smoketest.loggers import _calculate_hops
+from smoketest.resolver import (
+    enable_connect_to,
+    enable_dns_cache,
+)
+from smoketest.settings import (
+    get_default_connect_to,
+    get_default_threads,
+)
+from smoketest.threads import (
+    WorkQueue,
+    _get_runner,
+)
+from smoketest.transports import use_transport
+
+
+def parse_address(value):
+    """Parse "host:port" into a (host, port) pair.
+    """
+    host, _, port = value.rpartition(':')
+    try:
+        return host or '127.0.0.1', int(port)
+    except ValueError:
+        raise ValueError('Address should look like host:1234, not {0}'.format(
+            value,
+        ))
+
+
+class _Connection(object):
+    """One end of a socket that carries JSON messages, one per line.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._file = sock.makefile('rb')
+        self._send_lock = threading.Lock()
+
+    def send(self, message):
+        data = (json.dumps(message) + '\n').encode('utf-8')
+        with self._send_lock:
+            self.sock.sendall(data)
+
+    def messages(self):
+        """Yield messages until the other end hangs up.
+        """
+        while True:
+            try:
+                line = self._file.readline()
+            except (socket.error, ValueError):
+                # ValueError comes from reading a file that's been closed
+                return
+            if not line:
+                return
+            yield json.loads(line.decode('utf-8'))
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
+
+# Stand-ins for the test, result, and response a worker logged, so the
+# coordinator's logger can log them the same way.
+
+class _RemoteTest(object):
+
+    def __init__(self, description):
+        self.description = description
+
+
+class _RemoteTestResult(object):
+
+    def __init__(self, passed, description):
+        self.passed = passed
+        self.description = description
+
+    def __bool__(self):
+        return self.passed
+
+    __nonzero__ = __bool__
+
+
+class _RemoteRequest(object):
+
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class _RemoteResponse(object):
+
+    def __init__(self, data):
+        self.elapsed = datetime.timedelta(seconds=data['elapsed'])
+        self.status_code = data['status_code']
+        # Hops were counted on the worker
+        self.is_redirect = False
+        self.history = [None] * data['hops']
+        self.headers = data['response_headers']
+        self.request = _RemoteRequest(data['request_headers'])
+        self.text = data['body']
+
+
+class _WorkerState(object):
+    """What the coordinator knows about a connected worker.
+    """
+
+    def __init__(self, connection, address):
+        self.connection = connection
+        self.name = '{0}:{1}'.format(*address[:2])
+        self.last_seen = time.time()
+        # Number of leases the worker has room for
+        self.wants = 0
+        self.lease_ids = set()
+        # Directives whose elements the worker already has
+        self.directive_ids = set()
+        self.alive = True
+
+
+class Coordinator(object):
+    """Hands out the units of some directives to workers, and logs the
+    results they send back.
+
+    Each directive's units are split into leases of up to `lease_size`
+    units. A worker that doesn't send anything for `heartbeat_timeout`
+    seconds is given up on, and its leases are handed out again.
+    """
+
+    def __init__(self, directives, options, logger, address=('127.0.0.1', 0),
+                 lease_size=20, heartbeat_timeout=10.0):
+        self.directives = [d for d in directives if hasattr(d, 'elem')]
+        self.options = options
+        self.logger = logger
+        self.lease_size = lease_size
+        self.heartbeat_timeout = heartbeat_timeout
+        self.failed = False
+        self.released_count = 0
+
+        self._lock = threading.Lock()
+        self._pass_done = threading.Event()
+        self._stopped = threading.Event()
+        self._workers = []
+        self._pending = deque()
+        # lease ID: (worker, lease)
+        self._leased = {}
+        self._lease_ids = itertools.count(1)
+        self._outstanding = 0
+        # directive ID: list of (url, platform) to run next pass, where None
+        # means everything
+        self._units = dict((i, None) for i in range(len(self.directives)))
+        self._failures = OrderedDict()
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(address)
+        self._server.listen(16)
+        self.address = self._server.getsockname()
+
+    def start(self):
+        for target in (self._accept, self._watch_heartbeats):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """Tell the workers there's nothing more to do, and stop listening.
+        """
+        self._stopped.set()
+        with self._lock:
+            workers = [w for w in self._workers if w.alive]
+        for worker in workers:
+            try:
+                worker.connection.send({'type': 'done'})
+            except socket.error:
+                pass
+        self._server.close()
+
+    def run_pass(self, stop_event=None):
+        """Hand out everything there is to run this pass, and wait for the
+        results to come back. Returns False if stopped before that.
+        """
+        with self._lock:
+            self.failed = False
+            self.released_count = 0
+            self._failures = OrderedDict()
+            leases = self._make_leases()
+            self._outstanding = len(leases)
+            if not leases:
+                return True
+            self._pass_done.clear()
+            self._pending.extend(leases)
+            self._dispatch()
+
+        while not self._pass_done.wait(0.1):
+            if stop_event is not None and stop_event.is_set():
+                return False
+
+        # Only what failed needs to run again in case passes > 1
+        self._units = dict(
+            (i, list(units.values())) for i, units in self._failures.items()
+        )
+        return True
+
+    def _make_leases(self):
+        leases = []
+        entries = []
+        n_units = 0
+        for directive_id, directive in enumerate(self.directives):
+            units = self._units.get(directive_id, [])
+            if units is None:
+                units = [
+                    (url, platform)
+                    for platform in directive.platforms
+                    for url in directive.urls
+                ]
+            for start in range(0, len(units), self.lease_size):
+                chunk = units[start:start + self.lease_size]
+                if n_units + len(chunk) > self.lease_size and entries:
+                    leases.append(self._new_lease(entries))
+                    entries = []
+                    n_units = 0
+                entries.append({
+                    'directive': directive_id,
+                    'units': [[url, p.name] for url, p in chunk],
+                })
+                n_units += len(chunk)
+        if entries:
+            leases.append(self._new_lease(entries))
+        return leases
+
+    def _new_lease(self, entries):
+        return {'type': 'lease', 'id': next(self._lease_ids), 'entries': entries}
+
+    def _dispatch(self):
+        # Give pending leases to workers with room for them. Call with the
+        # lock held.
+        for worker in self._workers:
+            while worker.alive and worker.wants and self._pending:
+                lease = self._pending.popleft()
+                message = dict(lease, entries=[])
+                for entry in lease['entries']:
+                    entry = dict(entry)
+                    directive_id = entry['directive']
+                    if directive_id not in worker.directive_ids:
+                        entry['elem'] = self.directives[directive_id].elem
+                        worker.directive_ids.add(directive_id)
+                    message['entries'].append(entry)
+                try:
+                    worker.connection.send(message)
+                except socket.error:
+                    self._pending.appendleft(lease)
+                    self._drop(worker)
+                    break
+                worker.wants -= 1
+                worker.lease_ids.add(lease['id'])
+                self._leased[lease['id']] = (worker, lease)
+
+    def _drop(self, worker):
+        # Give up on a worker, and hand its leases to someone else. Call with
+        # the lock held.
+        if not worker.alive:
+            return
+        worker.alive = False
+        worker.connection.close()
+        for lease_id in sorted(worker.lease_ids, reverse=True):
+            _, lease = self._leased.pop(lease_id)
+            self._pending.appendleft(lease)
+            self.released_count += 1
+        worker.lease_ids.clear()
+        self._dispatch()
+
+    def _accept(self):
+        while not self._stopped.is_set():
+            try:
+                sock, address = self._server.accept()
+            except socket.error:
+                # The server socket was closed by stop
+                return
+            worker = _WorkerState(_Connection(sock), address)
+            with self._lock:
+                self._workers.append(worker)
+            thread = threading.Thread(target=self._serve, args=(worker, ))
+            thread.daemon = True
+            thread.start()
+
+    def _watch_heartbeats(self):
+        while not self._stopped.wait(self.heartbeat_timeout / 4.0):
+            cutoff = time.time() - self.heartbeat_timeout
+            with self._lock:
+                for worker in self._workers:
+                    if worker.alive and worker.last_seen < cutoff:
+                        self._drop(worker)
+
+    def _serve(self, worker):
+        try:
+            for message in worker.connection.messages():
+                worker.last_seen = time.time()
+                kind = message.get('type')
+                if kind == 'hello':
+                    worker.name = message.get('name') or worker.name
+                    worker.connection.send({
+                        'type': 'setup',
+                        'options': vars(self.options),
+                    })
+                elif kind == 'ready':
+                    with self._lock:
+                        worker.wants += message.get('n', 1)
+                        self._dispatch()
+                elif kind == 'result':
+                    self._finish_lease(worker, message)
+        except socket.error:
+            pass
+        with self._lock:
+            self._drop(worker)
+
+    def _finish_lease(self, worker, message):
+        with self._lock:
+            lease_id = message['lease']
+            if lease_id not in worker.lease_ids:
+                # Already handed to someone else after this worker went quiet
+                return
+            worker.lease_ids.remove(lease_id)
+            _, lease = self._leased.pop(lease_id)
+
+        for entry, results in zip(lease['entries'], message['results']):
+            self._log_results(entry['directive'], results)
+
+        with self._lock:
+            self._outstanding -= 1
+            if not self._outstanding:
+                self._pass_done.set()
+
+    def _log_results(self, directive_id, results):
+        directive = self.directives[directive_id]
+        platforms = dict((p.name, p) for p in directive.platforms)
+        for data in results:
+            platform = platforms.get(data['platform'])
+            if 'error' in data:
+                self.logger.log_error(data['url'], data['error'], platform)
+                passed = False
+            else:
+                passed = data['passed']
+                self.logger.log_test_result(
+                    data['url'],
+                    _RemoteTest(data['test']),
+                    _RemoteTestResult(passed, data['result']),
+                    _RemoteResponse(data),
+                    platform,
+                    directive.follow_redirects,
+                )
+            if not passed and platform is not None:
+                with self._lock:
+                    self.failed = True
+                    failures = self._failures.setdefault(
+                        directive_id, OrderedDict(),
+                    )
+                    failures[(data['url'], platform.name)] = (
+                        data['url'], platform,
+                    )
+
+
+class _ResultCollector(object):
+    """Logger for a directive run by a worker, which keeps results to send
+    back to the coordinator instead of logging them.
+    """
+
+    def __init__(self, verbosity):
+        self.verbosity = verbosity or 0
+        self.results = []
+        self._lock = threading.Lock()
+
+    def _add(self, url, platform, data):
+        data.update(url=url, platform=platform.name if platform else None)
+        with self._lock:
+            self.results.append(data)
+
+    def log_test_result(self, url, test, result, response, platform, follow_redirects):
+        self._add(url, platform, {
+            'test': test.description,
+            'passed': bool(result),
+            'result': result.description,
+            'elapsed': response.elapsed.total_seconds(),
+            'status_code': response.status_code,
+            'hops': _calculate_hops(response, follow_redirects),
+            'request_headers': dict(response.request.headers),
+            'response_headers': dict(response.headers),
+            # Bodies are big, so only send them if they're going to be logged
+            'body': get_body_text(response) if self.verbosity >= 4 else '',
+        })
+
+    def log_error(self, url, error, platform):
+        self._add(url, platform, {'error': str(error)})
+
+
+class _Lease(object):
+    """The directives a worker runs for one lease.
+    """
+
+    def __init__(self, lease_id, directives, verbosity):
+        self.id = lease_id
+        self.directives = directives
+        self._lock = threading.Lock()
+        self._finished = set()
+        for directive in directives:
+            directive.logger = _ResultCollector(verbosity)
+
+    def wrap(self, directive, work, on_finished):
+        """Wrap a piece of the directive's work so that on_finished gets
+        called once every directive of the lease is done.
+        """
+        def wrapped():
+            more_work = work() or ()
+            if directive.finished:
+                with self._lock:
+                    newly_finished = id(directive) not in self._finished
+                    self._finished.add(id(directive))
+                    finished = newly_finished and (
+                        len(self._finished) == len(self.directives)
+                    )
+                if finished:
+                    on_finished(self)
+            return [
+                (delay, self.wrap(directive, w, on_finished))
+                for delay, w in more_work
+            ]
+        return wrapped
+
+    def results(self):
+        return [d.logger.results for d in self.directives]
+
+
+class Worker(object):
+    """Connects to a coordinator and runs the leases it hands out, on
+    `threads` threads, until it's told there's nothing left.
+    """
+
+    def __init__(self, address, threads=None, name=None,
+                 heartbeat_interval=1.0):
+        self.address = address
+        self.threads = threads
+        self.name = name or socket.gethostname()
+        self.heartbeat_interval = heartbeat_interval
+        self.leases_run = 0
+        self._elems = {}
+        self._directives = {}
+
+    def run(self):
+        connection = _Connection(socket.create_connection(self.address))
+        self._connection = connection
+        messages = connection.messages()
+        connection.send({'type': 'hello', 'name': self.name})
+        try:
+            setup = next(messages)
+        except StopIteration:
+            connection.close()
+            return
+        self.options = argparse.Namespace(**setup['options'])
+        n_threads = self.threads or get_default_threads(self.options.level)
+        if getattr(self.options, 'skip_unchanged', False):
+            enable_change_detection()
+        if getattr(self.options, 'dns_cache_ttl', None):
+            enable_dns_cache(self.options.dns_cache_ttl)
+        connect_to = (
+            (getattr(self.options, 'connect_to', None) or []) +
+            get_default_connect_to()
+        )
+        if connect_to:
+            enable_connect_to(connect_to)
+        transport = use_transport(
+            getattr(self.options, 'transport', 'requests'),
+        )
+
+        self._queue = WorkQueue()
+        self._queue.hold_open()
+        stop_event = threading.Event()
+        threads = [
+            threading.Thread(target=_get_runner(self._queue, stop_event))
+            for _ in range(n_threads)
+        ]
+        threads.append(threading.Thread(
+            target=self._send_heartbeats, args=(stop_event, ),
+        ))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            connection.send({'type': 'ready', 'n': n_threads})
+            for message in messages:
+                if message['type'] == 'lease':
+                    self._start_lease(message)
+                elif message['type'] == 'done':
+                    break
+        finally:
+            stop_event.set()
+            self._queue.close()
+            for thread in threads:
+                thread.join()
+            for directive in self._directives.values():
+                directive.close()
+            transport.close()
+            connection.close()
+
+    def _send_heartbeats(self, stop_event):
+        while not stop_event.wait(self.heartbeat_interval):
+            try:
+                self._connection.send({'type': 'heartbeat'})
+            except socket.error:
+                return
+
+    def _get_directive(self, directive_id):
+        try:
+            return self._directives[directive_id]
+        except KeyError:
+            directive = CheckDirective(self._elems[directive_id], self.options)
+            self._directives[directive_id] = directive
+            return directive
+
+    def _start_lease(self, message):
+        directives = []
+        for entry in message['entries']:
+            if 'elem' in entry:
+                self._elems[entry['directive']] = entry['elem']
+            directive = self._get_directive(entry['directive']).copy()
+            platforms = dict((p.name, p) for p in directive.platforms)
+            directive.only_run([
+                (url, platforms[name]) for url, name in entry['units']
+            ])
+            directives.append(directive)
+
+        lease = _Lease(message['id'], directives, self.options.verbosity)
+        for directive in directives:
+            self._queue.put(lease.wrap(directive, directive.run, self._finish))
+
+    def _finish(self, lease):
+        self.leases_run += 1
+        for directive in lease.directives:
+            directive.close()
+        try:
+            self._connection.send({
+                'type': 'result',
+                'lease': lease.id,
+                'results': lease.results(),
+            })
+            self._connection.send({'type': 'ready', 'n': 1})
+        except socket.error:
+            # The coordinator will hand the lease to someone else
+            pass
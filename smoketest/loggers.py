@@ -7,6 +7,9 @@ import time
 
 from six import string_types
 
+from smoketest.bodies import get_body_text
+from smoketest.plugins import get_plugin_registry
+
 
 class Constants(object):
     # Set on startup by decorators in this module
@@ -38,6 +41,8 @@ def get_logger(options):
     if Constants.logger_in_use is not None:
         return Constants.logger_in_use
 
+    if options.format not in Constants.available_logger_classes:
+        get_plugin_registry().load('loggers', options.format)
     class_ = Constants.available_logger_classes.get(
         options.format,
         Constants.default_logger_class,
@@ -118,6 +123,15 @@ class Logger(object):
         self.success_count = 0
         self.failure_count = 0
         self.error_count = 0
+        self.extra_summary = OrderedDict()
+
+    def add_to_summary(self, label, value):
+        """Add a line to the summary of the current pass.
+
+        Used for numbers that don't come from test results, like how long
+        requests were held back by rate limiting.
+        """
+        self.extra_summary[label] = value
 
     def log_test_result(self, url, test, result, response, platform, follow_redirects):
         if result:
@@ -165,6 +179,15 @@ class Logger(object):
         """
         raise NotImplementedError
 
+    def log_diff(self, baseline_run_id, regressions, timing_deltas):
+        """Log how this run compares to an earlier one in the result store.
+
+        regressions is a list of smoketest.store.Regression and
+        timing_deltas is a list of smoketest.store.TimingDelta. Loggers that
+        don't override this leave the comparison out of their output.
+        """
+        pass
+
 
 @default_logger
 @select_with_key('shell')
@@ -240,11 +263,11 @@ class _ShellLogger(Logger):
                 hops)
 
         # super duper verbose
-        # calling response.text can be expensive, so only do so if needed
+        # getting the body as text can be expensive, so only do so if needed
         else:
             message = self._verbose_templates[4].format(
                 url, test_desc, result_desc, True, elapsed, platform.name,
-                hops, request_headers, response_headers, response.text)
+                hops, request_headers, response_headers, get_body_text(response))
 
         self._write_in_color(message, _Colors.GREEN)
 
@@ -274,11 +297,11 @@ class _ShellLogger(Logger):
                 hops)
 
         # super duper verbose
-        # calling response.text can be expensive, so only do so if needed
+        # getting the body as text can be expensive, so only do so if needed
         else:
             message = self._verbose_templates[4].format(
                 url, test_desc, result_desc, False, elapsed, platform_name,
-                hops, request_headers, response_headers, response.text)
+                hops, request_headers, response_headers, get_body_text(response))
 
         self._write_in_color(message, _Colors.RED)
 
@@ -301,10 +324,41 @@ class _ShellLogger(Logger):
             'Number of successes: {0}'.format(self.success_count),
             'Number of failures: {0}'.format(self.failure_count),
             'Number of errors: {0}'.format(self.error_count),
-            '',
         ]
+        for label, value in self.extra_summary.items():
+            summary.append('{0}: {1}'.format(label, value))
+        summary.append('')
         sys.stdout.write('\n'.join(summary))
 
+    def log_diff(self, baseline_run_id, regressions, timing_deltas):
+        lines = [
+            '',
+            'Compared with run {0}:'.format(baseline_run_id),
+            'Number of regressions: {0}'.format(len(regressions)),
+        ]
+        for regression in regressions:
+            lines.append(u'    [REGRESSED{0}: {1} on {2}: {3}]'.format(
+                '' if regression.was_passing else ' (new)',
+                regression.url,
+                regression.platform,
+                regression.test or 'request errored',
+            ))
+        lines.append('Number of response time changes: {0}'.format(
+            len(timing_deltas)
+        ))
+        for delta in timing_deltas:
+            lines.append(u'    {0} on {1}: {2:.3f} -> {3:.3f} seconds'.format(
+                delta.url,
+                delta.platform,
+                delta.baseline_elapsed,
+                delta.elapsed,
+            ))
+        lines.append('')
+        self._write_in_color(
+            '\n'.join(lines),
+            _Colors.RED if regressions else _Colors.GREEN,
+        )
+
     def _write_in_color(self, message, color):
         if message:
             full_message = ''.join([
@@ -364,7 +418,7 @@ class _JsonLogger(Logger):
             data.update(OrderedDict([
                 ('request_headers', json.dumps(dict(response.request.headers))),
                 ('response_headers', json.dumps(dict(response.headers))),
-                ('body', response.text),
+                ('body', get_body_text(response)),
             ]))
 
         if data:
@@ -396,7 +450,7 @@ class _JsonLogger(Logger):
             data.update(OrderedDict([
                 ('request_headers', json.dumps(dict(response.request.headers))),
                 ('response_headers', json.dumps(dict(response.headers))),
-                ('body', response.text),
+                ('body', get_body_text(response)),
             ]))
 
         self._output['results'][self.pass_]['urls'].append(data)
@@ -416,8 +470,33 @@ class _JsonLogger(Logger):
             'Number of failures': '{0}'.format(self.failure_count),
             'Number of errors': '{0}'.format(self.error_count),
         }
+        for label, value in self.extra_summary.items():
+            data[label] = '{0}'.format(value)
         self._output['results'][self.pass_]['summary'] = data
 
+    def log_diff(self, baseline_run_id, regressions, timing_deltas):
+        self._output['diff'] = OrderedDict([
+            ('baseline_run', baseline_run_id),
+            ('regressions', [
+                OrderedDict([
+                    ('url', regression.url),
+                    ('platform', regression.platform),
+                    ('test', regression.test),
+                    ('was_passing', regression.was_passing),
+                ])
+                for regression in regressions
+            ]),
+            ('timing_deltas', [
+                OrderedDict([
+                    ('url', delta.url),
+                    ('platform', delta.platform),
+                    ('baseline_time', delta.baseline_elapsed),
+                    ('time', delta.elapsed),
+                ])
+                for delta in timing_deltas
+            ]),
+        ])
+
     def start_pass(self):
         super(_JsonLogger, self).start_pass()
         self._output['results'].append(
@@ -0,0 +1,103 @@
+"""Running the same tests against every node behind a load balancer.
+
+Each directive is copied once per node. The copies share the parsed tests
+but have connections of their own, which go straight to their node, and
+their results are logged with the node's address after the platform name.
+"""
+from smoketest.resolver import get_connect_to
+from smoketest.tallies import (
+    Tally,
+    TallyingLogger,
+)
+
+
+def parse_nodes(value):
+    """Parse a comma-separated list of node addresses, each with an optional
+    port, into a list of Nodes. IPv6 addresses go in brackets.
+    """
+    nodes = []
+    for part in value.split(','):
+        part = part.strip()
+        if part.startswith('['):
+            address, _, port = part[1:].partition(']')
+            port = port[1:]
+        elif part.count(':') == 1:
+            address, _, port = part.partition(':')
+        else:
+            address, port = part, ''
+        if not address or (port and not port.isdigit()):
+            raise ValueError(
+                'Nodes should look like 10.0.0.1,10.0.0.2:8443, not '
+                '{0}'.format(value)
+            )
+        nodes.append(Node(address, int(port) if port else None))
+    return nodes
+
+
+class Node(Tally):
+    """A backend to send requests to, and how its tests went this pass.
+    """
+
+    def __init__(self, address, port=None):
+        self.address = address
+        self.port = port
+        if port is None:
+            name = address
+        elif ':' in address:
+            name = '[{0}]:{1}'.format(address, port)
+        else:
+            name = '{0}:{1}'.format(address, port)
+        super(Node, self).__init__(name)
+
+
+def _on_node(platform, node):
+    return platform._replace(name='{0}@{1}'.format(platform.name, node.name))
+
+
+class NodeDirective(object):
+    """A copy of a directive whose requests all go to one node.
+    """
+
+    def __init__(self, directive, node):
+        self.node = node
+        self._directive = directive = directive.copy()
+        directive.logger = TallyingLogger(directive.logger, node)
+        directive.private_session = True
+        directive.platforms = [_on_node(p, node) for p in directive.platforms]
+        if directive._rerun is not None:
+            directive._rerun = [
+                (url, _on_node(platform, node), tests)
+                for url, platform, tests in directive._rerun
+            ]
+
+    def run(self):
+        return self._on_node(self._directive.run)()
+
+    def _on_node(self, work):
+        # Retries run later, maybe on another thread, so they need sending
+        # to the node too
+        def run():
+            with get_connect_to().only_to(self.node.address, self.node.port):
+                retries = work()
+            return [
+                (delay, self._on_node(retry)) for delay, retry in retries or ()
+            ]
+        return run
+
+    def __getattr__(self, name):
+        return getattr(self._directive, name)
+
+
+def fan_out(directives, nodes):
+    """Return copies of the directives for every node.
+
+    The copies are interleaved, so that the nodes get tested at the same
+    time rather than one after another, each with its share of the threads.
+    Needs connect-to to be enabled, even with no mappings, so that copies
+    can send their connections to their node.
+    """
+    return [
+        NodeDirective(directive, node)
+        for directive in directives
+        for node in nodes
+    ]
@@ -0,0 +1,117 @@
+"""Reading plain text input files quickly.
+
+Plain text files can run to millions of lines, so rather than reading them
+a line at a time, they're memory-mapped and decoded and split up in chunks.
+A file can also be read a byte range at a time, so that several processes
+can each read their own part of it without reading the rest.
+"""
+import mmap
+import os
+
+import six
+
+
+# How much of a file to decode and split into lines at a time
+_CHUNK_SIZE = 1 << 20
+
+
+class EncodingError(ValueError):
+    pass
+
+
+def slice_range(filename, index, count):
+    """Return the (start, end) byte range of slice index of count of a file,
+    counting from 1.
+    """
+    size = os.path.getsize(filename)
+    return size * (index - 1) // count, size * index // count
+
+
+def _line_start(data, offset):
+    # Where the first line starting at or after offset starts. Lines belong
+    # to whichever range they start in, so ranges can be cut anywhere and
+    # still cover every line exactly once.
+    if offset <= 0:
+        return 0
+    if offset >= len(data) or data[offset - 1:offset] == b'\n':
+        return min(offset, len(data))
+    newline = data.find(b'\n', offset)
+    return len(data) if newline == -1 else newline + 1
+
+
+def _parse(line):
+    # For lines that are more than a bare URL. Anything that doesn't look
+    # like it should gets handed back whole.
+    cleaned = line.partition('#')[0]
+    parts = cleaned.split()
+    if not parts:
+        if line.startswith('#include'):
+            parts = line.split()
+            if len(parts) > 1:
+                return None, None, None, parts[1], None
+            return None, None, None, None, line
+        return None
+    if len(parts) == 1 and '->' not in cleaned and not parts[0][0].isdigit():
+        return '200', parts[0], None, None, None
+    if len(parts) == 2 and parts[0][0].isdigit():
+        return parts[0], parts[1], None, None, None
+    if len(parts) == 4 and parts[0][0] == '3' and parts[2] == '->':
+        return parts[0], parts[1], parts[3], None, None
+    return None, None, None, None, line
+
+
+def read_lines(filename, start=0, end=None):
+    """Yield a tuple for every line starting between byte start and byte end
+    of a plain text file that has something on it:
+
+    (status, url, location, None, None) for a URL to check, with a location
+        for a redirect and None otherwise, and a status of '200' if the line
+        didn't give one
+    (None, None, None, filename, None) for an #include line
+    (None, None, None, None, line) for a line that didn't make sense
+
+    The file is memory-mapped and decoded and split into lines a chunk at a
+    time. Most lines in a big file are nothing but a URL, and those are
+    picked out without any more parsing than checking that that's all they
+    are.
+
+    Raises IOError (or OSError) if the file can't be read, and EncodingError
+    if it isn't UTF-8.
+    """
+    with open(filename, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            return
+    try:
+        start = _line_start(data, start)
+        end = len(data) if end is None else _line_start(data, end)
+        while start < end:
+            chunk_end = _line_start(data, min(start + _CHUNK_SIZE, end))
+            chunk = data[start:chunk_end]
+            if six.PY3:
+                try:
+                    chunk = chunk.decode('utf-8')
+                except UnicodeDecodeError as e:
+                    # Say where in the file, not where in the chunk
+                    raise EncodingError(
+                        'Byte {0} is not UTF-8: {1}'.format(
+                            start + e.start,
+                            e.reason,
+                        ))
+            for line in chunk.splitlines():
+                if (
+                    ' ' in line or '\t' in line or '#' in line or
+                    '->' in line or line[:1].isdigit()
+                ):
+                    parsed = _parse(line)
+                    if parsed:
+                        yield parsed
+                else:
+                    line = line.strip()
+                    if line:
+                        yield '200', line, None, None, None
+            start = chunk_end
+    finally:
+        data.close()
@@ -16,13 +16,23 @@ Desktop = Platform(name='desktop', headers={})
 Mobile = Platform(name='mobile', headers=get_mobile_headers())
 
 
+# tuple of names: tuple of Platforms, shared by every element asking for
+# the same ones
+_PLATFORMS_CACHE = {}
+
+
 def get_platforms_from_element(elem):
-    requested_platforms = elem.get(
+    requested_platforms = tuple(elem.get(
         'platforms',
         ['desktop'],
-    )
+    ))
+    try:
+        return _PLATFORMS_CACHE[requested_platforms]
+    except KeyError:
+        pass
     platforms = []
     for name in requested_platforms:
         # This lookup is a little sketch.
         platforms.append(globals()[name.title()])
+    platforms = _PLATFORMS_CACHE[requested_platforms] = tuple(platforms)
     return platforms
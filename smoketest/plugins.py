@@ -0,0 +1,256 @@
+"""Plugins: modules from outside smoketest that add tests, loggers or
+transports.
+
+A plugin registers what it adds when it's imported, the same way smoketest's
+own modules do: with @parser, or the loggers' or transports' select_with_key.
+To keep startup fast, plugins say up front which keys they provide, and a
+plugin only gets imported once an input file uses one of its element keys or
+an option selects one of its loggers or transports.
+
+Installed packages declare plugins with entry points, in a group for each
+kind of thing, named after the key:
+
+    entry_points={
+        'smoketest.tests': ['body_size = smoketest_body_size'],
+        'smoketest.loggers': ['junit = smoketest_junit'],
+    }
+
+Modules in a "plugins" directory next to settings.yaml can be declared in
+settings.yaml instead. A plain module name there is imported at startup,
+which is how plugins used to work:
+
+    plugins:
+      - legacy_plugin
+      - module: body_size
+        tests: [body_size]
+
+Keys smoketest already has can't be taken over by a plugin. Plugins that
+claim one are ignored for it, with a warning.
+"""
+import importlib
+import sys
+import threading
+
+from six import string_types
+
+from smoketest.settings import get_plugin_names
+
+
+# Kinds of things plugins can provide, with the entry point group for each
+KINDS = {
+    'tests': 'smoketest.tests',
+    'loggers': 'smoketest.loggers',
+    'transports': 'smoketest.transports',
+}
+
+# Where the plugins named in settings.yaml are found
+PLUGINS_DIRECTORY = 'plugins'
+
+
+class PluginError(Exception):
+    pass
+
+
+def _entry_points():
+    # Return a list of (kind, key, module name) for every plugin installed
+    # packages declare
+    groups = dict((group, kind) for kind, group in KINDS.items())
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # Python < 3.8
+        import pkg_resources
+        return [
+            (kind, entry_point.name, entry_point.module_name)
+            for group, kind in groups.items()
+            for entry_point in pkg_resources.iter_entry_points(group)
+        ]
+    declared = entry_points()
+    if hasattr(declared, 'select'):
+        declared = [
+            entry_point
+            for group in groups
+            for entry_point in declared.select(group=group)
+        ]
+    else:
+        # Python < 3.10 gives a dictionary of groups
+        declared = [
+            entry_point
+            for group in groups
+            for entry_point in declared.get(group, ())
+        ]
+    return [
+        (
+            groups[entry_point.group],
+            entry_point.name,
+            entry_point.value.partition(':')[0].strip(),
+        )
+        for entry_point in declared
+    ]
+
+
+def _settings_plugins():
+    # Return the names of the plugins in settings.yaml to import now, and a
+    # list of (kind, key, module name) for the rest
+    eager = []
+    declared = []
+    for plugin in get_plugin_names():
+        if isinstance(plugin, string_types):
+            eager.append(plugin)
+            continue
+        try:
+            module_name = plugin['module']
+        except (KeyError, TypeError):
+            raise PluginError(
+                'Plugins in settings.yaml need a module: {0!r}'.format(plugin)
+            )
+        for kind in KINDS:
+            for key in plugin.get(kind, ()):
+                declared.append((kind, key, module_name))
+    return eager, declared
+
+
+def _known_keys():
+    # Return a dictionary of kind: keys that smoketest, or plugins imported
+    # already, have things for
+    from smoketest.loggers import Constants
+    from smoketest.tests import known_element_keys
+    from smoketest.transports import transport_keys
+    return {
+        'tests': known_element_keys(),
+        'loggers': list(Constants.logger_keys()),
+        'transports': transport_keys(),
+    }
+
+
+def _import_from_directory(module_name, directory):
+    # Import a module from a directory that isn't on the path
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    try:
+        import importlib.util
+        from importlib.machinery import PathFinder
+    except ImportError:
+        # Python 2
+        import imp
+        f, path, desc = imp.find_module(module_name, [directory])
+        return imp.load_module(module_name, f, path, desc)
+    spec = PathFinder.find_spec(module_name, [directory])
+    if spec is None:
+        raise ImportError('No module named {0} in {1}'.format(
+            module_name,
+            directory,
+        ))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
+
+
+class PluginRegistry(object):
+    """What plugins provide, by kind and key, and which have been imported.
+
+    known_keys is a dictionary of kind: keys there already are things for.
+    Plugins that claim one of those are left out, and listed in shadowed as
+    (kind, key, module name).
+    """
+
+    def __init__(self, entry_points=(), settings_plugins=(), known_keys=None):
+        known_keys = known_keys or {}
+        self.shadowed = []
+        # Plugins in settings.yaml come from the plugins directory and take
+        # precedence over installed ones
+        self._modules = dict((kind, {}) for kind in KINDS)
+        declared = [
+            (kind, key, module_name, None)
+            for kind, key, module_name in entry_points
+        ] + [
+            (kind, key, module_name, PLUGINS_DIRECTORY)
+            for kind, key, module_name in settings_plugins
+        ]
+        for kind, key, module_name, directory in declared:
+            if key in known_keys.get(kind, ()):
+                self.shadowed.append((kind, key, module_name))
+                continue
+            self._modules[kind][key] = (module_name, directory)
+        self._lock = threading.Lock()
+        self._imported = set()
+
+    def keys(self, kind):
+        """Return the keys plugins provide things of a kind for.
+        """
+        return sorted(self._modules[kind])
+
+    def load(self, kind, key):
+        """Import the plugin that provides a kind of thing for a key, if
+        there is one and it hasn't been imported already.
+
+        Returns True if there was one.
+        """
+        try:
+            module_name, directory = self._modules[kind][key]
+        except KeyError:
+            return False
+        with self._lock:
+            if (module_name, directory) in self._imported:
+                return True
+            try:
+                if directory is None:
+                    importlib.import_module(module_name)
+                else:
+                    _import_from_directory(module_name, directory)
+            except ImportError as e:
+                raise PluginError(
+                    'Could not import plugin {0} for {1} {2!r}: {3}'.format(
+                        module_name, kind, key, e,
+                    ))
+            self._imported.add((module_name, directory))
+        return True
+
+    def load_for_keys(self, keys):
+        """Import the plugins that provide tests for any of some element
+        keys.
+
+        Returns True if there were any.
+        """
+        found = False
+        for key in keys:
+            found = self.load('tests', key) or found
+        return found
+
+
+# Poor man's singleton, like the logger. Made the first time it's needed.
+_REGISTRY = None
+
+
+def get_plugin_registry():
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = PluginRegistry(
+            _entry_points(),
+            _settings_plugins()[1],
+            _known_keys(),
+        )
+        for kind, key, module_name in _REGISTRY.shadowed:
+            sys.stderr.write(
+                'Smoketest ignored the plugin {0} for {1} {2!r}, which '
+                'smoketest already has\n'.format(module_name, kind, key)
+            )
+    return _REGISTRY
+
+
+def clear():
+    global _REGISTRY
+    _REGISTRY = None
+
+
+def load_plugins():
+    """Import the plugins named in settings.yaml without saying what they
+    provide, which can't wait until something uses them.
+    """
+    for module_name in _settings_plugins()[0]:
+        _import_from_directory(module_name, PLUGINS_DIRECTORY)
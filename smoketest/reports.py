@@ -0,0 +1,66 @@
+from collections import OrderedDict
+
+
+def _add_summaries(summaries):
+    # Summary values are strings of numbers. Everything adds up, except that
+    # shards run side by side, so the elapsed time is the longest one.
+    merged = OrderedDict()
+    for summary in summaries:
+        for label, value in (summary or {}).items():
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                merged.setdefault(label, value)
+                continue
+            if label not in merged:
+                merged[label] = value
+            elif label == 'Elapsed time':
+                merged[label] = max(merged[label], value)
+            else:
+                merged[label] += value
+    return OrderedDict(
+        (label, '{0:g}'.format(value) if isinstance(value, float) else value)
+        for label, value in merged.items()
+    )
+
+
+def merge_json_reports(reports):
+    """Merge the output of the JSON logger from several shards of one run into
+    a single report of the same shape.
+
+    Results are merged pass by pass; URLs are concatenated and summaries are
+    added up.
+    """
+    merged = OrderedDict([
+        ('configuration', None),
+        ('results', []),
+    ])
+    if not reports:
+        return merged
+
+    configuration = OrderedDict(reports[0].get('configuration') or {})
+    configuration['shard'] = [
+        (report.get('configuration') or {}).get('shard') for report in reports
+    ]
+    merged['configuration'] = configuration
+
+    n_passes = max(len(report.get('results', [])) for report in reports)
+    for pass_ in range(n_passes):
+        passes = [
+            report['results'][pass_]
+            for report in reports
+            if pass_ < len(report.get('results', []))
+        ]
+        merged['results'].append(OrderedDict([
+            ('summary', _add_summaries(p.get('summary') for p in passes)),
+            ('urls', [url for p in passes for url in p.get('urls', [])]),
+        ]))
+
+    diffs = [report['diff'] for report in reports if 'diff' in report]
+    if diffs:
+        merged['diff'] = OrderedDict([
+            ('baseline_run', diffs[0]['baseline_run']),
+            ('regressions', [r for d in diffs for r in d['regressions']]),
+            ('timing_deltas', [t for d in diffs for t in d['timing_deltas']]),
+        ])
+    return merged
@@ -0,0 +1,258 @@
+from contextlib import contextmanager
+import functools
+import re
+import socket
+import threading
+import time
+
+from six.moves.urllib.parse import urlsplit
+
+from smoketest.threads import run_all
+
+
+# The real thing, before _install replaces it
+_getaddrinfo = socket.getaddrinfo
+
+
+class DnsCache(object):
+    """Caches host name lookups for every thread in the process, by standing
+    in for socket.getaddrinfo, which is what both requests and httpx use to
+    resolve hosts.
+
+    Python's resolver doesn't tell us the TTLs of the records it looks up,
+    so answers are kept for `ttl` seconds. While one thread looks a host up,
+    others that want the same host wait for its answer rather than asking
+    the resolver again.
+    """
+
+    def __init__(self, ttl=60.0, resolve=_getaddrinfo, clock=time.time):
+        self.ttl = ttl
+        self._resolve = resolve
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (host, family, type, proto, flags): (expiry time, addresses)
+        self._entries = {}
+        # Lookups in progress; key: event set when it's done
+        self._resolving = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.lookup_count = 0
+            self.hit_count = 0
+            self.resolution_time = 0.0
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        try:
+            port = None if port is None else int(port)
+        except ValueError:
+            # A service name like "https"; leave those to the resolver
+            return self._resolve(host, port, family, type, proto, flags)
+        addresses = self._lookup((host, family, type, proto, flags))
+        if port is None:
+            return addresses
+        # Addresses are cached without a port, so put the one asked for in
+        return [
+            address[:4] + ((address[4][0], port) + address[4][2:], )
+            for address in addresses
+        ]
+
+    def _lookup(self, key):
+        while True:
+            with self._lock:
+                try:
+                    expires, addresses = self._entries[key]
+                except KeyError:
+                    pass
+                else:
+                    if expires > self._clock():
+                        self.hit_count += 1
+                        return addresses
+                event = self._resolving.get(key)
+                if event is None:
+                    event = self._resolving[key] = threading.Event()
+                    break
+            # Someone else is looking it up. If their lookup fails, try again
+            # ourselves.
+            event.wait()
+
+        start = time.time()
+        addresses = None
+        try:
+            addresses = self._resolve(key[0], None, *key[1:])
+        finally:
+            with self._lock:
+                self.lookup_count += 1
+                self.resolution_time += time.time() - start
+                if addresses is not None:
+                    self._entries[key] = (self._clock() + self.ttl, addresses)
+                del self._resolving[key]
+            event.set()
+        return addresses
+
+    def resolve_all(self, hosts, n_threads):
+        """Look up all the hosts, n_threads at a time, so that requests
+        don't have to. Hosts that fail to resolve are left for the requests
+        to report.
+        """
+        def resolve(host):
+            try:
+                self.getaddrinfo(host, None, 0, socket.SOCK_STREAM)
+            except socket.error:
+                pass
+
+        run_all(
+            [functools.partial(resolve, host) for host in hosts],
+            n_threads,
+        )
+
+
+_CONNECT_TO_PATTERN = re.compile(
+    r'^(\[[^\]]*\]|[^:]*):(\d*):(\[[^\]]*\]|[^:]*):(\d*)$'
+)
+
+
+def parse_connect_to(value):
+    """Parse a mapping given as "host:port:address:port", like curl's
+    --connect-to, into ((host, port), (address, port)).
+
+    Any part can be left out, and comes back as None: an empty host or port
+    on the left matches any, and an empty address or port on the right
+    keeps the one connected to. IPv6 addresses go in brackets.
+    """
+    match = _CONNECT_TO_PATTERN.match(value)
+    if not match:
+        raise ValueError(
+            'Connect-to should look like www.usnews.com:443:10.0.0.1:8443, '
+            'not {0}'.format(value)
+        )
+    host, port, address, address_port = [
+        part.strip('[]') or None for part in match.groups()
+    ]
+    return (
+        (host, port and int(port)),
+        (address, address_port and int(address_port)),
+    )
+
+
+class ConnectTo(object):
+    """Sends connections for some hosts and ports to other addresses, by
+    standing in for socket.getaddrinfo. Nothing above the socket knows, so
+    URLs, Host headers and TLS server names are left as they were.
+
+    Mappings are ((host, port), (address, port)) pairs, as returned by
+    parse_connect_to. The first one that matches is used, unless the thread
+    is inside an only_to block.
+    """
+
+    def __init__(self, mappings, resolve=None):
+        self._mappings = list(mappings)
+        self._resolve = resolve or _resolve
+        self._local = threading.local()
+
+    @contextmanager
+    def only_to(self, address, port=None):
+        """Within the block, send every connection this thread makes to
+        address, and port if given, whatever host it's for.
+        """
+        before = getattr(self._local, 'mappings', None)
+        self._local.mappings = [((None, None), (address, port))]
+        try:
+            yield
+        finally:
+            self._local.mappings = before
+
+    def map(self, host, port):
+        """Return the (address, port) to connect to for host and port.
+        """
+        mappings = getattr(self._local, 'mappings', None) or self._mappings
+        for (from_host, from_port), (to_host, to_port) in mappings:
+            if from_host in (None, host) and from_port in (None, port):
+                return to_host or host, port if to_port is None else to_port
+        return host, port
+
+    def covers(self, host):
+        """Return whether connections to host on any port go elsewhere.
+        """
+        return any(
+            from_host in (None, host) and from_port is None
+            for (from_host, from_port), _ in self._mappings
+        )
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        try:
+            port = None if port is None else int(port)
+        except ValueError:
+            pass
+        host, port = self.map(host, port)
+        return self._resolve(host, port, family, type, proto, flags)
+
+
+def get_hosts(directives):
+    """Return the distinct host names the directives' URLs point at.
+    """
+    hosts = set()
+    for directive in directives:
+        for url in getattr(directive, 'urls', ()):
+            host = urlsplit(url).hostname
+            if host:
+                hosts.add(host)
+    return sorted(hosts)
+
+
+# Set by enable_dns_cache and enable_connect_to when the user asks for them
+_DNS_CACHE = None
+_CONNECT_TO = None
+
+
+def _resolve(*args):
+    if _DNS_CACHE is not None:
+        return _DNS_CACHE.getaddrinfo(*args)
+    return _getaddrinfo(*args)
+
+
+def _install():
+    # Connect-to has to see host names before the cache does, so it goes
+    # on the outside
+    if _CONNECT_TO is not None:
+        socket.getaddrinfo = _CONNECT_TO.getaddrinfo
+    elif _DNS_CACHE is not None:
+        socket.getaddrinfo = _DNS_CACHE.getaddrinfo
+    else:
+        socket.getaddrinfo = _getaddrinfo
+
+
+def enable_dns_cache(ttl):
+    global _DNS_CACHE
+    _DNS_CACHE = DnsCache(ttl)
+    _install()
+    return _DNS_CACHE
+
+
+def get_dns_cache():
+    """Return the DNS cache, or None if host names aren't being cached.
+    """
+    return _DNS_CACHE
+
+
+def enable_connect_to(values):
+    """Send connections elsewhere according to the "host:port:address:port"
+    mappings in values. Raises ValueError if one doesn't parse.
+    """
+    global _CONNECT_TO
+    _CONNECT_TO = ConnectTo([parse_connect_to(value) for value in values])
+    _install()
+    return _CONNECT_TO
+
+
+def get_connect_to():
+    """Return the connect-to mappings in use, or None if there aren't any.
+    """
+    return _CONNECT_TO
+
+
+def clear():
+    global _DNS_CACHE, _CONNECT_TO
+    _DNS_CACHE = None
+    _CONNECT_TO = None
+    _install()
@@ -0,0 +1,145 @@
+import random
+import socket
+import threading
+
+from smoketest.settings import get_retry_settings
+
+
+# Names that can be used in the "exceptions" list of a retry policy
+RETRYABLE_EXCEPTIONS = ('connection', 'timeout', 'any')
+
+
+def _exception_classes(name):
+    # Looked up when first needed, so that requests isn't imported just to
+    # read a retry policy
+    from requests.exceptions import (
+        ConnectionError,
+        RequestException,
+        Timeout,
+    )
+    return {
+        'connection': (ConnectionError, ),
+        'timeout': (Timeout, socket.timeout),
+        'any': (RequestException, socket.timeout),
+    }[name]
+
+
+class RetryPolicy(object):
+    """Decides whether a request that went wrong should be tried again, and
+    how long to wait first.
+
+    Waits grow exponentially with the attempt number and are "full jitter":
+    a random amount between zero and the exponential backoff, so that lots of
+    requests failing at once don't all come back at once.
+    """
+
+    def __init__(self, attempts=1, backoff=0.1, max_backoff=5.0,
+                 statuses=(), exceptions=('connection', 'timeout')):
+        self.attempts = int(attempts)
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.statuses = frozenset(str(status) for status in statuses)
+        for name in exceptions:
+            if name not in RETRYABLE_EXCEPTIONS:
+                raise ValueError(
+                    'Unknown retryable exception {0}; choices: {1}'.format(
+                        name,
+                        ', '.join(sorted(RETRYABLE_EXCEPTIONS)),
+                    ))
+        self.exception_names = tuple(exceptions)
+        self._exceptions = None
+
+    @property
+    def exceptions(self):
+        if self._exceptions is None:
+            self._exceptions = tuple(
+                exception_class
+                for name in self.exception_names
+                for exception_class in _exception_classes(name)
+            )
+        return self._exceptions
+
+    def should_retry_error(self, error, attempt):
+        return attempt < self.attempts and isinstance(error, self.exceptions)
+
+    def should_retry_response(self, response, attempt):
+        return (
+            attempt < self.attempts and
+            str(response.status_code) in self.statuses
+        )
+
+    def get_delay(self, attempt):
+        """Seconds to wait before making the attempt after `attempt`.
+        """
+        ceiling = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+
+# Keys a "retry" mapping can have, which are RetryPolicy's arguments
+RETRY_KEYS = ('attempts', 'backoff', 'max_backoff', 'statuses', 'exceptions')
+
+# Policies for directives without a "retry" key, by value of --retries, as
+# (retry settings they were made with, policy)
+_DEFAULT_POLICIES = {}
+
+
+def get_retry_policy(elem, options):
+    """Get the retry policy for a directive.
+
+    Settings from settings.yaml are the starting point, the --retries option
+    overrides the number of attempts, and a "retry" key on the element
+    overrides everything.
+
+    Raises ValueError if the "retry" key isn't a mapping of RETRY_KEYS.
+    """
+    retries = getattr(options, 'retries', None)
+    if not isinstance(retries, int):
+        retries = None
+    settings = get_retry_settings()
+    if 'retry' not in elem:
+        # Settings without a retry key come back as a new {} every time, so
+        # compare them rather than check they're the same
+        made_with, policy = _DEFAULT_POLICIES.get(retries, (None, None))
+        if policy is not None and made_with == settings:
+            return policy
+
+    kwargs = dict(settings)
+    if retries is not None:
+        kwargs['attempts'] = retries + 1
+    if 'retry' in elem:
+        retry = elem['retry']
+        if not isinstance(retry, dict):
+            raise ValueError('retry should be a mapping, not {0!r}'.format(
+                retry,
+            ))
+        unknown = sorted(key for key in retry if key not in RETRY_KEYS)
+        if unknown:
+            raise ValueError('Unknown retry keys {0}; choices: {1}'.format(
+                ', '.join(str(key) for key in unknown),
+                ', '.join(RETRY_KEYS),
+            ))
+        kwargs.update(retry)
+        return RetryPolicy(**kwargs)
+
+    policy = RetryPolicy(**kwargs)
+    _DEFAULT_POLICIES[retries] = (settings, policy)
+    return policy
+
+
+class _Counter(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def increment(self):
+        with self._lock:
+            self.value += 1
+
+    def reset(self):
+        with self._lock:
+            self.value = 0
+
+
+# Number of retries scheduled during the current pass
+retry_count = _Counter()
@@ -1,7 +1,5 @@
 import os
 
-import yaml
-
 _SETTINGS = None
 
 
@@ -15,6 +13,7 @@ def _get_settings():
             'settings.yaml',
         )
         if os.path.isfile(filepath):
+            import yaml
             with open(filepath) as f:
                 # If settings file is empty, just return an empty dictionary
                 _SETTINGS = yaml.safe_load(f) or {}
@@ -66,3 +65,39 @@ def get_default_request_timeout():
 
 def get_level_token():
     return _get_settings().get('level_token', '{LEVEL}')
+
+
+def _get_rate_limit_settings():
+    return _get_settings().get('rate_limits') or {}
+
+
+def get_global_rate_limit():
+    return _get_rate_limit_settings().get('global')
+
+
+def get_level_rate_limit(level):
+    level_settings = _get_rate_limit_settings().get('levels') or {}
+    try:
+        return level_settings[level]
+    except KeyError:
+        return level_settings.get('other')
+
+
+def get_host_rate_limits():
+    return _get_rate_limit_settings().get('hosts') or {}
+
+
+def get_retry_settings():
+    return _get_settings().get('retry') or {}
+
+
+def get_result_store_filename():
+    return _get_settings().get('result_store')
+
+
+def get_dns_cache_ttl():
+    return _get_settings().get('dns_cache_ttl')
+
+
+def get_default_connect_to():
+    return _get_settings().get('connect_to') or []
@@ -0,0 +1,128 @@
+import hashlib
+import heapq
+import io
+import json
+
+import six
+
+from smoketest.utils import uncachebust
+
+
+def parse_shard(value, name='Shard'):
+    """Parse a shard given as "I/N", meaning the Ith of N shards, counting
+    from 1. name is what to call it in errors.
+    """
+    try:
+        index, count = [int(x) for x in value.split('/')]
+    except ValueError:
+        raise ValueError('{0} should look like 2/5, not {1}'.format(
+            name, value,
+        ))
+    if not 1 <= index <= count:
+        raise ValueError('{0} {1} is not between 1 and {2}'.format(
+            name, index, count,
+        ))
+    return index, count
+
+
+def _stable_hash(url, platform_name):
+    # Python's own hash() is salted per process, so use something that comes
+    # out the same on every machine.
+    key = u'{0} {1}'.format(url, platform_name).encode('utf-8')
+    return int(hashlib.md5(key).hexdigest()[:8], 16)
+
+
+def pack(costs, count):
+    """Spread units over `count` shards so that their total costs come out
+    about even, by giving the most expensive unit left to the least loaded
+    shard.
+
+    costs is a dictionary of unit: cost. Returns a dictionary of unit: shard.
+    Ties are broken by unit so every node comes up with the same answer.
+    """
+    loads = [(0.0, shard) for shard in range(1, count + 1)]
+    assignments = {}
+    for unit, cost in sorted(costs.items(), key=lambda x: (-x[1], x[0])):
+        load, shard = heapq.heappop(loads)
+        assignments[unit] = shard
+        heapq.heappush(loads, (load + cost, shard))
+    return assignments
+
+
+class Sharder(object):
+    """Decides which (url, platform) units belong to this shard.
+
+    Units with known costs, such as past response times every shard reads
+    from the same file, are bin-packed so that shards finish at about the
+    same time. Anything else goes by a stable hash of the URL and platform.
+    """
+
+    def __init__(self, index, count, costs=None):
+        self.index = index
+        self.count = count
+        self._assignments = pack(costs, count) if costs else {}
+
+    def owns(self, url, platform):
+        url = uncachebust(url)
+        try:
+            shard = self._assignments[(url, platform.name)]
+        except KeyError:
+            shard = _stable_hash(url, platform.name) % self.count + 1
+        return shard == self.index
+
+    def __str__(self):
+        return '{0}/{1}'.format(self.index, self.count)
+
+
+def load_costs(filename):
+    """Read a file of unit costs written by save_costs, returning a
+    dictionary of (url, platform): cost. Raises IOError or ValueError if it
+    can't.
+    """
+    with io.open(filename) as f:
+        rows = json.load(f)
+    try:
+        return dict(
+            ((url, platform), float(cost)) for url, platform, cost in rows
+        )
+    except (TypeError, ValueError):
+        raise ValueError('{0} is not a file of shard costs'.format(filename))
+
+
+def save_costs(costs, filename):
+    """Write a dictionary of (url, platform): cost to a file for every shard
+    to read with load_costs.
+    """
+    rows = sorted(
+        [url, platform, cost] for (url, platform), cost in costs.items()
+    )
+    with io.open(filename, 'w') as f:
+        f.write(six.text_type(json.dumps(rows, indent=1)))
+        f.write(u'\n')
+
+
+def make_sharder(options):
+    """Return the Sharder for options.shard. Units are only bin-packed by
+    cost with options.shard_costs, because every shard has to pack the same
+    costs to come up with the same split.
+    """
+    index, count = parse_shard(options.shard)
+    costs = None
+    if options.shard_costs:
+        costs = load_costs(options.shard_costs)
+    return Sharder(index, count, costs=costs)
+
+
+# Set by set_sharder when running as one shard of several
+_SHARDER = None
+
+
+def set_sharder(sharder):
+    global _SHARDER
+    _SHARDER = sharder
+
+
+def get_sharder():
+    """Return the sharder for this run, or None if it isn't sharded.
+    """
+    return _SHARDER
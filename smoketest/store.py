@@ -0,0 +1,304 @@
+from collections import (
+    OrderedDict,
+    namedtuple,
+)
+import json
+import sqlite3
+import threading
+import time
+
+from smoketest.utils import (
+    fingerprint_response,
+    uncachebust,
+)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    label TEXT,
+    level TEXT,
+    started REAL,
+    configuration TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    pass INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    platform TEXT,
+    test TEXT,
+    passed INTEGER NOT NULL,
+    elapsed REAL,
+    status_code INTEGER,
+    fingerprint TEXT,
+    error TEXT,
+    recorded REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_by_run
+    ON results (run_id, url, platform, test);
+CREATE INDEX IF NOT EXISTS results_by_unit
+    ON results (url, platform, test, run_id);
+CREATE INDEX IF NOT EXISTS results_by_time
+    ON results (recorded);
+CREATE INDEX IF NOT EXISTS runs_by_label
+    ON runs (label);
+"""
+
+
+Regression = namedtuple(
+    'Regression',
+    ['url', 'platform', 'test', 'was_passing'],
+)
+TimingDelta = namedtuple(
+    'TimingDelta',
+    ['url', 'platform', 'baseline_elapsed', 'elapsed'],
+)
+
+
+class ResultStore(object):
+    """SQLite file of test results from every run that used it.
+
+    Each run gets a row in `runs`, and every test result or error becomes a
+    row in `results`, with URLs stripped of cachebusters so runs can be
+    compared. Rows are buffered in memory and written in batches, since
+    results come in from every worker thread.
+    """
+
+    _batch_size = 1000
+
+    def __init__(self, filename, options, label=None):
+        self.filename = filename
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._rows = []
+        self._recently_passed = frozenset()
+        self.skipped_count = 0
+        self.pass_ = 0
+        cursor = self._connection.execute(
+            'INSERT INTO runs (label, level, started, configuration) '
+            'VALUES (?, ?, ?, ?)',
+            (
+                label,
+                getattr(options, 'level', None),
+                time.time(),
+                json.dumps(vars(options), default=str, sort_keys=True),
+            ),
+        )
+        self.run_id = cursor.lastrowid
+        self._connection.commit()
+
+    def start_pass(self):
+        self.pass_ += 1
+        self.skipped_count = 0
+
+    def record_result(self, url, platform, test, result, response):
+        self._add_row((
+            uncachebust(url),
+            platform.name,
+            test.description,
+            int(bool(result)),
+            response.elapsed.total_seconds(),
+            response.status_code,
+            fingerprint_response(response),
+            None,
+        ))
+
+    def record_error(self, url, platform, error):
+        self._add_row((
+            uncachebust(url),
+            platform.name if platform else None,
+            None,
+            0,
+            None,
+            None,
+            None,
+            str(error),
+        ))
+
+    def _add_row(self, row):
+        with self._lock:
+            self._rows.append((self.run_id, self.pass_) + row + (time.time(),))
+            if len(self._rows) >= self._batch_size:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._connection.executemany(
+            'INSERT INTO results (run_id, pass, url, platform, test, passed, '
+            'elapsed, status_code, fingerprint, error, recorded) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            self._rows,
+        )
+        self._connection.commit()
+        self._rows = []
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def find_run(self, run):
+        """Return the ID of a previous run, given its ID, its label, or
+        "last" for the one before this.
+        """
+        if run == 'last':
+            query = 'SELECT MAX(id) FROM runs WHERE id < ?'
+            args = (self.run_id, )
+        elif str(run).isdigit():
+            query = 'SELECT id FROM runs WHERE id = ? AND id < ?'
+            args = (int(run), self.run_id)
+        else:
+            query = 'SELECT MAX(id) FROM runs WHERE label = ? AND id < ?'
+            args = (run, self.run_id)
+        row = self._connection.execute(query, args).fetchone()
+        if row is None or row[0] is None:
+            raise KeyError('No earlier run {0} in {1}'.format(
+                run, self.filename,
+            ))
+        return row[0]
+
+    def skip_recently_passed(self, seconds):
+        """Have should_skip say yes to (url, platform) pairs that passed
+        everything over the last `seconds` seconds.
+        """
+        self._recently_passed = self.recently_passed(seconds)
+
+    def should_skip(self, url, platform):
+        if not self._recently_passed:
+            return False
+        skip = (uncachebust(url), platform.name) in self._recently_passed
+        if skip:
+            with self._lock:
+                self.skipped_count += 1
+        return skip
+
+    def recently_passed(self, seconds):
+        """Return a set of the (url, platform) pairs whose results over the
+        last `seconds` seconds were all passing.
+        """
+        self.flush()
+        rows = self._connection.execute(
+            'SELECT url, platform FROM results WHERE recorded >= ? '
+            'GROUP BY url, platform HAVING MIN(passed) = 1',
+            (time.time() - seconds, ),
+        )
+        return set(tuple(row) for row in rows)
+
+    def unit_costs(self, seconds=7 * 24 * 60 * 60):
+        """Return a dictionary of (url, platform): average response time over
+        the last `seconds` seconds.
+        """
+        self.flush()
+        rows = self._connection.execute(
+            'SELECT url, platform, AVG(elapsed) FROM results '
+            'WHERE recorded >= ? AND elapsed IS NOT NULL '
+            'GROUP BY url, platform',
+            (time.time() - seconds, ),
+        )
+        return dict(((url, platform), cost) for url, platform, cost in rows)
+
+    def _final_results(self, run_id):
+        # The last thing that happened to each test in a run, so that a test
+        # that failed and then passed on a later pass counts as passing.
+        self.flush()
+        rows = self._connection.execute(
+            'SELECT id, url, platform, test, passed, elapsed FROM results '
+            'WHERE id IN ('
+            '    SELECT MAX(id) FROM results WHERE run_id = ? '
+            '    GROUP BY url, platform, test'
+            ') ORDER BY id',
+            (run_id, ),
+        )
+        results = OrderedDict()
+        errors = {}
+        latest_test_ids = {}
+        for id_, url, platform, test, passed, elapsed in rows:
+            if test is None:
+                errors[(url, platform)] = id_
+            else:
+                latest_test_ids[(url, platform)] = id_
+            results[(url, platform, test)] = (passed, elapsed)
+
+        # An error doesn't count if the URL was tested after it
+        for (url, platform), id_ in errors.items():
+            if latest_test_ids.get((url, platform), 0) > id_:
+                del results[(url, platform, None)]
+        return results
+
+    def diff(self, baseline_run_id, timing_threshold):
+        """Compare this run to a baseline run.
+
+        Returns a list of Regressions, tests and errors that failed this time
+        but didn't fail in the baseline, and a list of TimingDeltas, URLs
+        whose average response time changed by more than `timing_threshold`
+        seconds.
+        """
+        baseline = self._final_results(baseline_run_id)
+        current = self._final_results(self.run_id)
+
+        regressions = []
+        for key, (passed, _) in current.items():
+            if passed:
+                continue
+            try:
+                was_passing = bool(baseline[key][0])
+            except KeyError:
+                # Not in the baseline at all
+                was_passing = None
+            if was_passing is not False:
+                regressions.append(Regression(*(key + (was_passing, ))))
+
+        timing_deltas = []
+        baseline_timings = _average_timings(baseline)
+        for unit, elapsed in _average_timings(current).items():
+            try:
+                baseline_elapsed = baseline_timings[unit]
+            except KeyError:
+                continue
+            if abs(elapsed - baseline_elapsed) > timing_threshold:
+                timing_deltas.append(
+                    TimingDelta(*(unit + (baseline_elapsed, elapsed)))
+                )
+        return regressions, timing_deltas
+
+
+def _average_timings(results):
+    totals = OrderedDict()
+    for (url, platform, _), (_, elapsed) in results.items():
+        if elapsed is None:
+            continue
+        total, count = totals.get((url, platform), (0.0, 0))
+        totals[(url, platform)] = (total + elapsed, count + 1)
+    return OrderedDict(
+        (unit, total / count) for unit, (total, count) in totals.items()
+    )
+
+
+# Poor man's singleton, like the logger. Set up by open_result_store.
+_STORE_IN_USE = None
+
+
+def open_result_store(options):
+    global _STORE_IN_USE
+    _STORE_IN_USE = ResultStore(
+        options.store,
+        options,
+        label=options.run_label,
+    )
+    return _STORE_IN_USE
+
+
+def get_result_store():
+    """Return the result store for this run, or None if results aren't being
+    stored.
+    """
+    return _STORE_IN_USE
+
+
+def clear():
+    global _STORE_IN_USE
+    _STORE_IN_USE = None
@@ -0,0 +1,81 @@
+"""Counting results by group, like by node or by level, for the summary.
+"""
+import threading
+
+
+class Tally(object):
+    """How the tests in one group went this pass.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.success_count = 0
+            self.failure_count = 0
+            self.error_count = 0
+            self.response_times = []
+
+    def record(self, passed=None, elapsed=None):
+        with self._lock:
+            if passed is None:
+                self.error_count += 1
+            elif passed:
+                self.success_count += 1
+            else:
+                self.failure_count += 1
+            if elapsed is not None:
+                self.response_times.append(elapsed)
+
+    def summary(self):
+        """Return a line about how this group did, to go next to the
+        others'.
+        """
+        with self._lock:
+            times = sorted(self.response_times)
+            line = '{0} passed, {1} failed, {2} errors'.format(
+                self.success_count,
+                self.failure_count,
+                self.error_count,
+            )
+        if times:
+            line += '; mean response time {0:.3f}s, 95th percentile ' \
+                '{1:.3f}s'.format(
+                    sum(times) / len(times),
+                    times[int(0.95 * (len(times) - 1))],
+                )
+        return line
+
+
+class TallyingLogger(object):
+    """Stands in for a directive's logger, to count results in a tally
+    before logging them as usual.
+    """
+
+    def __init__(self, logger, tally):
+        self._logger = logger
+        self._tally = tally
+        self._lock = threading.Lock()
+        self._last_response = None
+
+    def log_test_result(self, url, test, result, response, platform,
+                        follow_redirects):
+        # Responses get a result per test, but only one response time
+        with self._lock:
+            new_response = response is not self._last_response
+            self._last_response = response
+        elapsed = response.elapsed.total_seconds() if new_response else None
+        self._tally.record(bool(result), elapsed)
+        self._logger.log_test_result(
+            url, test, result, response, platform, follow_redirects,
+        )
+
+    def log_error(self, url, error, platform):
+        self._tally.record()
+        self._logger.log_error(url, error, platform)
+
+    def __getattr__(self, name):
+        return getattr(self._logger, name)
@@ -7,29 +7,73 @@ import os
 import re
 from io import BytesIO
 import string
+import sys
+import threading
+import weakref
 from xml.etree.ElementTree import ParseError
 from xml.etree import ElementTree
 
-import jsonschema
-import lxml
-from lxml.etree import XMLSyntaxError
-import lxml.html.soupparser
-from lxml.cssselect import CSSSelector
+import six
 
+from smoketest.bodies import (
+    get_body_bytes,
+    get_body_text,
+)
+from smoketest.plugins import get_plugin_registry
 from smoketest.utils import (
     cached_property,
     transform_url,
     uncachebust,
 )
 
-# A list of functions to use to get tests
+# A list of functions to use to get tests, in the order they were added,
+# which is the order their tests come in
 _PARSERS = []
 
+# Element key: the parsers that look for it
+_PARSERS_BY_KEY = {}
+
+# Parsers to call for every element, whatever keys it has
+_PARSERS_FOR_EVERY_ELEMENT = []
+
+# Element keys that something other than a test parser looks for
+_OTHER_KEYS = set()
+
+# Whether every parser has said which keys it looks for. If not, there's no
+# telling which keys nobody looks for.
+_ALL_KEYS_DECLARED = True
+
+# Elements come with the same few sets of keys over and over, so the parsers
+# to call are worked out once for each set of keys
+_DISPATCH = {}
+
+# Keys elements had that nothing looks for
+_UNKNOWN_KEYS = set()
+
+
+def _get_parsers(keys):
+    # Return the parsers to call for an element with the given keys, importing
+    # plugins for keys that nothing here looks for
+    unknown = keys.difference(_PARSERS_BY_KEY, _OTHER_KEYS)
+    if unknown and get_plugin_registry().load_for_keys(unknown):
+        unknown = keys.difference(_PARSERS_BY_KEY, _OTHER_KEYS)
+    if _ALL_KEYS_DECLARED:
+        _UNKNOWN_KEYS.update(unknown)
+    wanted = set(_PARSERS_FOR_EVERY_ELEMENT)
+    for key in keys:
+        wanted.update(_PARSERS_BY_KEY.get(key, ()))
+    return tuple(parser for parser in _PARSERS if parser in wanted)
+
 
 def get_tests_from_element(elem, options):
+    keys = frozenset(elem)
+    try:
+        parsers = _DISPATCH[keys]
+    except KeyError:
+        parsers = _DISPATCH[keys] = _get_parsers(keys)
     tests = []
 
-    for parser in _PARSERS:
+    for parser in parsers:
         new_tests = parser(elem, options)
         if new_tests:
 
@@ -44,77 +88,367 @@ def get_tests_from_element(elem, options):
 
 # Dictionary of response: lxml tree
 # Making trees out of HTML blocks is relatively expensive so keep a cache
-# of them here.
-_TREE_CACHE = {}
+# of them here. Entries go when their responses do.
+_TREE_CACHE = weakref.WeakKeyDictionary()
+
+# Dictionary of response: (lxml document, error), for the tests that need
+# all of an XML response parsed, so that they can share one parse
+_XML_CACHE = weakref.WeakKeyDictionary()
+
+# Dictionary of response: (JSON document, error), likewise
+_JSON_CACHE = weakref.WeakKeyDictionary()
 
 
 def get_tree(response):
     try:
         return _TREE_CACHE[response]
     except KeyError:
+        # Imported here, as it's slow to import and most runs don't need it
+        import lxml.etree
+        import lxml.html.soupparser
         try:
-            tree = lxml.html.soupparser.fromstring(response.text)
+            tree = lxml.html.soupparser.fromstring(get_body_text(response))
         except (lxml.etree.XMLSyntaxError, lxml.etree.ParserError):
             tree = None
         _TREE_CACHE[response] = tree
         return tree
 
 
+def get_xml_document(response):
+    """Return (document, error) for a response's body parsed as XML: the
+    lxml document and None, or None and the XMLSyntaxError if it wasn't
+    well-formed.
+    """
+    try:
+        return _XML_CACHE[response]
+    except KeyError:
+        import lxml.etree
+        try:
+            parsed = (
+                lxml.etree.fromstring(get_body_bytes(response)).getroottree(),
+                None,
+            )
+        except lxml.etree.XMLSyntaxError as e:
+            parsed = None, e
+        _XML_CACHE[response] = parsed
+        return parsed
+
+
+def get_xml_root_tag(response):
+    """Return the tag of the root element of a response's body, or None if
+    it doesn't start like XML.
+
+    Unless the whole body has been parsed already, only as much of it gets
+    parsed as it takes to reach the root element, so what comes after that
+    doesn't matter.
+    """
+    document = _XML_CACHE.get(response, (None, None))[0]
+    if document is not None:
+        return document.getroot().tag
+    try:
+        for _, element in ElementTree.iterparse(
+            BytesIO(get_body_bytes(response)),
+            events=('start', ),
+        ):
+            return element.tag
+    except ParseError:
+        pass
+    return None
+
+
 class Whens(object):
     Never = 'never'
     Always = 'always'
 
 
-def select_from_json(json_document, selector):
-    here = json.loads(json_document)
-    if not selector:
-        return here
-
-    # Keep track of how far into the selector we've gotten, so that if an
-    # error occurs we can report where.
-    selected = []
-    for x in selector.split('.'):
-        selected.append(x)
+def get_json_document(response):
+    """Return (document, error) for a response's body parsed as JSON: the
+    document and None, or None and the ValueError if it wasn't JSON.
+    """
+    try:
+        return _JSON_CACHE[response]
+    except KeyError:
+        body = get_body_bytes(response)
+        if six.PY3 and sys.version_info < (3, 6):
+            # json only takes bytes from 3.6 on
+            body = body.decode('utf-8')
+        try:
+            parsed = json.loads(body), None
+        except ValueError as e:
+            parsed = None, e
+        _JSON_CACHE[response] = parsed
+        return parsed
+
+
+# What _JSONStep.get returns when there's nothing to get
+_NOT_FOUND = object()
+
+
+class _JSONStep(object):
+    """One dot-separated part of a JSON selector: a key or index, "*" for
+    every key of an object or item of an array, or a slice of an array like
+    "1:3" or "-2:".
+    """
+
+    __slots__ = ('text', 'index', 'slice', 'wildcard', 'many')
+
+    def __init__(self, text):
+        self.text = text
+        self.wildcard = text == '*'
+        self.slice = None
+        self.index = None
+        if re.match(r'^-?\d*:-?\d*$', text):
+            start, stop = text.split(':')
+            self.slice = slice(
+                int(start) if start else None,
+                int(stop) if stop else None,
+            )
+        else:
+            try:
+                self.index = int(text)
+            except ValueError:
+                pass
+        self.many = self.wildcard or self.slice is not None
+
+    def get(self, here):
+        """Return the one value a step without "*" or a slice selects from
+        here, or _NOT_FOUND.
+        """
+        if isinstance(here, dict):
+            return here.get(self.text, _NOT_FOUND)
+        if isinstance(here, list) and self.index is not None:
+            if -len(here) <= self.index < len(here):
+                return here[self.index]
+        return _NOT_FOUND
+
+    def select(self, here, selected):
+        """Return a list of (key, value) for what this step selects from
+        here, with selected being the tuple of keys that led here.
+        """
+        where = lambda: '.'.join(selected + (self.text,))
         if isinstance(here, dict):
+            if self.wildcard:
+                return list(here.items())
+            if self.slice is not None:
+                raise ValueError(u'Object found at {0}'.format(where()))
             try:
-                here = here[x]
+                return [(self.text, here[self.text])]
             except KeyError:
-                raise KeyError(u'Key {0} not found'.format(
-                    '.'.join(selected)
-                ))
+                raise KeyError(u'Key {0} not found'.format(where()))
         elif isinstance(here, list):
+            if self.wildcard:
+                return [(str(i), value) for i, value in enumerate(here)]
+            if self.slice is not None:
+                indexes = range(len(here))[self.slice]
+                return [(str(i), here[i]) for i in indexes]
+            if self.index is None:
+                # The step wasn't an integer
+                raise ValueError(u'Array found at {0}'.format(where()))
             try:
-                here = here[int(x)]
+                return [(self.text, here[self.index])]
             except IndexError:
-                raise IndexError(u'Index {0} not found'.format(
-                    '.'.join(selected)
-                ))
-            except ValueError:
-                # "x" wasn't an integer
-                raise ValueError(u'Array found at {0}'.format(
-                    '.'.join(selected)
-                ))
+                raise IndexError(u'Index {0} not found'.format(where()))
         else:
             raise ValueError(
-                u'Ran out of containers to select from at {0}'.format(
-                    '.'.join(selected)
-                ))
-    return here
+                u'Ran out of containers to select from at {0}'.format(where())
+            )
+
+
+def _select_all(document, steps):
+    # Return a list of (path, value) for everything some steps select, in
+    # the order they come in the document
+    selected = [((), document)]
+    for step in steps:
+        selected = [
+            (path + (key,), value)
+            for path, here in selected
+            for key, value in step.select(here, path)
+        ]
+    return [('.'.join(path), value) for path, value in selected]
+
+
+class JSONPaths(object):
+    """JSON selectors, split into steps once, so that what every one of them
+    selects from a document can be found in one go.
 
+    A selector is dotted keys and array indexes, like data.items.0.name. A
+    part can also be "*", for every key of an object or item of an array, or
+    a slice of an array like "1:3" or "-2:", so that one selector can select
+    many values. An empty selector selects the whole document.
+    """
+
+    __slots__ = ('selectors', 'many', '_steps', '__weakref__')
+
+    def __init__(self, *selectors):
+        self.selectors = selectors
+        self._steps = tuple(
+            tuple(_JSONStep(text) for text in selector.split('.'))
+            if selector else ()
+            for selector in selectors
+        )
+        # Whether each selector can select more than one value
+        self.many = tuple(
+            any(step.many for step in steps) for steps in self._steps
+        )
 
-def parser(func):
+    def select(self, document):
+        """Return a list with an item for each selector: a list of (path,
+        value) for what it selected from the document, or the KeyError,
+        IndexError or ValueError saying why it couldn't.
+        """
+        results = []
+        for selector, steps, many in zip(
+            self.selectors,
+            self._steps,
+            self.many,
+        ):
+            if not many:
+                # Most selectors select one value, which can be got at
+                # without keeping track of the path to it
+                here = document
+                for step in steps:
+                    here = step.get(here)
+                    if here is _NOT_FOUND:
+                        break
+                else:
+                    results.append([(selector, here)])
+                    continue
+            try:
+                results.append(_select_all(document, steps))
+            except (KeyError, IndexError, ValueError) as e:
+                results.append(e)
+        return results
+
+
+def select_from_json(json_document, selector):
+    """Return what a selector selects from a JSON string: a value, or a
+    list of them if the selector has "*" or a slice in it.
+    """
+    paths = JSONPaths(selector)
+    selected = paths.select(json.loads(json_document))[0]
+    if isinstance(selected, Exception):
+        raise selected
+    if paths.many[0]:
+        return [value for _, value in selected]
+    return selected[0][1]
+
+
+# Dictionary of response: {JSONPaths: what they selected from its body}
+_JSON_SELECTIONS = weakref.WeakKeyDictionary()
+
+
+def select_from_response(response, paths):
+    """Return paths.select for a response's JSON body, selecting from each
+    body only once for each JSONPaths. Raises ValueError if the body isn't
+    JSON.
+    """
+    document, error = get_json_document(response)
+    if error is not None:
+        raise error
+    selections = _JSON_SELECTIONS.setdefault(response, {})
+    try:
+        return selections[paths]
+    except KeyError:
+        selected = selections[paths] = paths.select(document)
+        return selected
+
+
+def _json_text(value):
+    # What text matching methods get to match for a JSON value
+    if isinstance(value, six.string_types):
+        return value
+    return json.dumps(value, sort_keys=True)
+
+
+def parser(*keys, **kwargs):
     """A goofy thing to make adding more tests easier.
+
+    Decorate a function that gets tests from an element with the element
+    keys it looks for, and it only gets called for elements with at least
+    one of them. With every_element=True it gets called for every element,
+    and the keys are only there so that they aren't reported as unknown.
+
+        @parser('response_time')
+        def get_response_time_test(elem, options):
+            ...
+
+    A function decorated with plain @parser gets called for every element.
+    """
+    global _ALL_KEYS_DECLARED
+    if len(keys) == 1 and callable(keys[0]):
+        # Used without saying what it looks for
+        _ALL_KEYS_DECLARED = False
+        return parser(every_element=True)(keys[0])
+    every_element = kwargs.pop('every_element', False)
+    assert not kwargs
+    assert keys or every_element
+
+    def _parser(func):
+        # Check that the programmer is using this correctly.
+        argspec = inspect.getargspec(func)
+        assert argspec.args == ['elem', 'options']
+        assert argspec[1:] == (None, None, None)
+
+        _PARSERS.append(func)
+        for key in keys:
+            _PARSERS_BY_KEY.setdefault(key, []).append(func)
+        if every_element:
+            _PARSERS_FOR_EVERY_ELEMENT.append(func)
+        _DISPATCH.clear()
+        return func
+    return _parser
+
+
+def element_keys(*keys):
+    """Say that something other than a test parser looks for these element
+    keys, so that they aren't reported as unknown.
+    """
+    _OTHER_KEYS.update(keys)
+    _DISPATCH.clear()
+
+
+def known_element_keys():
+    """Return the element keys that test parsers or anything else look for,
+    sorted.
     """
-    # Check that the programmer is using this correctly.
-    argspec = inspect.getargspec(func)
-    assert argspec.args == ['elem', 'options']
-    assert argspec[1:] == (None, None, None)
+    return sorted(set(_PARSERS_BY_KEY).union(_OTHER_KEYS))
+
+
+def unknown_element_keys():
+    """Return the keys that elements have had that nothing looks for,
+    sorted.
+    """
+    return sorted(_UNKNOWN_KEYS)
+
+
+# (class, args): instance, for tests and text matching methods that are
+# shared by every element that asks for the same thing
+_INTERNED = weakref.WeakValueDictionary()
+_INTERNED_LOCK = threading.RLock()
 
-    _PARSERS.append(func)
-    return func
 
+def interned(class_, *args):
+    """Return class_(*args), or the one made earlier with the same arguments.
 
-@parser
+    Tests are never changed once made, so a list of a million URLs that all
+    want status 200 can share a single StatusTest.
+    """
+    # 1, 1.0 and True are equal and hash the same, but mean different
+    # things, so the types of the arguments are part of the key
+    key = (class_, ) + args + tuple(type(arg) for arg in args)
+    try:
+        hash(key)
+    except TypeError:
+        # Something like a dict of headers; make one of its own
+        return class_(*args)
+    with _INTERNED_LOCK:
+        instance = _INTERNED.get(key)
+        if instance is None:
+            instance = _INTERNED[key] = class_(*args)
+        return instance
+
+
+@parser('status', every_element=True)
 def get_status_tests(elem, options):
     # If element has a redirect test on it, just use that since it
     # requires a status anyway.
@@ -133,10 +467,10 @@ def get_status_tests(elem, options):
     except TypeError:
         code = status
 
-    return [StatusTest(code)]
+    return [interned(StatusTest, code)]
 
 
-@parser
+@parser('redirect')
 def get_redirect_tests(elem, options):
     try:
         redirect = elem['redirect']
@@ -157,10 +491,10 @@ def get_redirect_tests(elem, options):
             level=options.level,
             cachebust=False,
         )
-    return [RedirectTest(code, location, follow_redirects)]
+    return [interned(RedirectTest, code, location, follow_redirects)]
 
 
-@parser
+@parser('html')
 def get_html_tests(elem, options):
     all_html_tests = []
     for test in elem.get('html', []):
@@ -171,12 +505,14 @@ def get_html_tests(elem, options):
 
         for text_matching_methodname in TextMatchingMethod.available_methods:
             if text_matching_methodname in test:
-                text_matching_method = TextMatchingMethod(
+                text_matching_method = interned(
+                    TextMatchingMethod,
                     text_matching_methodname,
                     test[text_matching_methodname],
                 )
                 html_tests.append(
-                    HTMLTest(
+                    interned(
+                        HTMLTest,
                         selector,
                         attribute,
                         text_matching_method,
@@ -188,7 +524,8 @@ def get_html_tests(elem, options):
         # to be a test that an element does not exist.
         if not html_tests:
             html_tests.append(
-                HTMLTest(
+                interned(
+                    HTMLTest,
                     selector,
                     attribute,
                     None,
@@ -200,23 +537,31 @@ def get_html_tests(elem, options):
     return all_html_tests
 
 
-@parser
+@parser('json')
 def get_json_tests(elem, options):
     all_json_tests = []
+    # Every selector of the element gets selected in one go
+    paths = interned(
+        JSONPaths,
+        *[test['selector'] for test in elem.get('json', [])]
+    )
     for test in elem.get('json', []):
         json_tests = []
         selector = test['selector']
 
         for text_matching_methodname in TextMatchingMethod.available_methods:
             if text_matching_methodname in test:
-                text_matching_method = TextMatchingMethod(
+                text_matching_method = interned(
+                    TextMatchingMethod,
                     text_matching_methodname,
                     test[text_matching_methodname],
                 )
                 json_tests.append(
-                    JSONTest(
+                    interned(
+                        JSONTest,
                         selector,
                         text_matching_method,
+                        paths,
                     )
                 )
 
@@ -225,37 +570,40 @@ def get_json_tests(elem, options):
     return all_json_tests
 
 
-@parser
+@parser('response_time')
 def get_response_time_test(elem, options):
     if 'response_time' in elem:
         response_time_delta = datetime.timedelta(
             seconds=float(elem['response_time'])
         )
-        return ResponseTimeTest(response_time_delta)
+        return interned(ResponseTimeTest, response_time_delta)
 
 
-@parser
+@parser('xml')
 def get_xml_tests(elem, options):
     tests = []
     if 'xml' in elem:
         if 'root' in elem['xml']:
-            tests.append(XMLRootTest(elem['xml']['root']))
+            tests.append(interned(XMLRootTest, elem['xml']['root']))
         if 'dtd_filename' in elem['xml']:
-            tests.append(DTDTest(elem['xml']['dtd_filename']))
+            tests.append(interned(DTDTest, elem['xml']['dtd_filename']))
     return tests
 
 
-@parser
+@parser('json_schema')
 def get_json_schema_tests(elem, options):
     tests = []
     if 'json_schema' in elem:
         if 'schema_filename' in elem['json_schema']:
-            test = JSONSchemaTest(elem['json_schema']['schema_filename'])
+            test = interned(
+                JSONSchemaTest,
+                elem['json_schema']['schema_filename'],
+            )
             tests.append(test)
     return tests
 
 
-@parser
+@parser('headers')
 def get_header_tests(elem, options):
     all_header_tests = []
     for test in elem.get('headers', []):
@@ -264,12 +612,14 @@ def get_header_tests(elem, options):
 
         for text_matching_methodname in TextMatchingMethod.available_methods:
             if text_matching_methodname in test:
-                text_matching_method = TextMatchingMethod(
+                text_matching_method = interned(
+                    TextMatchingMethod,
                     text_matching_methodname,
                     test[text_matching_methodname],
                 )
                 header_tests.append(
-                    HeaderTest(
+                    interned(
+                        HeaderTest,
                         header,
                         text_matching_method,
                     )
@@ -280,11 +630,17 @@ def get_header_tests(elem, options):
     return all_header_tests
 
 
+# Runs of whitespace, which HTML treats as one space
+_WHITESPACE = re.compile('[' + string.whitespace + ']+')
+
+
 class TextMatchingMethod(object):
     """Wraps supported text matching methods so other stuff can be agnostic
     about it.
     """
 
+    __slots__ = ('methodname', 'text_to_match', '__weakref__')
+
     available_methods = (
         'regex', 'startswith', 'endswith', 'equals', 'contains',
     )
@@ -292,15 +648,17 @@ class TextMatchingMethod(object):
     def __init__(self, methodname, text_to_match):
         assert methodname in self.available_methods
         self.methodname = methodname
+        # Numbers and such in input files are written the way JSON would
+        text_to_match = _json_text(text_to_match)
         if text_to_match:
             # Apply HTML whitespace transform
-            text_to_match = re.sub('[' + string.whitespace + ']+', ' ', text_to_match.strip())
+            text_to_match = _WHITESPACE.sub(' ', text_to_match.strip())
         self.text_to_match = text_to_match
 
     def __call__(self, text_to_test):
         if text_to_test:
             # Apply HTML whitespace transform
-            text_to_test = re.sub('[' + string.whitespace + ']+', ' ', text_to_test.strip())
+            text_to_test = _WHITESPACE.sub(' ', text_to_test.strip())
         if self.methodname == 'regex':
             match = re.search(self.text_to_match, text_to_test)
         elif self.methodname == 'startswith':
@@ -325,6 +683,10 @@ class TextMatchingMethod(object):
 
 class TestResult(object):
 
+    # There's one of these for every test on every URL, so no __dict__.
+    # _cache is for cached_property.
+    __slots__ = ('test', 'response', '_cache')
+
     def __init__(self, test, response):
         self.test = test
         self.response = response
@@ -353,6 +715,8 @@ class TestResult(object):
 
 class AlwaysPassingTestResult(TestResult):
 
+    __slots__ = ()
+
     @property
     def description(self):
         return 'everything good because this is the result that always passes'
@@ -361,8 +725,29 @@ class AlwaysPassingTestResult(TestResult):
         return True
 
 
+class ReusedTestResult(TestResult):
+    """Verdict carried over from an earlier, identical response.
+    """
+
+    __slots__ = ('_passed', '_description')
+
+    def __init__(self, test, response, passed, description):
+        super(ReusedTestResult, self).__init__(test, response)
+        self._passed = passed
+        self._description = description
+
+    @property
+    def description(self):
+        return self._description
+
+    def __nonzero__(self):
+        return self._passed
+
+
 class HTMLTestResult(TestResult):
 
+    __slots__ = ()
+
     @property
     def description(self):
         return u'{0} {1} was: {2}'.format(
@@ -394,6 +779,7 @@ class HTMLTestResult(TestResult):
         tree = get_tree(self.response)
         if tree is None:
             return None
+        from lxml.cssselect import CSSSelector
         selector = CSSSelector(self.test.selector)
         elements = selector(tree) or [None]
         return elements[0]
@@ -426,39 +812,64 @@ class HTMLTestResult(TestResult):
 
 
 class JSONTestResult(TestResult):
+    """Passes if the selector selected something, and everything it selected
+    matched.
+    """
+
+    __slots__ = ()
 
     @property
     def description(self):
-        try:
-            string_to_test = self._get_string_to_test()
-        except (KeyError, IndexError, ValueError) as e:
+        selected, failed = self._get_results()
+        if isinstance(selected, Exception):
             return u'Error trying to find {0}: {1}'.format(
                 self.test.selector,
-                str(e),
+                str(selected),
             )
-        else:
+        if not selected:
+            return u'{0} selected nothing'.format(self.test.selector)
+        if not self.test.paths.many[self.test.index]:
             return u'{0} was {1}'.format(
                 self.test.selector,
-                string_to_test,
+                _json_text(selected[0][1]),
             )
+        if failed:
+            return u'{0} was {1}'.format(*failed[0])
+        return u'all {0} of {1} matched'.format(
+            len(selected),
+            self.test.selector,
+        )
 
     def __nonzero__(self):
-        try:
-            string_to_test = self._get_string_to_test()
-        except (KeyError, IndexError, ValueError):
-            return False
-        match = self.test.text_matching_method(string_to_test)
-        return bool(match)
-
-    def _get_string_to_test(self):
-        return select_from_json(
-            self.response.text,
-            self.test.selector
+        selected, failed = self._get_results()
+        return (
+            not isinstance(selected, Exception) and
+            bool(selected) and
+            not failed
         )
 
+    def _get_results(self):
+        # ([(path, value)] or the error, [(path, text)] that didn't match)
+        try:
+            selected = select_from_response(self.response, self.test.paths)
+        except ValueError as e:
+            # Not JSON
+            return e, []
+        selected = selected[self.test.index]
+        if isinstance(selected, Exception):
+            return selected, []
+        failed = []
+        for path, value in selected:
+            text = _json_text(value)
+            if not self.test.text_matching_method(text):
+                failed.append((path, text))
+        return selected, failed
+
 
 class StatusTestResult(TestResult):
 
+    __slots__ = ()
+
     @property
     def description(self):
         return "status code was %s" % self.response.status_code
@@ -474,6 +885,8 @@ class StatusTestResult(TestResult):
 
 class RedirectTestResult(StatusTestResult):
 
+    __slots__ = ()
+
     @property
     def description(self):
         return "status code was {0} and {1}location was {2}".format(
@@ -514,6 +927,8 @@ class RedirectTestResult(StatusTestResult):
 
 class ResponseTimeTestResult(TestResult):
 
+    __slots__ = ()
+
     # This is handled by the superclass, but included here for clarity.
     def __init__(self, test, response):
         self.test = test
@@ -529,23 +944,20 @@ class ResponseTimeTestResult(TestResult):
 
 class XMLRootTestResult(TestResult):
 
+    __slots__ = ()
+
     @property
     def description(self):
         return "tk"
 
     def __nonzero__(self):
-        try:
-            root = ElementTree.fromstring(self.response.text.encode("UTF-8"))
-            if root.tag == self.test.root:
-                return True
-            else:
-                return False
-        except ParseError:
-            return False
+        return get_xml_root_tag(self.response) == self.test.root
 
 
 class DTDTestResult(TestResult):
 
+    __slots__ = ('_error', )
+
     def __init__(self, *args, **kwargs):
         super(DTDTestResult, self).__init__(*args, **kwargs)
         self._error = None
@@ -560,12 +972,11 @@ class DTDTestResult(TestResult):
         return "Response body obeyed %s" % self.test.dtd_filename
 
     def __nonzero__(self):
+        import lxml.etree
         xmlschema = lxml.etree.DTD(self.test.dtd_filename)
-        s = BytesIO(self.response.text.encode("UTF-8"))
-        try:
-            response_doc = lxml.etree.parse(s)
-        except XMLSyntaxError as e:
-            self._error = e
+        response_doc, error = get_xml_document(self.response)
+        if error is not None:
+            self._error = error
             return False
         try:
             xmlschema.assertValid(response_doc)
@@ -577,6 +988,8 @@ class DTDTestResult(TestResult):
 
 class JSONSchemaTestResult(TestResult):
 
+    __slots__ = ('_description', )
+
     def __init__(self, *args, **kwargs):
         super(JSONSchemaTestResult, self).__init__(*args, **kwargs)
         self._description = None
@@ -601,12 +1014,12 @@ class JSONSchemaTestResult(TestResult):
                 )
                 return False
 
-        try:
-            json_response = json.loads(self.response.text)
-        except ValueError:
+        json_response, error = get_json_document(self.response)
+        if error is not None:
             self._description = 'Response body was not valid JSON'
             return False
 
+        import jsonschema
         try:
             jsonschema.validate(json_response, schema)
         except jsonschema.exceptions.ValidationError as e:
@@ -633,6 +1046,8 @@ class JSONSchemaTestResult(TestResult):
 
 class HeaderTestResult(TestResult):
 
+    __slots__ = ()
+
     @property
     def description(self):
         header = self.test.header
@@ -656,6 +1071,16 @@ class HeaderTestResult(TestResult):
 
 class AbstractTest(object):
 
+    # Tests are made for every element and shared where they can be (see
+    # interned), so they keep to their slots. Subclasses should too, and
+    # shouldn't change once made.
+    __slots__ = ('__weakref__', )
+
+    # Whether the verdict depends on nothing but the response's status,
+    # headers and body, so that it can be reused for an identical response.
+    # Only worth it for tests that have to parse the body.
+    reusable = False
+
     def get_result(self, response):
         # If I'm a StatusTest, return a StatusTestResult
         return globals()[self.__class__.__name__+'Result'](self, response)
@@ -665,6 +1090,9 @@ class AbstractTest(object):
 
 
 class StatusTest(AbstractTest):
+
+    __slots__ = ('target_code', )
+
     def __init__(self, target_code):
         self.target_code = target_code
 
@@ -675,6 +1103,8 @@ class StatusTest(AbstractTest):
 
 class RedirectTest(StatusTest):
 
+    __slots__ = ('target_location', 'follow_redirects')
+
     def __init__(self, target_code, target_location, follow_redirects):
         self.target_code = target_code
         self.target_location = target_location
@@ -691,6 +1121,8 @@ class RedirectTest(StatusTest):
 
 class ResponseTimeTest(AbstractTest):
 
+    __slots__ = ('response_time', )
+
     def __init__(self, response_time):
         self.response_time = response_time
 
@@ -701,6 +1133,10 @@ class ResponseTimeTest(AbstractTest):
 
 class XMLRootTest(AbstractTest):
 
+    __slots__ = ('root', )
+
+    reusable = True
+
     def __init__(self, root):
         self.root = root
 
@@ -711,6 +1147,10 @@ class XMLRootTest(AbstractTest):
 
 class DTDTest(AbstractTest):
 
+    __slots__ = ('dtd_filename', )
+
+    reusable = True
+
     def __init__(self, dtd_filename):
         self.dtd_filename = dtd_filename
 
@@ -721,6 +1161,10 @@ class DTDTest(AbstractTest):
 
 class HTMLTest(AbstractTest):
 
+    __slots__ = ('selector', 'attr', 'text_matching_method', 'when', 'text')
+
+    reusable = True
+
     def __init__(self, selector, attr, text_matching_method, when):
         self.selector = selector
         self.attr = attr
@@ -749,9 +1193,19 @@ class HTMLTest(AbstractTest):
 
 class JSONTest(AbstractTest):
 
-    def __init__(self, selector, text_matching_method):
+    __slots__ = ('selector', 'text_matching_method', 'paths', 'index')
+
+    reusable = True
+
+    def __init__(self, selector, text_matching_method, paths=None):
+        # paths are the JSONPaths this test's selector was compiled with,
+        # along with the other JSON tests of its element
+        if paths is None:
+            paths = interned(JSONPaths, selector)
         self.selector = selector
         self.text_matching_method = text_matching_method
+        self.paths = paths
+        self.index = paths.selectors.index(selector)
 
     @property
     def description(self):
@@ -763,6 +1217,10 @@ class JSONTest(AbstractTest):
 
 class JSONSchemaTest(AbstractTest):
 
+    __slots__ = ('schema_filename', )
+
+    reusable = True
+
     def __init__(self, schema_filename):
         self.schema_filename = schema_filename
 
@@ -773,6 +1231,8 @@ class JSONSchemaTest(AbstractTest):
 
 class HeaderTest(AbstractTest):
 
+    __slots__ = ('header', 'text_matching_method')
+
     def __init__(self, header, text_matching_method):
         self.header = header
         self.text_matching_method = text_matching_method
@@ -1,29 +1,119 @@
+import heapq
+import itertools
 import threading
-
-from smoketest.utils import chunkify
+import time
 
 
 def alive_threads(threads):
     return (t for t in threads if t.is_alive())
 
 
+class WorkQueue(object):
+    """Work shared by all the threads of a pass.
+
+    A piece of work is a callable. It can return more work to be done later
+    as a list of (delay in seconds, callable) pairs, which is how retries get
+    back in line without holding up the thread that scheduled them. The queue
+    runs dry once nothing is waiting and nothing running could add more.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._heap = []
+        # Tie-breaker so that work scheduled for the same time runs in the
+        # order it was added, and callables never get compared.
+        self._counter = itertools.count()
+        self._running = 0
+        self._held_open = False
+        self._condition = threading.Condition()
+
+    def hold_open(self):
+        """Don't run dry when out of work, because more is coming from
+        somewhere else, until close is called.
+        """
+        with self._condition:
+            self._held_open = True
+
+    def close(self):
+        with self._condition:
+            self._held_open = False
+            self._condition.notify_all()
+
+    def put(self, work, delay=0):
+        with self._condition:
+            heapq.heappush(
+                self._heap,
+                (self._clock() + delay, next(self._counter), work),
+            )
+            self._condition.notify()
+
+    def get(self, stop_event):
+        """Return the next piece of work that's ready, waiting for it if
+        needed, or None if there's nothing left to do.
+        """
+        with self._condition:
+            while not stop_event.is_set():
+                if self._heap:
+                    wait = self._heap[0][0] - self._clock()
+                    if wait <= 0:
+                        self._running += 1
+                        return heapq.heappop(self._heap)[-1]
+                elif not self._running and not self._held_open:
+                    return None
+                else:
+                    wait = None
+                # Wake up now and then to notice the stop event
+                self._condition.wait(0.1 if wait is None else min(wait, 0.1))
+            return None
+
+    def task_done(self):
+        with self._condition:
+            self._running -= 1
+            self._condition.notify_all()
+
+
 def get_threads_and_stop_event(directives, n_threads):
     stop_event = threading.Event()
+    queue = WorkQueue()
+    for directive in directives:
+        queue.put(directive.run)
     threads = []
-    for chunk in chunkify(directives, n_threads):
-        thread = threading.Thread(target=_get_runner(chunk, stop_event))
+    for _ in range(n_threads):
+        thread = threading.Thread(target=_get_runner(queue, stop_event))
         threads.append(thread)
     return threads, stop_event
 
 
-def _get_runner(directives, stop_event):
-    """Return a function that runs all the directives in the given list until
-    the stop event is set.
+def run_all(work, n_threads):
+    """Do all the work, a list of callables, on up to n_threads threads, and
+    wait for it to be done.
+    """
+    queue = WorkQueue()
+    for piece in work:
+        queue.put(piece)
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(target=_get_runner(queue, stop_event))
+        for _ in range(max(1, min(n_threads, len(work))))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _get_runner(queue, stop_event):
+    """Return a function that does work from the queue until the queue runs
+    dry or the stop event is set.
     """
     def runner():
-        for directive in directives:
-            if not stop_event.is_set():
-                directive.run()
-            else:
+        while True:
+            work = queue.get(stop_event)
+            if work is None:
                 break
+            try:
+                for delay, more_work in work() or ():
+                    queue.put(more_work, delay)
+            finally:
+                queue.task_done()
     return runner
@@ -0,0 +1,148 @@
+import threading
+import time
+
+from six.moves.urllib.parse import urlsplit
+
+from smoketest.settings import (
+    get_global_rate_limit,
+    get_host_rate_limits,
+    get_level_rate_limit,
+)
+
+
+class TokenBucket(object):
+    """Classic token bucket.
+
+    Tokens trickle in at `rate` per second, up to `burst` of them. Each
+    request takes one token. When the bucket is empty a request reserves the
+    next token anyway (driving the count negative) and is told how long to
+    wait for it, so waiting happens outside the lock and waiters are served
+    in the order they arrived.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.time):
+        rate = float(rate)
+        if rate <= 0:
+            raise ValueError('Rate limit must be positive, not {0}'.format(rate))
+        self.rate = rate
+        self.burst = float(burst) if burst else max(1.0, rate)
+        self._clock = clock
+        self._tokens = self.burst
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return the number of seconds to wait before
+        using it.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._last) * self.rate,
+            )
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class RateLimiter(object):
+    """Consults every bucket that applies to a URL before a request goes
+    out, and keeps track of how long requests were held back.
+    """
+
+    def __init__(self, buckets, host_buckets, sleep=time.sleep):
+        self.buckets = buckets
+        self.host_buckets = host_buckets
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.throttled_time = 0.0
+        self.throttled_count = 0
+
+    def wait(self, url):
+        buckets = list(self.buckets)
+        host_bucket = self.host_buckets.get(urlsplit(url).hostname)
+        if host_bucket is not None:
+            buckets.append(host_bucket)
+
+        # Every bucket has to grant a token; the slowest one decides.
+        delay = max([bucket.reserve() for bucket in buckets] or [0.0])
+        if delay > 0:
+            with self._lock:
+                self.throttled_time += delay
+                self.throttled_count += 1
+            self._sleep(delay)
+        return delay
+
+    def reset_stats(self):
+        with self._lock:
+            self.throttled_time = 0.0
+            self.throttled_count = 0
+
+
+def _bucket_from_setting(setting):
+    # A limit can be a plain number of requests per second or a dictionary
+    # with a rate and a burst size.
+    if setting is None:
+        return None
+    if isinstance(setting, dict):
+        return TokenBucket(setting['rate'], setting.get('burst'))
+    return TokenBucket(setting)
+
+
+# Buckets are shared by every worker, so build them once per process.
+_GLOBAL_BUCKET = None
+_HOST_BUCKETS = None
+_RATE_LIMITERS = {}
+_LOCK = threading.Lock()
+
+
+def get_rate_limiter(level):
+    """Return the rate limiter to use for requests at the given level, or
+    None if settings.yaml doesn't ask for any limits.
+    """
+    global _GLOBAL_BUCKET, _HOST_BUCKETS
+    try:
+        return _RATE_LIMITERS[level]
+    except KeyError:
+        pass
+
+    with _LOCK:
+        # Another thread may have made it while this one waited, and a
+        # second one would get a bucket of its own
+        if level in _RATE_LIMITERS:
+            return _RATE_LIMITERS[level]
+        if _HOST_BUCKETS is None:
+            _GLOBAL_BUCKET = _bucket_from_setting(get_global_rate_limit())
+            _HOST_BUCKETS = dict(
+                (host, _bucket_from_setting(setting))
+                for host, setting in get_host_rate_limits().items()
+            )
+
+        buckets = [
+            bucket for bucket in (
+                _GLOBAL_BUCKET,
+                _bucket_from_setting(get_level_rate_limit(level)),
+            )
+            if bucket is not None
+        ]
+        if buckets or _HOST_BUCKETS:
+            limiter = RateLimiter(buckets, _HOST_BUCKETS)
+        else:
+            limiter = None
+        _RATE_LIMITERS[level] = limiter
+        return limiter
+
+
+def get_rate_limiters():
+    return [limiter for limiter in _RATE_LIMITERS.values() if limiter]
+
+
+def clear():
+    global _GLOBAL_BUCKET, _HOST_BUCKETS
+    with _LOCK:
+        _GLOBAL_BUCKET = None
+        _HOST_BUCKETS = None
+        _RATE_LIMITERS.clear()
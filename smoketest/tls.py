@@ -0,0 +1,169 @@
+"""One SSL context for the whole process.
+
+Building a context means loading the CA store, which with a directory of
+certificates like /etc/ssl/certs/ isn't cheap, so it's done once and every
+session, thread and worker shares the result. Sharing it also means TLS
+sessions can be resumed: a connection to a host that's been connected to
+before offers the server the session from last time, skipping most of the
+handshake if the server still remembers it.
+"""
+import os
+import ssl
+import threading
+import weakref
+
+from smoketest.settings import get_ca_path
+
+
+# SSLSession and the session argument to wrap_socket came with Python 3.6
+_CAN_RESUME = hasattr(ssl, 'SSLSession')
+
+
+class _SessionKeepingSocket(ssl.SSLSocket):
+    # Hands its session back to the context before it's gone, by which time
+    # any tickets the server sent after the handshake have been read
+
+    def close(self):
+        if self.context is not None and self.server_hostname:
+            try:
+                session = self.session
+            except ValueError:
+                session = None
+            self.context._keep(self.server_hostname, session)
+        super(_SessionKeepingSocket, self).close()
+
+
+class ResumingContext(ssl.SSLContext):
+    """SSL context that resumes TLS sessions per host name and counts
+    handshakes.
+    """
+
+    def __init__(self, protocol):
+        # SSLContext takes the protocol in __new__
+        self._lock = threading.Lock()
+        # host name: session to offer the next connection
+        self._sessions = {}
+        # host name: weak reference to the latest socket. TLS 1.3 servers
+        # send session tickets after the handshake, so the session worth
+        # resuming is only known once the socket has been read from.
+        self._latest_sockets = {}
+        if _CAN_RESUME and hasattr(self, 'sslsocket_class'):
+            self.sslsocket_class = _SessionKeepingSocket
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.handshake_count = 0
+            self.resumed_count = 0
+
+    @property
+    def resumption_rate(self):
+        """The fraction of handshakes that resumed a session.
+        """
+        with self._lock:
+            if not self.handshake_count:
+                return 0.0
+            return float(self.resumed_count) / self.handshake_count
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        server_hostname = kwargs.get('server_hostname')
+        if (
+            _CAN_RESUME and server_hostname and
+            kwargs.get('session') is None
+        ):
+            kwargs['session'] = self._get_session(server_hostname)
+        ssl_sock = super(ResumingContext, self).wrap_socket(
+            sock, *args, **kwargs
+        )
+        self._record(server_hostname, ssl_sock)
+        return ssl_sock
+
+    def _get_session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            ref = self._latest_sockets.get(host)
+        latest = ref() if ref is not None else None
+        if latest is not None:
+            try:
+                newer = latest.session
+            except (AttributeError, ValueError, ssl.SSLError):
+                newer = None
+            if _better(newer, session):
+                session = newer
+                with self._lock:
+                    self._sessions[host] = session
+        return session
+
+    def _keep(self, host, session):
+        with self._lock:
+            if _better(session, self._sessions.get(host)):
+                self._sessions[host] = session
+
+    def _record(self, host, ssl_sock):
+        # Sockets that haven't done their handshake yet aren't counted
+        try:
+            if ssl_sock.version() is None:
+                return
+        except ValueError:
+            return
+        reused = bool(getattr(ssl_sock, 'session_reused', False))
+        with self._lock:
+            self.handshake_count += 1
+            self.resumed_count += int(reused)
+            if _CAN_RESUME and host:
+                self._latest_sockets[host] = weakref.ref(ssl_sock)
+                if _better(ssl_sock.session, self._sessions.get(host)):
+                    self._sessions[host] = ssl_sock.session
+
+
+def _better(session, than):
+    # A TLS 1.3 session is only worth offering once the server has sent a
+    # ticket for it, which it does after the handshake
+    if session is None:
+        return False
+    return (
+        than is None or
+        getattr(session, 'has_ticket', True) or
+        not getattr(than, 'has_ticket', False)
+    )
+
+
+def make_ssl_context(ca_path):
+    """Return a context that checks certificates against the CA file or
+    directory at ca_path, or, if ca_path is False, doesn't check them.
+    """
+    protocol = getattr(ssl, 'PROTOCOL_TLS_CLIENT', ssl.PROTOCOL_SSLv23)
+    context = ResumingContext(protocol)
+    if ca_path:
+        context.verify_mode = ssl.CERT_REQUIRED
+        context.check_hostname = True
+        if os.path.isdir(ca_path):
+            context.load_verify_locations(capath=ca_path)
+        else:
+            context.load_verify_locations(cafile=ca_path)
+    else:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+# Built from the settings the first time it's needed
+_SSL_CONTEXT = None
+_SSL_CONTEXT_LOCK = threading.Lock()
+
+
+def get_ssl_context():
+    """Return the process's SSL context, building it from the settings'
+    ca_path if this is the first time.
+    """
+    global _SSL_CONTEXT
+    with _SSL_CONTEXT_LOCK:
+        if _SSL_CONTEXT is None:
+            _SSL_CONTEXT = make_ssl_context(get_ca_path())
+        return _SSL_CONTEXT
+
+
+def clear():
+    global _SSL_CONTEXT
+    with _SSL_CONTEXT_LOCK:
+        _SSL_CONTEXT = None
@@ -0,0 +1,386 @@
+"""Ways of making HTTP requests.
+
+A transport hands out sessions, which is what directives make their requests
+with. The default one uses requests, so HTTP/1.1 with one request at a time
+per connection. The "http2" one uses httpx, if it's installed, to send many
+requests at once over each connection to a host that speaks HTTP/2.
+
+Transports count the connections they open and the requests they make, so
+that they can be compared.
+"""
+from collections import OrderedDict
+import functools
+import importlib
+import socket
+import threading
+
+from six.moves.urllib.parse import urlsplit
+
+from smoketest.plugins import get_plugin_registry
+from smoketest.threads import run_all
+from smoketest.tls import get_ssl_context
+
+
+def _import_httpx():
+    # Only needed for the http2 transport, so only imported by it. httpx
+    # only needs h2 once it's asked for HTTP/2, so check for that too.
+    try:
+        importlib.import_module('h2')
+        import httpx
+    except ImportError:
+        return None
+    return httpx
+
+
+_TRANSPORT_CLASSES = OrderedDict()
+
+
+def select_with_key(key):
+    """Decorator to make a transport class selectable by the user with the
+    given key.
+    """
+    def _transport(class_):
+        _TRANSPORT_CLASSES[key] = class_
+        return class_
+    return _transport
+
+
+def transport_keys():
+    return list(_TRANSPORT_CLASSES)
+
+
+class TransportUnavailable(Exception):
+    pass
+
+
+def request_errors():
+    """Return the exceptions that sessions raise when a request goes wrong.
+
+    Meant to be called in an except clause, which only happens when
+    something has been raised, so that requests isn't imported until then.
+    """
+    from requests.exceptions import RequestException
+    return (RequestException, socket.timeout)
+
+
+class _Stats(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connection_count = 0
+            self.request_count = 0
+            self.multiplexed_count = 0
+
+    def add(self, connections=0, requests=0, multiplexed=0):
+        with self._lock:
+            self.connection_count += connections
+            self.request_count += requests
+            self.multiplexed_count += multiplexed
+
+
+class Transport(object):
+    """Base class for transports.
+    """
+
+    def __init__(self):
+        self.stats = _Stats()
+
+    def new_session(self, private=False):
+        """Return a session to make requests with.
+
+        A private session has its own cookies and credentials; otherwise a
+        transport may hand out sessions that share connections.
+        """
+        raise NotImplementedError
+
+    def share_connections(self, pool_size):
+        """Have sessions that aren't private share connections, keeping up
+        to pool_size of them open per host.
+        """
+
+    def warm_up(self, origins, connections, n_threads):
+        """Open and handshake connections to each origin (scheme, host and
+        port) ahead of time, `connections` per origin, n_threads at a time.
+
+        Returns the number of connections opened. Origins that can't be
+        reached are left for the requests to report.
+        """
+        def warm_up(origin):
+            try:
+                self._warm_up(origin, connections)
+            except Exception:
+                pass
+
+        before = self.stats.connection_count
+        run_all(
+            [functools.partial(warm_up, origin) for origin in origins],
+            n_threads,
+        )
+        return self.stats.connection_count - before
+
+    def _warm_up(self, origin, connections):
+        raise NotImplementedError
+
+    def summary(self):
+        """Return an OrderedDict of lines to add to the pass summary.
+        """
+        return OrderedDict([
+            ('Number of connections opened', self.stats.connection_count),
+            ('Number of requests', self.stats.request_count),
+        ])
+
+    def close(self):
+        pass
+
+
+@select_with_key('requests')
+class RequestsTransport(Transport):
+    """HTTP/1.1 through requests. Every directive gets a session, and so a
+    connection pool, of its own, unless share_connections is called.
+    """
+
+    def __init__(self):
+        super(RequestsTransport, self).__init__()
+        self._shared_adapter = None
+
+    def share_connections(self, pool_size):
+        from smoketest.adapters import SharedAdapter
+        self._shared_adapter = SharedAdapter(
+            self.stats,
+            pool_maxsize=pool_size,
+        )
+
+    def new_session(self, private=False):
+        import requests
+        from smoketest.adapters import CountingAdapter
+        session = requests.Session()
+        if self._shared_adapter is not None and not private:
+            adapter = self._shared_adapter
+        else:
+            adapter = CountingAdapter(self.stats)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _warm_up(self, origin, connections):
+        if self._shared_adapter is None:
+            # Nobody would get to use the connections
+            return
+        from smoketest.adapters import connect
+        pool = self._shared_adapter.get_pool(origin)
+        taken = []
+        try:
+            for _ in range(connections):
+                taken.append(pool._get_conn())
+            # Handshakes take a while, so do them all at once
+            run_all(
+                [functools.partial(connect, c) for c in taken],
+                connections,
+            )
+        finally:
+            for connection in taken:
+                pool._put_conn(connection)
+
+    def close(self):
+        if self._shared_adapter is not None:
+            self._shared_adapter.really_close()
+            self._shared_adapter = None
+
+
+class _Http2Response(object):
+    """An httpx response that looks enough like a requests one for tests
+    and loggers.
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self.url = str(response.url)
+        self.history = [_Http2Response(r) for r in response.history]
+        self.http_version = response.http_version
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class _Http2Session(object):
+    """Session over an httpx client, with the parts of the requests.Session
+    interface that directives use.
+    """
+
+    def __init__(self, transport, client, shared):
+        self._transport = transport
+        self._client = client
+        self._shared = shared
+        self.headers = client.headers
+        self.cookies = client.cookies
+
+    @property
+    def auth(self):
+        return self._client.auth
+
+    @auth.setter
+    def auth(self, auth):
+        self._client.auth = auth
+
+    def _request(self, method, url, **kwargs):
+        httpx = self._transport.httpx
+        try:
+            response = self._client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            # Raise what requests would have, which is what callers expect
+            from requests.exceptions import (
+                ConnectionError,
+                RequestException,
+                Timeout,
+            )
+            if isinstance(e, httpx.TimeoutException):
+                raise Timeout(e)
+            if isinstance(e, httpx.TransportError):
+                raise ConnectionError(e)
+            raise RequestException(e)
+        self._transport.count(response)
+        return _Http2Response(response)
+
+    def get(self, url, verify=None, allow_redirects=True, timeout=None,
+            headers=None):
+        # Certificates are checked the same way for every request, when the
+        # client is made, so verify is ignored here
+        return self._request(
+            'GET',
+            url,
+            follow_redirects=allow_redirects,
+            timeout=timeout,
+            headers=headers,
+        )
+
+    def post(self, url, data=None, verify=None):
+        return self._request('POST', url, data=data)
+
+    def head(self, url):
+        return self._request('HEAD', url)
+
+    def close(self):
+        # Closing a client closes its transport, which for shared sessions
+        # is the transport's to close
+        if not self._shared:
+            self._client.close()
+
+
+@select_with_key('http2')
+class Http2Transport(Transport):
+    """HTTP/2 through httpx, where servers support it, falling back to
+    HTTP/1.1 where they don't. The protocol is negotiated with ALPN.
+
+    Every session has a client, and so cookies, of its own, but those that
+    aren't private all send their requests through one httpx transport, so
+    requests to the same host from every thread go over one connection as
+    separate streams.
+    """
+
+    def __init__(self):
+        self.httpx = _import_httpx()
+        if self.httpx is None:
+            raise TransportUnavailable(
+                'The http2 transport needs httpx and h2; '
+                'pip install httpx[http2]'
+            )
+        super(Http2Transport, self).__init__()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._shared_transport = None
+
+    def new_session(self, private=False):
+        if private:
+            client = self.httpx.Client(http2=True, verify=get_ssl_context())
+            return _Http2Session(self, client, shared=False)
+        with self._lock:
+            if self._shared_transport is None:
+                self._shared_transport = self.httpx.HTTPTransport(
+                    http2=True,
+                    verify=get_ssl_context(),
+                )
+        client = self.httpx.Client(transport=self._shared_transport)
+        return _Http2Session(self, client, shared=True)
+
+    def _warm_up(self, origin, connections):
+        # There's no way to just open a connection with httpx, so make a
+        # request. Over HTTP/2 that one connection is all a host needs.
+        self.new_session().head(origin + '/')
+
+    def count(self, response):
+        # Each connection has its own network stream, so new streams mean
+        # new connections
+        multiplexed = int(response.http_version == 'HTTP/2')
+        stream = response.extensions.get('network_stream')
+        with self._lock:
+            new_connection = (
+                stream is not None and stream not in self._connections
+            )
+            if new_connection:
+                self._connections.add(stream)
+        self.stats.add(
+            connections=int(new_connection),
+            requests=1,
+            multiplexed=multiplexed,
+        )
+
+    def summary(self):
+        summary = super(Http2Transport, self).summary()
+        summary['Number of HTTP/2 streams'] = self.stats.multiplexed_count
+        return summary
+
+    def close(self):
+        with self._lock:
+            if self._shared_transport is not None:
+                self._shared_transport.close()
+                self._shared_transport = None
+            self._connections.clear()
+
+
+# Poor man's singleton, like the logger. Set up by use_transport.
+_TRANSPORT_IN_USE = None
+
+
+def use_transport(key):
+    global _TRANSPORT_IN_USE
+    if key not in _TRANSPORT_CLASSES:
+        get_plugin_registry().load('transports', key)
+    _TRANSPORT_IN_USE = _TRANSPORT_CLASSES[key]()
+    return _TRANSPORT_IN_USE
+
+
+def get_transport():
+    """Return the transport for this run, which is requests unless
+    use_transport picked another.
+    """
+    global _TRANSPORT_IN_USE
+    if _TRANSPORT_IN_USE is None:
+        _TRANSPORT_IN_USE = RequestsTransport()
+    return _TRANSPORT_IN_USE
+
+
+def clear():
+    global _TRANSPORT_IN_USE
+    if _TRANSPORT_IN_USE is not None:
+        _TRANSPORT_IN_USE.close()
+    _TRANSPORT_IN_USE = None
+
+
+def get_origins(directives):
+    """Return the distinct scheme://host:port origins of the directives'
+    URLs.
+    """
+    origins = set()
+    for directive in directives:
+        for url in getattr(directive, 'urls', ()):
+            parts = urlsplit(url)
+            if parts.scheme and parts.netloc:
+                origins.add('{0}://{1}'.format(
+                    parts.scheme,
+                    parts.netloc.rpartition('@')[2],
+                ))
+    return sorted(origins)
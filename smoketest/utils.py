@@ -1,4 +1,6 @@
 import functools
+import hashlib
+import re
 import time
 from six.moves.urllib.parse import (
     parse_qsl,
@@ -7,6 +9,7 @@ from six.moves.urllib.parse import (
     urlunsplit,
 )
 
+from smoketest.bodies import get_body_bytes
 from smoketest.settings import (
     get_special_cases_url_transforms,
     get_level_token,
@@ -14,10 +17,153 @@ from smoketest.settings import (
 
 CACHEBUST_KEY = '_'
 
+# Response headers that go into a response's fingerprint
+FINGERPRINT_HEADERS = ('content-type', 'location')
+
 
 def transform_url_based_on_options(url, options):
-    return transform_url(
-        url,
+    return get_url_transformer_based_on_options(options)(url)
+
+
+def transform_url(url, scheme=None, port=None, level=None, cachebust=None):
+    return get_url_transformer(scheme, port, level, cachebust)(url)
+
+
+def _split(url):
+    # urlsplit, for the everyday http(s)://host/path?query#fragment without
+    # the whitespace and IPv6 handling it needs to do for anything else
+    if url.startswith('http://'):
+        netloc_start = 7
+    elif url.startswith('https://'):
+        netloc_start = 8
+    else:
+        return list(urlsplit(url))
+    if '\t' in url or '\r' in url or '\n' in url or '[' in url:
+        return list(urlsplit(url))
+    query = fragment = ''
+    if '#' in url:
+        url, fragment = url.split('#', 1)
+    if '?' in url:
+        url, query = url.split('?', 1)
+    path_start = url.find('/', netloc_start)
+    if path_start == -1:
+        path_start = len(url)
+    return [
+        url[:netloc_start - 3],
+        url[netloc_start:path_start],
+        url[path_start:],
+        query,
+        fragment,
+    ]
+
+
+def _join(parts):
+    # urlunsplit, for when there's a host
+    scheme, netloc, path, query, fragment = parts
+    if not (scheme and netloc):
+        return urlunsplit(parts)
+    if path and path[0] != '/':
+        path = '/' + path
+    url = scheme + '://' + netloc + path
+    if query:
+        url += '?' + query
+    if fragment:
+        url += '#' + fragment
+    return url
+
+
+# Most URLs in a run share a few hosts, so UrlTransformers remember at most
+# this many hosts' worth of port and level rewriting
+_MAX_REMEMBERED_HOSTS = 10000
+
+
+class UrlTransformer(object):
+    """transform_url with its arguments and the settings it uses worked out
+    once, for transforming lots of URLs.
+
+    The port and level only change the host, unless the level token is in
+    the path, so what they make of each host is remembered.
+    """
+
+    def __init__(self, scheme=None, port=None, level=None, cachebust=None):
+        self.scheme = scheme
+        self.port = port
+        self.level = level
+        self.cachebust = cachebust
+        self._level_token = get_level_token()
+        self._special_cases_setting = get_special_cases_url_transforms()
+        self.special_cases = Replacements(self._special_cases_setting)
+        # host: host with the port and level applied
+        self._netlocs = {}
+
+    def is_current(self):
+        """Whether the settings it was made with are still the settings.
+        """
+        # Without the setting, the settings give a new {} every time, so
+        # equal special cases count as the same
+        special_cases = get_special_cases_url_transforms()
+        return (
+            self._level_token == get_level_token() and (
+                self._special_cases_setting is special_cases or
+                self._special_cases_setting == special_cases
+            )
+        )
+
+    def __call__(self, url):
+        parts = _split(url)
+        if self.scheme:
+            parts[0] = self.scheme
+        netloc, path = parts[1], parts[2]
+        token = self._level_token
+        if self.level and token and (
+                token in path or
+                token not in netloc and token in netloc + path):
+            # The path needs the level too
+            if self.port:
+                parts = port_transform(parts, self.port)
+            parts = level_transform(parts, self.level, token)
+        else:
+            try:
+                parts[1] = self._netlocs[netloc]
+            except KeyError:
+                parts[1] = self._transform_netloc(netloc)
+        if self.cachebust:
+            parts = cachebust_transform(parts)
+        return self.special_cases(_join(parts))
+
+    def transform_all(self, urls):
+        """Return a list of the URLs transformed.
+        """
+        return [self(url) for url in urls]
+
+    def _transform_netloc(self, netloc):
+        parts = ['', netloc, '', '', '']
+        if self.port:
+            parts = port_transform(parts, self.port)
+        if self.level:
+            parts = level_transform(parts, self.level, self._level_token)
+        if len(self._netlocs) < _MAX_REMEMBERED_HOSTS:
+            self._netlocs[netloc] = parts[1]
+        return parts[1]
+
+
+# (scheme, port, level, cachebust): UrlTransformer
+_URL_TRANSFORMERS = {}
+
+
+def get_url_transformer(scheme=None, port=None, level=None, cachebust=None):
+    """Return a UrlTransformer for the arguments, made once and kept for as
+    long as the settings don't change.
+    """
+    key = (scheme, port, level, cachebust)
+    transformer = _URL_TRANSFORMERS.get(key)
+    if transformer is None or not transformer.is_current():
+        transformer = _URL_TRANSFORMERS[key] = UrlTransformer(*key)
+    return transformer
+
+
+def get_url_transformer_based_on_options(options):
+    return get_url_transformer(
         scheme=options.scheme,
         port=options.port,
         level=options.level,
@@ -25,29 +171,17 @@ def transform_url_based_on_options(url, options):
     )
 
 
-def transform_url(url, scheme=None, port=None, level=None, cachebust=None):
-    parts = list(urlsplit(url))
-    if scheme:
-        parts[0] = scheme
-    if port:
-        parts = port_transform(parts, port)
-    if level:
-        parts = level_transform(parts, level)
-    if cachebust:
-        parts = cachebust_transform(parts)
-    url = urlunsplit(parts)
-    url = special_cases_transforms(url)
-    return url
-
-
-def level_transform(parts, level):
+def level_transform(parts, level, level_token=None):
     """Transform the first subdomain according to our habits, normally.
     www.usnews.com => www-level.usnews.com
 
     Can also be used for a more general replacements, see the docs:
     {LEVEL}www.usnews.com => level-www.usnews.com
+
+    The level token comes from the settings unless it's given.
     """
-    level_token = get_level_token()
+    if level_token is None:
+        level_token = get_level_token()
 
     if level_token and level_token in parts[1] + parts[2]:
         host, path = parts[1], parts[2]
@@ -98,12 +232,64 @@ def cachebust_transform(parts):
     return parts
 
 
+def _trie_pattern(node):
+    # A regular expression for the strings in a trie, longest first, so that
+    # the regular expression engine can follow one branch rather than trying
+    # every string in turn
+    branches = [
+        re.escape(char) + _trie_pattern(child)
+        for char, child in sorted(node.items())
+        if char
+    ]
+    if not branches:
+        return ''
+    if len(branches) == 1 and '' not in node:
+        return branches[0]
+    pattern = '(?:{0})'.format('|'.join(branches))
+    if '' in node:
+        # A string ends here too; it only wins if nothing longer matches
+        pattern += '?'
+    return pattern
+
+
+class Replacements(object):
+    """Replaces whichever of a dictionary's keys turn up in a string with
+    their values, all in one pass.
+
+    The string is scanned once from left to right. Where more than one key
+    matches at the same place, the longest one wins. What's been put in
+    isn't looked at again, so one replacement never feeds another, and the
+    order of the dictionary doesn't matter.
+    """
+
+    def __init__(self, replacements):
+        # An empty key would match everywhere, so it's left out
+        self._replacements = dict(
+            (key, value) for key, value in replacements.items() if key
+        )
+        self._pattern = None
+        if self._replacements:
+            trie = {}
+            for key in self._replacements:
+                node = trie
+                for char in key:
+                    node = node.setdefault(char, {})
+                node[''] = {}
+            self._pattern = re.compile(_trie_pattern(trie))
+
+    def _replace(self, match):
+        return self._replacements[match.group(0)]
+
+    def __call__(self, string):
+        if self._pattern is None:
+            return string
+        return self._pattern.sub(self._replace, string)
+
+
 def special_cases_transforms(url):
     """Apply special cases URL replacements dictated by settings.
     """
-    for x, y in get_special_cases_url_transforms().items():
-        url = url.replace(x, y)
-    return url
+    return get_url_transformer().special_cases(url)
 
 
 def uncachebust(url):
@@ -118,6 +304,24 @@ def uncachebust(url):
     return urlunsplit(new_parts)
 
 
+def fingerprint_response(response, headers=FINGERPRINT_HEADERS):
+    """Return a hash of the status code, the given headers and the body of a
+    response.
+
+    Cachebusters are dropped from the location header, since they change on
+    every request.
+    """
+    digest = hashlib.sha1()
+    digest.update(str(response.status_code).encode('utf-8'))
+    for header in headers:
+        value = response.headers.get(header) or ''
+        if header == 'location' and value:
+            value = uncachebust(value)
+        digest.update(b'\0' + value.encode('utf-8'))
+    digest.update(b'\0' + get_body_bytes(response))
+    return digest.hexdigest()
+
+
 def chunkify(seq, n):
     """Split seq into n roughly equally sized lists.
 
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from mock import (
+    Mock,
+    PropertyMock,
+    patch,
+)
+
+
+def make_response(content, content_type):
+    from requests.models import Response
+    response = Response()
+    response._content = content
+    response.headers['Content-Type'] = content_type
+    return response
+
+
+class TestBodies(unittest.TestCase):
+
+    def test_charset_from_content_type(self):
+        from smoketest.bodies import (
+            get_body_text,
+            get_charset,
+        )
+        response = make_response(
+            u'caf\xe9'.encode('latin-1'),
+            'text/plain; charset="ISO-8859-1"',
+        )
+        self.assertEqual(get_charset(response), 'iso8859-1')
+        self.assertEqual(get_body_text(response), u'caf\xe9')
+
+    def test_charset_from_meta_tag(self):
+        from smoketest.bodies import get_body_text
+        response = make_response(
+            u'<html><head><meta charset="windows-1252"></head>'
+            u'<body>“hi”</body></html>'.encode('windows-1252'),
+            'text/html',
+        )
+        self.assertIn(u'“hi”', get_body_text(response))
+
+    def test_no_guessing(self):
+        from smoketest.bodies import (
+            get_body_text,
+            get_charset,
+        )
+        response = make_response(b'caf\xc3\xa9 \xff', 'application/json')
+        guess = PropertyMock(side_effect=AssertionError('guessed'))
+        with patch.object(type(response), 'apparent_encoding', guess):
+            self.assertIsNone(get_charset(response))
+            self.assertEqual(get_body_text(response), u'caf\xe9 �')
+
+        # Unknown character sets are as good as none
+        response = make_response(b'caf\xc3\xa9', 'text/html; charset=bogus')
+        self.assertEqual(get_body_text(response), u'caf\xe9')
+
+    def test_responses_with_only_text(self):
+        from smoketest.bodies import (
+            get_body_bytes,
+            get_body_text,
+        )
+        response = Mock()
+        response.text = u'caf\xe9'
+        self.assertEqual(get_body_bytes(response), b'caf\xc3\xa9')
+        self.assertEqual(get_body_text(response), u'caf\xe9')
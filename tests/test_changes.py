@@ -0,0 +1,78 @@
+import unittest
+
+from mock import (
+    MagicMock,
+    Mock,
+)
+
+
+def _response(body):
+    response = Mock()
+    response.status_code = 200
+    response.headers = {'content-type': 'text/html'}
+    response.content = body
+    return response
+
+
+class TestVerdictCache(unittest.TestCase):
+
+    def test_get_and_put(self):
+        from smoketest.changes import VerdictCache
+        from smoketest.platforms import Desktop
+        cache = VerdictCache()
+        test = Mock()
+        fingerprint = cache.fingerprint(_response(b'<h1>hi</h1>'))
+
+        cache.put('http://a.com/?_=1', Desktop, fingerprint, {test: (True, 'ok')})
+        self.assertEqual(
+            cache.get('http://a.com/?_=2', Desktop, fingerprint),
+            {test: (True, 'ok')},
+        )
+
+        changed = cache.fingerprint(_response(b'<h1>bye</h1>'))
+        self.assertEqual(cache.get('http://a.com/', Desktop, changed), {})
+
+
+class TestChangeDetection(unittest.TestCase):
+
+    def setUp(self):
+        from smoketest.changes import enable_change_detection
+        self.cache = enable_change_detection()
+
+    def tearDown(self):
+        from smoketest.changes import clear
+        clear()
+
+    def test_unchanged_response_is_not_retested(self):
+        from smoketest.directives import CheckDirective
+        from smoketest.platforms import Desktop
+        from smoketest.tests import StatusTest
+
+        options = Mock()
+        options.scheme = None
+        options.port = ''
+        options.level = 'live'
+        options.cachebust = False
+        options.dry_run = False
+        directive = CheckDirective({'url': 'http://www.usnews.com'}, options)
+        directive.logger = Mock()
+        body_test = Mock()
+        body_test.reusable = True
+        body_test.get_result.return_value.description = 'h1 was hi'
+        directive.tests = [StatusTest('200'), body_test]
+        directive.get_response = MagicMock(
+            return_value=_response(b'<h1>hi</h1>'),
+        )
+
+        directive._run_unit('http://www.usnews.com', Desktop)
+        directive._run_unit('http://www.usnews.com', Desktop)
+        self.assertEqual(body_test.get_result.call_count, 1)
+        self.assertEqual(self.cache.reused_count, 1)
+
+        result = directive.logger.log_test_result.call_args[0][2]
+        self.assertEqual(result.description, 'h1 was hi')
+        self.assertTrue(result)
+
+        directive.get_response.return_value = _response(b'<h1>bye</h1>')
+        directive._run_unit('http://www.usnews.com', Desktop)
+        self.assertEqual(body_test.get_result.call_count, 2)
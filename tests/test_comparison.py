@@ -0,0 +1,129 @@
+import json
+import unittest
+
+from mock import (
+    Mock,
+    patch,
+)
+
+
+def _response(body, content_type='text/html', status_code=200):
+    response = Mock()
+    response.status_code = status_code
+    response.headers = {'Content-Type': content_type}
+    response.content = body.encode('utf-8')
+    return response
+
+
+PAGE = u'''<html><body>
+<h1>Best  Colleges</h1>
+<div id="ad">{0}</div>
+<p class="rank">{1}</p>
+</body></html>'''
+
+
+class TestCompareResponses(unittest.TestCase):
+
+    def test_same_bytes_are_not_parsed(self):
+        from smoketest.comparison import compare_responses
+        with patch('smoketest.comparison.normalise') as normalise:
+            differences, normalised = compare_responses(
+                _response(PAGE.format('a', 1)),
+                _response(PAGE.format('a', 1)),
+            )
+        self.assertEqual(differences, [])
+        self.assertFalse(normalised)
+        self.assertFalse(normalise.called)
+
+    def test_ignored_html_and_whitespace(self):
+        from smoketest.comparison import compare_responses
+        differences, normalised = compare_responses(
+            _response(PAGE.format('ad one', 1)),
+            _response(PAGE.format('ad two', 1).replace('  ', ' ')),
+            ignore=['#ad'],
+        )
+        self.assertEqual(differences, [])
+        self.assertTrue(normalised)
+
+    def test_html_differences(self):
+        from smoketest.comparison import compare_responses
+        differences, _ = compare_responses(
+            _response(PAGE.format('a', 1)),
+            _response(PAGE.format('a', 2), status_code=404),
+            labels=('live', 'stag'),
+        )
+        self.assertEqual(differences[0], 'status: 200 != 404')
+        self.assertEqual(differences[1], 'body:')
+        self.assertIn('    --- live', differences)
+        self.assertIn('    -    <p class="rank"> 1', differences)
+        self.assertIn('    +    <p class="rank"> 2', differences)
+
+    def test_ignored_json(self):
+        from smoketest.comparison import compare_responses
+
+        def response(generated, name):
+            return _response(json.dumps({
+                'meta': {'generated': generated},
+                'items': [{'name': name, 'id': 1}, {'id': 2, 'name': name}],
+            }), 'application/json')
+
+        differences, _ = compare_responses(
+            response(1, 'a'), response(2, 'b'),
+            ignore=['meta.generated', 'items.*.name'],
+        )
+        self.assertEqual(differences, [])
+        differences, _ = compare_responses(
+            response(1, 'a'), response(2, 'b'), ignore=['meta'],
+        )
+        self.assertEqual(differences[0], 'body:')
+
+    def test_json_paths_are_not_used_for_html(self):
+        from smoketest.comparison import compare_responses
+        differences, normalised = compare_responses(
+            _response(PAGE.format('a', 1)),
+            _response(PAGE.format('b', 1)),
+            ignore=['items.*.name', '#ad'],
+        )
+        self.assertEqual(differences, [])
+        self.assertTrue(normalised)
+
+    def test_headers(self):
+        from smoketest.comparison import compare_responses
+        differences, _ = compare_responses(
+            _response('{}', 'application/json'),
+            _response('{}', 'text/plain'),
+        )
+        self.assertEqual(
+            differences,
+            ['header Content-Type: application/json != text/plain'],
+        )
+
+
+class TestComparison(unittest.TestCase):
+
+    def test_pairs_urls_across_levels(self):
+        from smoketest import parse_args
+        from smoketest.comparison import Comparison
+        from smoketest.directives import CheckDirective
+        options = parse_args(
+            ['input.txt', '--level=live,stag', '--no-cachebust'],
+        )
+        options.level = 'live'
+        directive = CheckDirective({'url': 'http://www.usnews.com/'}, options)
+
+        def get_response(self, url, extra_headers):
+            return _response(PAGE.format('a', url))
+
+        comparison = Comparison([directive], options)
+        with patch.object(CheckDirective, 'get_response', get_response), \
+                patch('smoketest.comparison.get_session'):
+            comparison.run(2)
+        self.assertEqual(list(comparison.differences), [(
+            'http://www.usnews.com/',
+            'http://www-stag.usnews.com/',
+            'desktop',
+        )])
+        lines = []
+        comparison.report(lines.append)
+        self.assertEqual(lines[0], 'Comparing live with stag')
+        self.assertIn('Number of URLs different: 1', lines)
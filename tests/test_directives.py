@@ -6,6 +6,7 @@ import unittest
 from mock import (
     MagicMock,
     Mock,
+    patch,
 )
 
 
@@ -92,6 +93,67 @@ class TestFileParser(unittest.TestCase):
         for f in self._temporary_files:
             os.unlink(f.name)
 
+    def test_directives_for_several_levels(self):
+        from smoketest import (
+            _load_directives,
+            parse_args,
+        )
+
+        json_file = self._create_file('.json')
+        json_file.write(json.dumps([
+            {
+                'directive': 'check',
+                'url': 'http://www.usnews.com/a',
+            },
+            {
+                'directive': 'check',
+                'url': 'http://www.usnews.com/b',
+                'only_levels': ['stag'],
+            },
+        ]))
+        json_file.close()
+        args = parse_args([
+            json_file.name, '--level', 'live,stag', '--no-cachebust', '-t', '2',
+        ])
+        self.assertEqual(args.levels, ['live', 'stag'])
+        self.assertEqual(args.threads, 4)
+        directives = _load_directives(args)
+        self.assertEqual(
+            [(d.options.level, d.urls) for d in directives],
+            [
+                ('live', ['http://www.usnews.com/a']),
+                ('stag', ['http://www-stag.usnews.com/a']),
+                ('stag', ['http://www-stag.usnews.com/b']),
+            ],
+        )
+
+    def test_generate_directives_from_input_slices(self):
+        from smoketest import parse_args
+        from smoketest.directives import (
+            FileParser,
+            InputFileError,
+        )
+
+        txt_file = self._create_file('.txt')
+        for i in range(10):
+            txt_file.write('http://www.usnews.com/{0}\n'.format(i))
+        txt_file.close()
+        options = parse_args([txt_file.name, '--no-cachebust'])
+        urls = []
+        for index in range(1, 4):
+            FileParser._visited_files = set()
+            parser = FileParser(txt_file.name, options, (index, 3))
+            directives = list(parser.generate_directives())
+            self.assertTrue(directives)
+            urls.extend(d.urls[0] for d in directives)
+        self.assertEqual(
+            urls,
+            ['http://www.usnews.com/{0}'.format(i) for i in range(10)],
+        )
+
+        parser = FileParser('input.json', options, (1, 3))
+        self.assertRaises(InputFileError, parser.generate_directives)
+
     def test_generate_directives_only_levels(self):
         from smoketest.directives import FileParser
 
@@ -214,6 +276,24 @@ class TestFileParser(unittest.TestCase):
             generate_directives_from_file('fake.yaml', None),
         )
 
+    def test_generate_directives_from_non_utf8_list(self):
+        from smoketest.directives import (
+            InputFileError,
+            generate_directives_from_file,
+        )
+        latin1_file = self._create_file('.txt')
+        latin1_file.close()
+        with open(latin1_file.name, 'wb') as f:
+            f.write(b'http://www.usnews.com/caf\xe9\n')
+
+        try:
+            next(generate_directives_from_file(latin1_file.name, None))
+        except InputFileError as e:
+            self.assertEqual(e.filename, latin1_file.name)
+            self.assertIn('Byte 25 is not UTF-8', str(e))
+        else:
+            assert False, 'No exception was raised!'
+
     def test_generate_directives_from_invalid_yaml_file(self):
         from smoketest.directives import (
             InputFileError,
@@ -229,6 +309,27 @@ class TestFileParser(unittest.TestCase):
             generate_directives_from_file(invalid_yaml_file.name, None)
         )
 
+    def test_generate_directives_with_bad_element_values(self):
+        from smoketest import parse_args
+        from smoketest.directives import (
+            InputFileError,
+            generate_directives_from_file,
+        )
+        bad_retry_file = self._create_file('.yaml')
+        bad_retry_file.write(
+            '- directive: check\n'
+            '  url: http://www.usnews.com\n'
+            '  retry: {attempt: 3}\n'
+        )
+        bad_retry_file.close()
+        options = parse_args([bad_retry_file.name])
+
+        self.assertRaises(
+            InputFileError,
+            list,
+            generate_directives_from_file(bad_retry_file.name, options)
+        )
+
     def test_generate_directives_from_invalid_json_file(self):
         from smoketest.directives import (
             InputFileError,
@@ -439,6 +540,150 @@ class TestDirectives(unittest.TestCase):
             platform.headers,
         )
 
+    def test_run_retries_transient_errors(self):
+        from requests.exceptions import ConnectionError
+        from smoketest.directives import CheckDirective
+        from smoketest.platforms import Desktop
+
+        elem = {
+            'url': 'http://www.usnews.com',
+            'retry': {'attempts': 2},
+        }
+        options = Mock()
+        options.scheme = None
+        options.port = ''
+        options.level = 'live'
+        options.cachebust = False
+        options.dry_run = False
+        directive = CheckDirective(elem, options)
+        directive.logger = Mock()
+        directive.platforms = [Desktop]
+        test = Mock()
+        directive.tests = [test]
+        response = Mock()
+        directive.get_response = MagicMock(
+            side_effect=[ConnectionError(), response]
+        )
+
+        # The first attempt doesn't log anything, but hands back a retry
+        retries = directive.run()
+        self.assertEqual(len(retries), 1)
+        self.assertFalse(directive.logger.log_error.called)
+
+        delay, retry = retries[0]
+        self.assertEqual(retry(), [])
+        directive.logger.log_test_result.assert_called_once_with(
+            'http://www.usnews.com',
+            test,
+            test.get_result.return_value,
+            response,
+            Desktop,
+            False,
+        )
+        self.assertFalse(directive.failed)
+        self.assertEqual(directive.urls, [])
+
+    def test_sharded_directives_skip_recently_passed(self):
+        from smoketest import parse_args
+        from smoketest.directives import generate_directives_from_file
+        from smoketest.sharding import (
+            make_sharder,
+            set_sharder,
+        )
+        input_file = tempfile.NamedTemporaryFile(
+            mode='w',
+            suffix='.yaml',
+            delete=False,
+        )
+        input_file.write(
+            '- directive: check\n'
+            '  urls: [http://www.usnews.com/a, http://www.usnews.com/b]\n'
+        )
+        input_file.close()
+        self.addCleanup(os.unlink, input_file.name)
+        options = parse_args([
+            input_file.name,
+            '--shard=1/1',
+            '--store=results.sqlite',
+            '--skip-passed-within=60',
+            '--no-cachebust',
+        ])
+        set_sharder(make_sharder(options))
+        self.addCleanup(set_sharder, None)
+        store = Mock()
+        store.should_skip.side_effect = (
+            lambda url, platform: url.endswith('/a'))
+
+        directive, = generate_directives_from_file(input_file.name, options)
+        directive.logger = Mock()
+        directive.tests = []
+        directive.get_response = MagicMock()
+        with patch(
+            'smoketest.directives.get_result_store',
+            return_value=store,
+        ):
+            directive.run()
+        directive.get_response.assert_called_once_with(
+            'http://www.usnews.com/b',
+            directive.platforms[0].headers,
+        )
+
+    def test_run_again_only_reruns_failures(self):
+        from smoketest.directives import CheckDirective
+        from smoketest.platforms import (
+            Desktop,
+            Mobile,
+        )
+
+        elem = {
+            'urls': ['http://www.usnews.com/a', 'http://www.usnews.com/b'],
+        }
+        options = Mock()
+        options.scheme = None
+        options.port = ''
+        options.level = 'live'
+        options.cachebust = False
+        options.dry_run = False
+        directive = CheckDirective(elem, options)
+        directive.logger = Mock()
+        directive.platforms = [Desktop, Mobile]
+        passing_test = Mock()
+        failing_test = Mock()
+        directive.tests = [passing_test, failing_test]
+
+        # Only /b on mobile fails, and only one of its tests
+        def get_result(test, url, platform):
+            return not (test is failing_test and url.endswith('b') and
+                        platform is Mobile)
+        directive.get_response = MagicMock(side_effect=lambda url, headers: (
+            url, Mobile if headers is Mobile.headers else Desktop,
+        ))
+        passing_test.get_result.side_effect = (
+            lambda response: get_result(passing_test, *response))
+        failing_test.get_result.side_effect = (
+            lambda response: get_result(failing_test, *response))
+
+        directive.run()
+        self.assertTrue(directive.failed)
+        self.assertEqual(directive.get_response.call_count, 4)
+        session = directive.session
+
+        directive.get_response.reset_mock()
+        passing_test.get_result.reset_mock()
+        failing_test.get_result.reset_mock()
+        directive.run()
+        directive.get_response.assert_called_once_with(
+            'http://www.usnews.com/b',
+            Mobile.headers,
+        )
+        self.assertFalse(passing_test.get_result.called)
+        self.assertEqual(failing_test.get_result.call_count, 1)
+
+        # The same session gets used for the second pass
+        self.assertIs(directive.session, session)
+        directive.close()
+        self.assertIsNone(directive.session)
+
 
 class TestOptions(unittest.TestCase):
     """Tests related to ensuring that various options are available and
@@ -455,3 +700,28 @@ class TestOptions(unittest.TestCase):
         session = get_session(elem, options)
         self.assertIn('User-Agent', session.headers)
         self.assertEqual(session.headers['User-Agent'], options.user_agent)
+
+
+class TestImports(unittest.TestCase):
+
+    def test_plain_list_needs_no_heavy_dependencies(self):
+        import subprocess
+        import sys
+        code = '\n'.join([
+            'import sys',
+            'from smoketest import parse_args',
+            'from smoketest.directives import generate_directives_from_file',
+            'options = parse_args([sys.argv[1], "--dry-run"])',
+            'list(generate_directives_from_file(sys.argv[1], options))',
+            'for name in ("jsonschema", "lxml", "requests", "yaml"):',
+            '    assert name not in sys.modules, name',
+        ])
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as f:
+            f.write('http://www.usnews.com/\n')
+            f.flush()
+            env = dict(os.environ)
+            env['PYTHONPATH'] = os.pathsep.join(sys.path)
+            subprocess.check_call(
+                [sys.executable, '-c', code, f.name],
+                env=env,
+            )
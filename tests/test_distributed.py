@@ -0,0 +1,106 @@
+import json
+import socket
+import threading
+import unittest
+
+import mock
+
+
+class TestDistributed(unittest.TestCase):
+
+    def _make_coordinator(self, n_urls, **kwargs):
+        from smoketest import parse_args
+        from smoketest.directives import CheckDirective
+        from smoketest.distributed import Coordinator
+        options = parse_args(['input.txt', '--dry-run', '--no-cachebust'])
+        directives = [
+            CheckDirective(
+                {'url': 'http://www.usnews.com/{0}'.format(i)},
+                options,
+            )
+            for i in range(n_urls)
+        ]
+        logger = mock.Mock()
+        coordinator = Coordinator(directives, options, logger, **kwargs)
+        coordinator.start()
+        return coordinator, logger
+
+    def _start_workers(self, coordinator, n_workers):
+        from smoketest.distributed import Worker
+        threads = []
+        for _ in range(n_workers):
+            worker = Worker(
+                coordinator.address, threads=2, heartbeat_interval=0.05,
+            )
+            thread = threading.Thread(target=worker.run)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def _start_pass(self, coordinator):
+        thread = threading.Thread(target=coordinator.run_pass)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _logged_urls(self, logger):
+        return sorted(
+            call[0][0] for call in logger.log_test_result.call_args_list
+        )
+
+    def test_workers_run_everything_once(self):
+        coordinator, logger = self._make_coordinator(7, lease_size=2)
+        threads = self._start_workers(coordinator, 2)
+        self.assertTrue(coordinator.run_pass())
+        coordinator.stop()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(
+            self._logged_urls(logger),
+            sorted('http://www.usnews.com/{0}'.format(i) for i in range(7)),
+        )
+        self.assertFalse(coordinator.failed)
+
+    def _connect_and_take_lease(self, coordinator):
+        sock = socket.create_connection(coordinator.address)
+        f = sock.makefile('rb')
+        sock.sendall(b'{"type": "hello"}\n')
+        self.assertEqual(json.loads(f.readline().decode())['type'], 'setup')
+        sock.sendall(b'{"type": "ready", "n": 1}\n')
+        self.assertEqual(json.loads(f.readline().decode())['type'], 'lease')
+        return sock
+
+    def test_leases_of_worker_that_hangs_up_are_handed_out_again(self):
+        coordinator, logger = self._make_coordinator(3, lease_size=1)
+        pass_thread = self._start_pass(coordinator)
+        sock = self._connect_and_take_lease(coordinator)
+        sock.close()
+        threads = self._start_workers(coordinator, 1)
+        pass_thread.join(5)
+        coordinator.stop()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(self._logged_urls(logger)), 3)
+        self.assertEqual(coordinator.released_count, 1)
+
+    def test_leases_of_silent_worker_are_handed_out_again(self):
+        coordinator, logger = self._make_coordinator(
+            3, lease_size=1, heartbeat_timeout=0.5,
+        )
+        pass_thread = self._start_pass(coordinator)
+        sock = self._connect_and_take_lease(coordinator)
+        threads = self._start_workers(coordinator, 1)
+        pass_thread.join(5)
+        coordinator.stop()
+        for thread in threads:
+            thread.join(5)
+        sock.close()
+        self.assertEqual(len(self._logged_urls(logger)), 3)
+        self.assertEqual(coordinator.released_count, 1)
+
+    def test_parse_address(self):
+        from smoketest.distributed import parse_address
+        self.assertEqual(parse_address('example.com:80'), ('example.com', 80))
+        self.assertEqual(parse_address(':7357'), ('127.0.0.1', 7357))
+        self.assertRaises(ValueError, parse_address, 'example.com')
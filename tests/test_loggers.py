@@ -48,3 +48,12 @@ class TestLoggers(unittest.TestCase):
         options.format = key
         logger = get_logger(options)
         self.assertIsInstance(logger, MyLogger)
+
+    def test_loggers_need_not_log_diffs(self):
+        from smoketest.loggers import Logger
+
+        class MyLogger(Logger):
+            pass
+
+        logger = MyLogger(Mock())
+        self.assertIsNone(logger.log_diff(1, [], []))
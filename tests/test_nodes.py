@@ -0,0 +1,81 @@
+import datetime
+import unittest
+
+from mock import (
+    Mock,
+    patch,
+)
+
+
+class TestNodes(unittest.TestCase):
+
+    def tearDown(self):
+        from smoketest import resolver
+        resolver.clear()
+
+    def test_parse_nodes(self):
+        from smoketest.nodes import parse_nodes
+        nodes = parse_nodes('10.0.0.1, 10.0.0.2:8443,[::1]:8080,::1')
+        self.assertEqual(
+            [(node.address, node.port) for node in nodes],
+            [
+                ('10.0.0.1', None),
+                ('10.0.0.2', 8443),
+                ('::1', 8080),
+                ('::1', None),
+            ],
+        )
+        self.assertEqual(nodes[2].name, '[::1]:8080')
+        self.assertRaises(ValueError, parse_nodes, '10.0.0.1:https')
+        self.assertRaises(ValueError, parse_nodes, '10.0.0.1,')
+
+    def test_fan_out(self):
+        from smoketest import parse_args
+        from smoketest.directives import CheckDirective
+        from smoketest.nodes import (
+            fan_out,
+            parse_nodes,
+        )
+        from smoketest.resolver import (
+            enable_connect_to,
+            get_connect_to,
+        )
+        enable_connect_to([])
+        options = parse_args(['input.txt', '--no-cachebust'])
+        directive = CheckDirective({'url': 'http://www.usnews.com/'}, options)
+        directive.logger = Mock()
+        nodes = parse_nodes('10.0.0.1,10.0.0.2:8080')
+        copies = fan_out([directive], nodes)
+        self.assertEqual(len(copies), 2)
+
+        connected_to = []
+
+        def get_response(self, url, extra_headers):
+            connected_to.append(
+                get_connect_to().map('www.usnews.com', 80),
+            )
+            return Mock(
+                status_code=200,
+                elapsed=datetime.timedelta(seconds=0.1),
+                is_redirect=False,
+            )
+
+        with patch.object(CheckDirective, 'get_response', get_response):
+            for copy in copies:
+                self.assertEqual(copy.run(), [])
+        self.assertEqual(
+            connected_to,
+            [('10.0.0.1', 80), ('10.0.0.2', 8080)],
+        )
+        self.assertEqual(
+            [
+                call[0][4].name
+                for call in directive.logger.log_test_result.call_args_list
+            ],
+            ['desktop@10.0.0.1', 'desktop@10.0.0.2:8080'],
+        )
+        self.assertEqual(nodes[0].success_count, 1)
+        self.assertEqual(nodes[1].response_times, [0.1])
+        # The original is left alone
+        self.assertIsNone(directive.session)
+        self.assertEqual(directive.platforms[0].name, 'desktop')
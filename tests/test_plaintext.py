@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+
+LINES = b'''http://www.usnews.com/
+# A comment
+404 http://www.usnews.com/404  # another comment
+
+301 http://www.usnews.com/old -> http://www.usnews.com/new\r
+30X_live http://premium.usnews.com/best-colleges/myfit
+#include static.txt
+    #include not-an-include.txt
+200 http://www.usnews.com/a http://www.usnews.com/b
+http://www.usnews.com/last'''
+
+
+class TestReadLines(unittest.TestCase):
+
+    def setUp(self):
+        f = tempfile.NamedTemporaryFile(suffix='.txt', delete=False)
+        f.write(LINES)
+        f.close()
+        self.filename = f.name
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def test_read_lines(self):
+        from smoketest.plaintext import read_lines
+        self.assertEqual(list(read_lines(self.filename)), [
+            ('200', 'http://www.usnews.com/', None, None, None),
+            ('404', 'http://www.usnews.com/404', None, None, None),
+            (
+                '301',
+                'http://www.usnews.com/old',
+                'http://www.usnews.com/new',
+                None,
+                None,
+            ),
+            (
+                '30X_live',
+                'http://premium.usnews.com/best-colleges/myfit',
+                None,
+                None,
+                None,
+            ),
+            (None, None, None, 'static.txt', None),
+            (
+                None,
+                None,
+                None,
+                None,
+                '200 http://www.usnews.com/a http://www.usnews.com/b',
+            ),
+            ('200', 'http://www.usnews.com/last', None, None, None),
+        ])
+
+    def test_slices_cover_every_line_once(self):
+        from smoketest.plaintext import (
+            read_lines,
+            slice_range,
+        )
+        everything = list(read_lines(self.filename))
+        for count in (1, 2, 3, 7, len(LINES), len(LINES) + 5):
+            lines = []
+            for index in range(1, count + 1):
+                lines.extend(read_lines(
+                    self.filename, *slice_range(self.filename, index, count)
+                ))
+            self.assertEqual(lines, everything)
+
+    def test_empty_file(self):
+        from smoketest.plaintext import read_lines
+        with open(self.filename, 'w'):
+            pass
+        self.assertEqual(list(read_lines(self.filename)), [])
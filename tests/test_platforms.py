@@ -56,7 +56,7 @@ class TestPlatforms(unittest.TestCase):
         platforms = get_platforms_from_element(elem)
         self.assertEqual(
             platforms,
-            [Mobile, Desktop],
+            (Mobile, Desktop),
         )
 
     def test_get_platforms_default(self):
@@ -68,5 +68,5 @@ class TestPlatforms(unittest.TestCase):
         platforms = get_platforms_from_element(elem)
         self.assertEqual(
             platforms,
-            [Desktop],
+            (Desktop, ),
         )
@@ -0,0 +1,106 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import six
+from mock import patch
+
+
+class TestPluginRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.mkdir(os.path.join(self.directory, 'plugins'))
+        self.modules = []
+
+    def tearDown(self):
+        from smoketest import plugins
+        plugins.clear()
+        os.chdir(self.cwd)
+        if self.directory in sys.path:
+            sys.path.remove(self.directory)
+        for name in self.modules:
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.directory)
+
+    def _write_module(self, name, directory=''):
+        self.modules.append(name)
+        path = os.path.join(self.directory, directory, name + '.py')
+        with open(path, 'w') as f:
+            f.write('IMPORTED = True\n')
+
+    def test_imports_plugins_only_for_their_keys(self):
+        from smoketest.plugins import PluginRegistry
+        self._write_module('smoketest_body_size')
+        sys.path.insert(0, self.directory)
+        registry = PluginRegistry([
+            ('tests', 'body_size', 'smoketest_body_size'),
+        ])
+        self.assertEqual(registry.keys('tests'), ['body_size'])
+
+        self.assertFalse(registry.load_for_keys({'url'}))
+        self.assertNotIn('smoketest_body_size', sys.modules)
+
+        self.assertTrue(registry.load_for_keys({'url', 'body_size'}))
+        self.assertIn('smoketest_body_size', sys.modules)
+
+    def test_settings_plugins(self):
+        from smoketest import plugins
+        self._write_module('eager_plugin', 'plugins')
+        self._write_module('junit_plugin', 'plugins')
+        os.chdir(self.directory)
+        names = [
+            'eager_plugin',
+            {'module': 'junit_plugin', 'loggers': ['junit']},
+        ]
+        with patch.object(plugins, 'get_plugin_names', return_value=names):
+            with patch.object(plugins, '_entry_points', return_value=[]):
+                plugins.load_plugins()
+                registry = plugins.get_plugin_registry()
+        self.assertIn('eager_plugin', sys.modules)
+        self.assertNotIn('junit_plugin', sys.modules)
+
+        self.assertEqual(registry.keys('loggers'), ['junit'])
+        self.assertFalse(registry.load('loggers', 'xml'))
+        self.assertTrue(registry.load('loggers', 'junit'))
+        self.assertIn('junit_plugin', sys.modules)
+
+    def test_plugins_for_known_keys_are_ignored(self):
+        from smoketest import plugins
+        entry_points = [
+            ('tests', 'response_time', 'smoketest_timing'),
+            ('tests', 'body_size', 'smoketest_body_size'),
+            ('transports', 'requests', 'smoketest_curl'),
+        ]
+        stderr = six.StringIO()
+        with patch.object(plugins, '_entry_points', return_value=entry_points):
+            with patch.object(plugins, 'get_plugin_names', return_value=[]):
+                with patch.object(sys, 'stderr', stderr):
+                    registry = plugins.get_plugin_registry()
+        self.assertEqual(registry.keys('tests'), ['body_size'])
+        self.assertEqual(registry.keys('transports'), [])
+        self.assertEqual(registry.shadowed, [
+            ('tests', 'response_time', 'smoketest_timing'),
+            ('transports', 'requests', 'smoketest_curl'),
+        ])
+        self.assertIn(
+            "ignored the plugin smoketest_timing for tests 'response_time'",
+            stderr.getvalue(),
+        )
+
+    def test_missing_plugin(self):
+        from smoketest.plugins import (
+            PluginError,
+            PluginRegistry,
+        )
+        registry = PluginRegistry([('transports', 'curl', 'no_such_plugin')])
+        self.assertRaises(PluginError, registry.load, 'transports', 'curl')
+
+    def test_settings_plugin_without_module(self):
+        from smoketest import plugins
+        names = [{'loggers': ['junit']}]
+        with patch.object(plugins, 'get_plugin_names', return_value=names):
+            self.assertRaises(plugins.PluginError, plugins.load_plugins)
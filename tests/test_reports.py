@@ -0,0 +1,41 @@
+import unittest
+
+
+class TestMergeJsonReports(unittest.TestCase):
+
+    def _report(self, shard, urls, failures):
+        return {
+            'configuration': {'shard': shard, 'level': 'live'},
+            'results': [{
+                'summary': {
+                    'Elapsed time': str(len(urls)),
+                    'Number of successes': str(len(urls) - failures),
+                    'Number of failures': str(failures),
+                    'Number of errors': '0',
+                },
+                'urls': [{'url': url} for url in urls],
+            }],
+        }
+
+    def test_merge(self):
+        from smoketest.reports import merge_json_reports
+        merged = merge_json_reports([
+            self._report('1/2', ['a', 'b', 'c'], 1),
+            self._report('2/2', ['d'], 0),
+        ])
+        self.assertEqual(merged['configuration']['shard'], ['1/2', '2/2'])
+        self.assertEqual(merged['configuration']['level'], 'live')
+        self.assertEqual(len(merged['results']), 1)
+        self.assertEqual(
+            [u['url'] for u in merged['results'][0]['urls']],
+            ['a', 'b', 'c', 'd'],
+        )
+        self.assertEqual(
+            dict(merged['results'][0]['summary']),
+            {
+                'Elapsed time': '3',
+                'Number of successes': '3',
+                'Number of failures': '1',
+                'Number of errors': '0',
+            },
+        )
@@ -0,0 +1,154 @@
+import socket
+import threading
+import unittest
+
+from mock import Mock
+
+
+ADDRESSES = [
+    (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 0)),
+]
+
+
+class TestDnsCache(unittest.TestCase):
+
+    def _make_cache(self):
+        from smoketest.resolver import DnsCache
+        now = [0.0]
+        resolve = Mock(return_value=ADDRESSES)
+        cache = DnsCache(ttl=60, resolve=resolve, clock=lambda: now[0])
+        return cache, resolve, now
+
+    def test_caches_until_ttl(self):
+        cache, resolve, now = self._make_cache()
+        cache.getaddrinfo('www.usnews.com', 80, 0, socket.SOCK_STREAM)
+        cache.getaddrinfo('www.usnews.com', 443, 0, socket.SOCK_STREAM)
+        self.assertEqual(resolve.call_count, 1)
+        self.assertEqual(cache.hit_count, 1)
+        now[0] = 61
+        cache.getaddrinfo('www.usnews.com', 80, 0, socket.SOCK_STREAM)
+        self.assertEqual(resolve.call_count, 2)
+        self.assertEqual(cache.lookup_count, 2)
+
+    def test_fills_in_port(self):
+        cache, resolve, now = self._make_cache()
+        addresses = cache.getaddrinfo('www.usnews.com', 8080)
+        self.assertEqual(addresses[0][4], ('10.0.0.1', 8080))
+        self.assertEqual(
+            cache.getaddrinfo('www.usnews.com', None)[0][4],
+            ('10.0.0.1', 0),
+        )
+
+    def test_errors_arent_cached(self):
+        cache, resolve, now = self._make_cache()
+        resolve.side_effect = socket.gaierror('nope')
+        self.assertRaises(
+            socket.gaierror, cache.getaddrinfo, 'www.usnews.com', 80,
+        )
+        resolve.side_effect = None
+        cache.getaddrinfo('www.usnews.com', 80)
+        self.assertEqual(resolve.call_count, 2)
+
+    def test_one_lookup_for_concurrent_misses(self):
+        from smoketest.resolver import DnsCache
+        started = threading.Event()
+        release = threading.Event()
+
+        def resolve(*args):
+            started.set()
+            release.wait(5)
+            return ADDRESSES
+
+        cache = DnsCache(resolve=Mock(side_effect=resolve))
+        threads = [
+            threading.Thread(target=cache.getaddrinfo, args=('a', 80))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(cache.lookup_count, 1)
+        self.assertEqual(cache.hit_count, 2)
+
+    def test_resolve_all(self):
+        cache, resolve, now = self._make_cache()
+        cache.resolve_all(['a', 'b', 'c'], 2)
+        self.assertEqual(
+            sorted(call[0][0] for call in resolve.call_args_list),
+            ['a', 'b', 'c'],
+        )
+        cache.getaddrinfo('a', 443, 0, socket.SOCK_STREAM)
+        self.assertEqual(resolve.call_count, 3)
+
+    def test_install(self):
+        from smoketest import resolver
+        cache = resolver.enable_dns_cache(30)
+        try:
+            self.assertEqual(socket.getaddrinfo, cache.getaddrinfo)
+        finally:
+            resolver.clear()
+        self.assertIs(socket.getaddrinfo, resolver._getaddrinfo)
+
+    def test_get_hosts(self):
+        from smoketest.resolver import get_hosts
+        directives = [
+            Mock(urls=['http://www.usnews.com/a', 'http://www.usnews.com/b']),
+            Mock(urls=['https://www-stag.usnews.com:8443/']),
+        ]
+        self.assertEqual(
+            get_hosts(directives),
+            ['www-stag.usnews.com', 'www.usnews.com'],
+        )
+
+
+class TestConnectTo(unittest.TestCase):
+
+    def tearDown(self):
+        from smoketest import resolver
+        resolver.clear()
+
+    def test_parse_connect_to(self):
+        from smoketest.resolver import parse_connect_to
+        self.assertEqual(
+            parse_connect_to('www.usnews.com:443:10.0.0.1:8443'),
+            (('www.usnews.com', 443), ('10.0.0.1', 8443)),
+        )
+        self.assertEqual(
+            parse_connect_to('www.usnews.com::[::1]:'),
+            (('www.usnews.com', None), ('::1', None)),
+        )
+        self.assertRaises(ValueError, parse_connect_to, 'www.usnews.com')
+
+    def test_maps_matching_host_and_port(self):
+        from smoketest.resolver import (
+            ConnectTo,
+            parse_connect_to,
+        )
+        resolve = Mock(return_value=ADDRESSES)
+        connect_to = ConnectTo(
+            [
+                parse_connect_to('www.usnews.com:443:10.0.0.1:8443'),
+                parse_connect_to('www.usnews.com::10.0.0.2:'),
+            ],
+            resolve=resolve,
+        )
+        connect_to.getaddrinfo('www.usnews.com', '443')
+        resolve.assert_called_with('10.0.0.1', 8443, 0, 0, 0, 0)
+        connect_to.getaddrinfo('www.usnews.com', 80)
+        resolve.assert_called_with('10.0.0.2', 80, 0, 0, 0, 0)
+        connect_to.getaddrinfo('www-stag.usnews.com', 80)
+        resolve.assert_called_with('www-stag.usnews.com', 80, 0, 0, 0, 0)
+        self.assertTrue(connect_to.covers('www.usnews.com'))
+        self.assertFalse(connect_to.covers('www-stag.usnews.com'))
+
+    def test_connect_to_goes_before_dns_cache(self):
+        from smoketest import resolver
+        resolver.enable_dns_cache(30)
+        connect_to = resolver.enable_connect_to(['www.usnews.com::10.0.0.1:'])
+        self.assertEqual(socket.getaddrinfo, connect_to.getaddrinfo)
+        addresses = socket.getaddrinfo('www.usnews.com', 80)
+        self.assertEqual(addresses[0][4][:2], ('10.0.0.1', 80))
+        self.assertEqual(resolver.get_dns_cache().lookup_count, 1)
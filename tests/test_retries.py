@@ -0,0 +1,83 @@
+import socket
+import unittest
+
+from mock import Mock
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_retryable_errors(self):
+        from requests.exceptions import (
+            ConnectionError,
+            TooManyRedirects,
+        )
+        from smoketest.retries import RetryPolicy
+        policy = RetryPolicy(attempts=3)
+        self.assertTrue(policy.should_retry_error(ConnectionError(), 1))
+        self.assertTrue(policy.should_retry_error(socket.timeout(), 2))
+        self.assertFalse(policy.should_retry_error(TooManyRedirects(), 1))
+
+        # Out of attempts
+        self.assertFalse(policy.should_retry_error(ConnectionError(), 3))
+
+    def test_retryable_statuses(self):
+        from smoketest.retries import RetryPolicy
+        policy = RetryPolicy(attempts=2, statuses=[502, '503'])
+        response = Mock()
+        response.status_code = 503
+        self.assertTrue(policy.should_retry_response(response, 1))
+        self.assertFalse(policy.should_retry_response(response, 2))
+        response.status_code = 500
+        self.assertFalse(policy.should_retry_response(response, 1))
+
+    def test_unknown_exception_name(self):
+        from smoketest.retries import RetryPolicy
+        self.assertRaises(ValueError, RetryPolicy, exceptions=['bogus'])
+
+    def test_jittered_backoff(self):
+        from smoketest.retries import RetryPolicy
+        policy = RetryPolicy(attempts=10, backoff=0.5, max_backoff=3)
+        for attempt, ceiling in ((1, 0.5), (2, 1.0), (3, 2.0), (6, 3.0)):
+            for _ in range(20):
+                delay = policy.get_delay(attempt)
+                self.assertTrue(0 <= delay <= ceiling)
+
+    def test_get_retry_policy(self):
+        from smoketest.retries import get_retry_policy
+        options = Mock()
+        options.retries = 2
+        policy = get_retry_policy({}, options)
+        self.assertEqual(policy.attempts, 3)
+        self.assertIs(policy, get_retry_policy({}, options))
+
+        policy = get_retry_policy({'retry': {'attempts': 5}}, options)
+        self.assertEqual(policy.attempts, 5)
+
+    def test_unknown_retry_keys(self):
+        from smoketest.retries import get_retry_policy
+        options = Mock()
+        options.retries = None
+        try:
+            get_retry_policy({'retry': {'attempt': 3}}, options)
+        except ValueError as e:
+            self.assertIn('Unknown retry keys attempt', str(e))
+        else:
+            assert False, 'No exception was raised!'
+        self.assertRaises(ValueError, get_retry_policy, {'retry': 3}, options)
+
+    def test_default_policy_follows_settings(self):
+        import smoketest.settings
+        from smoketest.retries import get_retry_policy
+        old_settings = smoketest.settings._SETTINGS
+        self.addCleanup(setattr, smoketest.settings, '_SETTINGS', old_settings)
+        options = Mock()
+        options.retries = None
+
+        smoketest.settings._SETTINGS = {}
+        policy = get_retry_policy({}, options)
+        self.assertIs(policy, get_retry_policy({}, options))
+
+        smoketest.settings._SETTINGS = {'retry': {'backoff': 2.0}}
+        policy = get_retry_policy({}, options)
+        self.assertEqual(policy.backoff, 2.0)
+        self.assertIs(policy, get_retry_policy({}, options))
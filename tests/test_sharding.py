@@ -0,0 +1,158 @@
+import unittest
+
+from mock import (
+    Mock,
+    patch,
+)
+
+
+class TestSharding(unittest.TestCase):
+
+    def test_parse_shard(self):
+        from smoketest.sharding import parse_shard
+        self.assertEqual(parse_shard('2/5'), (2, 5))
+        self.assertRaises(ValueError, parse_shard, '0/5')
+        self.assertRaises(ValueError, parse_shard, '6/5')
+        self.assertRaises(ValueError, parse_shard, 'two')
+
+    def test_every_unit_has_exactly_one_shard(self):
+        from smoketest.platforms import (
+            Desktop,
+            Mobile,
+        )
+        from smoketest.sharding import Sharder
+        sharders = [Sharder(i, 4) for i in range(1, 5)]
+        for n in range(200):
+            for platform in (Desktop, Mobile):
+                url = 'http://www.usnews.com/{0}?_=123'.format(n)
+                owners = [s for s in sharders if s.owns(url, platform)]
+                self.assertEqual(len(owners), 1)
+
+        # Cachebusters don't move URLs between shards
+        self.assertEqual(
+            sharders[0].owns('http://www.usnews.com/?_=1', Desktop),
+            sharders[0].owns('http://www.usnews.com/?_=2', Desktop),
+        )
+
+    def test_pack(self):
+        from smoketest.sharding import pack
+        costs = {
+            ('a', 'desktop'): 10.0,
+            ('b', 'desktop'): 6.0,
+            ('c', 'desktop'): 5.0,
+            ('d', 'desktop'): 1.0,
+        }
+        assignments = pack(costs, 2)
+        loads = {1: 0.0, 2: 0.0}
+        for unit, shard in assignments.items():
+            loads[shard] += costs[unit]
+        self.assertEqual(sorted(loads.values()), [11.0, 11.0])
+
+    def test_costs_take_precedence(self):
+        from smoketest.platforms import Desktop
+        from smoketest.sharding import Sharder
+        costs = {('http://a.com/', 'desktop'): 1.0}
+        self.assertTrue(Sharder(1, 2, costs).owns('http://a.com/', Desktop))
+        self.assertFalse(Sharder(2, 2, costs).owns('http://a.com/', Desktop))
+
+    def test_costs_come_from_a_shared_file(self):
+        import os
+        import shutil
+        import tempfile
+        from smoketest.platforms import Desktop
+        from smoketest.sharding import (
+            load_costs,
+            make_sharder,
+            save_costs,
+        )
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'costs.json')
+        costs = dict(
+            (('http://www.usnews.com/{0}'.format(n), 'desktop'), float(n))
+            for n in range(50)
+        )
+        save_costs(costs, filename)
+        self.assertEqual(load_costs(filename), costs)
+
+        # Each shard has a store with its own response times, which don't
+        # count without --shard-costs
+        options = Mock(store='results.sqlite', shard_costs=None)
+        unit_costs = Mock(side_effect=AssertionError('store costs used'))
+        with patch('smoketest.store.ResultStore.unit_costs', unit_costs):
+            for shard_costs in (None, filename):
+                options.shard_costs = shard_costs
+                sharders = []
+                for i in (1, 2):
+                    options.shard = '{0}/2'.format(i)
+                    sharders.append(make_sharder(options))
+                for n in range(100):
+                    url = 'http://www.usnews.com/{0}'.format(n)
+                    owners = [s for s in sharders if s.owns(url, Desktop)]
+                    self.assertEqual(len(owners), 1)
+
+    def test_bad_costs_file(self):
+        import os
+        import shutil
+        import tempfile
+        from smoketest.sharding import load_costs
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'costs.json')
+        with open(filename, 'w') as f:
+            f.write('{"a": 1}')
+        self.assertRaises(ValueError, load_costs, filename)
+
+
+class TestShardedParsing(unittest.TestCase):
+
+    def tearDown(self):
+        from smoketest.sharding import set_sharder
+        set_sharder(None)
+
+    def test_dumb_list_lines_for_other_shards_are_skipped(self):
+        from smoketest.directives import FileParser
+        from smoketest.platforms import Desktop
+        from smoketest.sharding import (
+            Sharder,
+            set_sharder,
+        )
+        sharder = Sharder(1, 2)
+        set_sharder(sharder)
+        options = Mock()
+        options.scheme = None
+        options.port = None
+        options.level = 'live'
+        options.cachebust = True
+        parser = FileParser(None, options)
+        for n in range(20):
+            url = 'http://www.usnews.com/{0}'.format(n)
+            directive = parser._get_directive_from_dumb_list_line(url)
+            self.assertEqual(
+                directive is not None,
+                sharder.owns(url, Desktop),
+            )
+
+    def test_check_directive_keeps_its_units(self):
+        from smoketest.directives import CheckDirective
+        from smoketest.platforms import (
+            Desktop,
+            Mobile,
+        )
+        options = Mock()
+        options.scheme = None
+        options.port = None
+        options.level = 'live'
+        options.cachebust = False
+        directive = CheckDirective({
+            'urls': ['http://a.com/', 'http://b.com/'],
+            'platforms': ['desktop', 'mobile'],
+        }, options)
+        self.assertTrue(directive.keep_units(
+            lambda url, platform: (url == 'http://b.com/') == (platform is Mobile)
+        ))
+        self.assertEqual(
+            [(url, platform) for url, platform, _ in directive._rerun],
+            [('http://a.com/', Desktop), ('http://b.com/', Mobile)],
+        )
+        self.assertFalse(directive.keep_units(lambda url, platform: False))
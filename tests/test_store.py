@@ -0,0 +1,111 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from mock import Mock
+
+
+def _response(elapsed=0.5, status_code=200, text=u'hi'):
+    response = Mock()
+    response.elapsed = datetime.timedelta(seconds=elapsed)
+    response.status_code = status_code
+    response.headers = {}
+    response.content = text.encode('utf-8')
+    return response
+
+
+def _test(description):
+    test = Mock()
+    test.description = description
+    return test
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        from argparse import Namespace
+        f = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False)
+        f.close()
+        self.filename = f.name
+        self.options = Namespace(level='live')
+        self.platform = Mock()
+        self.platform.name = 'desktop'
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def _run(self, results, label=None):
+        from smoketest.store import ResultStore
+        store = ResultStore(self.filename, self.options, label=label)
+        store.start_pass()
+        for url, description, passed, elapsed in results:
+            if description is None:
+                store.record_error(url, self.platform, 'oops')
+            else:
+                store.record_result(
+                    url, self.platform, _test(description), passed,
+                    _response(elapsed),
+                )
+        return store
+
+    def test_diff(self):
+        self._run([
+            ('http://a.com/?_=1', 'status', True, 0.5),
+            ('http://b.com/?_=1', 'status', True, 0.5),
+            ('http://c.com/?_=1', 'status', False, 0.5),
+        ], label='deploy-1').close()
+
+        store = self._run([
+            ('http://a.com/?_=2', 'status', True, 2.0),
+            ('http://b.com/?_=2', 'status', False, 0.5),
+            ('http://c.com/?_=2', 'status', False, 0.5),
+            ('http://d.com/?_=2', None, False, None),
+        ])
+        baseline_run_id = store.find_run('deploy-1')
+        self.assertEqual(baseline_run_id, store.find_run('last'))
+        regressions, timing_deltas = store.diff(baseline_run_id, 1.0)
+        store.close()
+
+        # c.com was already failing, so it isn't a regression
+        self.assertEqual(
+            [(r.url, r.test, r.was_passing) for r in regressions],
+            [('http://b.com/', 'status', True),
+             ('http://d.com/', None, None)],
+        )
+        self.assertEqual(
+            [(d.url, d.baseline_elapsed, d.elapsed) for d in timing_deltas],
+            [('http://a.com/', 0.5, 2.0)],
+        )
+
+    def test_later_pass_supersedes_error(self):
+        self._run([('http://a.com/', 'status', True, 0.5)]).close()
+        store = self._run([('http://a.com/', None, False, None)])
+        store.start_pass()
+        store.record_result(
+            'http://a.com/', self.platform, _test('status'), True,
+            _response(),
+        )
+        regressions, _ = store.diff(store.find_run('last'), 1.0)
+        store.close()
+        self.assertEqual(regressions, [])
+
+    def test_find_run_missing(self):
+        store = self._run([])
+        self.assertRaises(KeyError, store.find_run, 'last')
+        self.assertRaises(KeyError, store.find_run, 'nope')
+        store.close()
+
+    def test_skip_recently_passed(self):
+        self._run([
+            ('http://a.com/?_=1', 'status', True, 0.5),
+            ('http://b.com/?_=1', 'status', True, 0.5),
+            ('http://b.com/?_=1', 'html', False, 0.5),
+        ]).close()
+
+        store = self._run([])
+        store.skip_recently_passed(30)
+        self.assertTrue(store.should_skip('http://a.com/?_=2', self.platform))
+        self.assertFalse(store.should_skip('http://b.com/?_=2', self.platform))
+        self.assertEqual(store.skipped_count, 1)
+        store.close()
@@ -0,0 +1,42 @@
+import datetime
+import unittest
+
+from mock import Mock
+
+
+class TestTallies(unittest.TestCase):
+
+    def test_summary(self):
+        from smoketest.tallies import Tally
+        tally = Tally('live')
+        self.assertEqual(tally.summary(), '0 passed, 0 failed, 0 errors')
+        tally.record(True, 0.1)
+        tally.record(False, 0.3)
+        tally.record()
+        self.assertEqual(
+            tally.summary(),
+            '1 passed, 1 failed, 1 errors; mean response time 0.200s, '
+            '95th percentile 0.100s',
+        )
+
+    def test_one_response_time_per_response(self):
+        from smoketest.tallies import (
+            Tally,
+            TallyingLogger,
+        )
+        tally = Tally('live')
+        logger = Mock()
+        tallying_logger = TallyingLogger(logger, tally)
+        response = Mock(elapsed=datetime.timedelta(seconds=0.5))
+        for result in (True, False):
+            tallying_logger.log_test_result(
+                'http://www.usnews.com/', Mock(), result, response, Mock(),
+                False,
+            )
+        tallying_logger.log_error('http://www.usnews.com/', Mock(), Mock())
+        self.assertEqual(tally.response_times, [0.5])
+        self.assertEqual(tally.success_count, 1)
+        self.assertEqual(tally.failure_count, 1)
+        self.assertEqual(tally.error_count, 1)
+        self.assertEqual(logger.log_test_result.call_count, 2)
+        self.assertEqual(logger.log_error.call_count, 1)
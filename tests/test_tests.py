@@ -6,6 +6,7 @@ import unittest
 from mock import (
     MagicMock,
     Mock,
+    patch,
 )
 
 
@@ -398,6 +399,139 @@ class TestTestResults(unittest.TestCase):
             json_schema_test_result.description,
         )
 
+    def test_xml_root_test(self):
+        from smoketest.tests import XMLRootTest
+        test = XMLRootTest('{http://www.w3.org/2005/Atom}feed')
+        response = Mock()
+        # Only as far as the root element gets read
+        response.content = (
+            b'<?xml version="1.0"?>\n'
+            b'<feed xmlns="http://www.w3.org/2005/Atom"><entry>'
+        )
+        self.assertTrue(test.get_result(response))
+        response = Mock()
+        response.content = b'<rss><channel></channel></rss>'
+        self.assertFalse(test.get_result(response))
+        response = Mock()
+        response.content = b'{"feed": []}'
+        self.assertFalse(test.get_result(response))
+
+    def test_xml_tests_share_a_parse(self):
+        import lxml.etree
+        from smoketest.tests import (
+            DTDTest,
+            XMLRootTest,
+        )
+        dtd_filename = self.json_schema_filename + '.dtd'
+        with open(dtd_filename, 'w') as f:
+            f.write('<!ELEMENT urlset (url*)>\n<!ELEMENT url (#PCDATA)>\n')
+        self.addCleanup(os.unlink, dtd_filename)
+        response = Mock()
+        response.content = b'<urlset><url>a</url><url>b</url></urlset>'
+        parse = Mock(side_effect=lxml.etree.fromstring)
+        with patch.object(lxml.etree, 'fromstring', parse):
+            self.assertTrue(DTDTest(dtd_filename).get_result(response))
+            self.assertTrue(XMLRootTest('urlset').get_result(response))
+            self.assertTrue(DTDTest(dtd_filename).get_result(response))
+        self.assertEqual(parse.call_count, 1)
+
+        response = Mock()
+        response.content = b'<urlset><link>a</link></urlset>'
+        result = DTDTest(dtd_filename).get_result(response)
+        self.assertFalse(result)
+        self.assertIn('did not obey', result.description)
+
+    def test_json_tests_share_a_parse(self):
+        from smoketest import tests
+        with open(self.json_schema_filename, 'w') as f:
+            f.write(json.dumps({'required': ['foo']}))
+        response = Mock()
+        response.content = b'{"foo": {"bar": "baz"}}'
+        equals_baz = tests.TextMatchingMethod('equals', 'baz')
+        loads = Mock(side_effect=json.loads)
+        with patch.object(tests.json, 'loads', loads):
+            self.assertTrue(
+                tests.JSONTest('foo.bar', equals_baz).get_result(response)
+            )
+            self.assertFalse(
+                tests.JSONTest('foo.baz', equals_baz).get_result(response)
+            )
+            self.assertTrue(
+                tests.JSONSchemaTest(self.json_schema_filename).get_result(
+                    response,
+                )
+            )
+        bodies_parsed = [
+            args for args, kwargs in loads.call_args_list
+            if args[0] == response.content
+        ]
+        self.assertEqual(len(bodies_parsed), 1)
+
+    def test_json_tests_of_equal_numbers(self):
+        from smoketest.tests import get_json_tests
+        response = Mock()
+        response.content = b'{"a": 1}'
+        passed = []
+        for expected in (1.0, 1, True, 1):
+            elem = {
+                'url': 'http://www.usnews.com',
+                'json': [{'selector': 'a', 'equals': expected}],
+            }
+            json_test, = get_json_tests(elem, None)
+            passed.append(bool(json_test.get_result(response)))
+        self.assertEqual(passed, [False, True, False, True])
+
+    def test_json_test_wildcards(self):
+        from smoketest.tests import (
+            JSONPaths,
+            JSONTest,
+            TextMatchingMethod,
+        )
+        response = Mock()
+        response.content = b'{"items": [{"id": 5}, {"id": 7}, {"id": 5}]}'
+        paths = JSONPaths('items.*.id', 'items.0:1.id', 'items.1:1.id')
+        equals_5 = TextMatchingMethod('equals', '5')
+
+        # Numbers are matched as JSON text
+        result = JSONTest('items.0:1.id', equals_5, paths).get_result(response)
+        self.assertTrue(result)
+        self.assertEqual(result.description, 'all 1 of items.0:1.id matched')
+
+        # Everything a wildcard selects has to match
+        result = JSONTest('items.*.id', equals_5, paths).get_result(response)
+        self.assertFalse(result)
+        self.assertEqual(result.description, 'items.1.id was 7')
+
+        result = JSONTest('items.1:1.id', equals_5, paths).get_result(response)
+        self.assertFalse(result)
+        self.assertEqual(result.description, 'items.1:1.id selected nothing')
+
+    def test_json_tests_of_an_element_share_a_selection(self):
+        from smoketest import tests
+        from smoketest.tests import get_json_tests
+        elem = {
+            'url': 'http://www.usnews.com',
+            'json': [
+                {'selector': 'data.name', 'equals': 'Page'},
+                {'selector': 'data.tags.*', 'contains': 'a'},
+            ],
+        }
+        json_tests = get_json_tests(elem, None)
+        self.assertIs(json_tests[0].paths, json_tests[1].paths)
+        response = Mock()
+        response.content = b'{"data": {"name": "Page", "tags": ["a", "ab"]}}'
+        select = tests.JSONPaths.select
+        documents = []
+
+        def counting_select(paths, document):
+            documents.append(document)
+            return select(paths, document)
+
+        with patch.object(tests.JSONPaths, 'select', counting_select):
+            results = [test.get_result(response) for test in json_tests]
+            self.assertTrue(all(results))
+        self.assertEqual(len(documents), 1)
+
     def test_header_test(self):
         from smoketest.tests import (
             HeaderTest,
@@ -477,6 +611,11 @@ class TestTextMatchingMethod(unittest.TestCase):
         self.assertTrue(text_matching_method('^hello$'))
         self.assertFalse(text_matching_method('hello'))
 
+    def test_equals_number(self):
+        from smoketest.tests import TextMatchingMethod
+        self.assertTrue(TextMatchingMethod('equals', 78)('78'))
+        self.assertTrue(TextMatchingMethod('equals', True)('true'))
+
     def test_contains(self):
         from smoketest.tests import TextMatchingMethod
         text_matching_method = TextMatchingMethod(
@@ -699,6 +838,49 @@ class TestParsers(unittest.TestCase):
         get_tests_from_element(elem, options)
         mymock.call.assert_called_once_with(elem, options)
 
+    def test_parser_decorator_with_keys(self):
+        from smoketest.tests import (
+            get_tests_from_element,
+            parser,
+        )
+        mymock = MagicMock()
+
+        @parser('my_key')
+        def my_parser(elem, options):
+            mymock.call(elem, options)
+
+        # Only elements with the key get the parser
+        options = Mock()
+        get_tests_from_element({'url': 'https://www.usnews.com/'}, options)
+        self.assertFalse(mymock.call.called)
+        elem = {'url': 'https://www.usnews.com/', 'my_key': 'hi'}
+        get_tests_from_element(elem, options)
+        mymock.call.assert_called_once_with(elem, options)
+
+    def test_unknown_element_keys(self):
+        from smoketest import tests
+        # Directives say which keys they look for themselves
+        tests.element_keys('url', 'urls')
+        options = Mock()
+        with patch.object(tests, '_ALL_KEYS_DECLARED', True):
+            with patch.object(tests, '_UNKNOWN_KEYS', set()):
+                with patch.object(tests, '_DISPATCH', {}):
+                    tests.get_tests_from_element({
+                        'url': 'https://www.usnews.com/',
+                        'status': '404',
+                        'colour': 'blue',
+                    }, options)
+                    tests.get_tests_from_element({
+                        'urls': ['https://www.usnews.com/'],
+                        'html': [],
+                        'colour': 'blue',
+                        'flavour': 'mint',
+                    }, options)
+                    self.assertEqual(
+                        tests.unknown_element_keys(),
+                        ['colour', 'flavour'],
+                    )
+
     def test_get_header_tests(self):
         from smoketest.tests import (
             get_header_tests,
@@ -716,6 +898,29 @@ class TestParsers(unittest.TestCase):
         self.assertEqual(1, len(header_tests))
         self.assertEqual('X-Some-Header', header_tests[0].header)
 
+    def test_identical_tests_are_shared(self):
+        from smoketest.tests import (
+            get_html_tests,
+            get_status_tests,
+        )
+        options = Mock()
+        self.assertIs(
+            get_status_tests({}, options)[0],
+            get_status_tests({'status': '200'}, options)[0],
+        )
+        self.assertIsNot(
+            get_status_tests({}, options)[0],
+            get_status_tests({'status': '404'}, options)[0],
+        )
+        elem = {'html': [{'selector': 'h1', 'equals': 'Hi'}]}
+        first, = get_html_tests(elem, options)
+        second, = get_html_tests(dict(elem), options)
+        self.assertIs(first, second)
+        self.assertIs(
+            first.text_matching_method,
+            second.text_matching_method,
+        )
+
 
 class TestSelectFromJsonifiable(unittest.TestCase):
 
@@ -882,3 +1087,34 @@ class TestSelectFromJsonifiable(unittest.TestCase):
             self.assertEqual(e.args[0], 'Key baz not found')
         else:
             assert False, 'No exception was raised!'
+
+    def test_wildcard_selector(self):
+        from smoketest.tests import select_from_json
+        json_string = """
+            {"items": [{"id": 1}, {"id": 2}], "total": {"a": 3}}
+        """
+        self.assertEqual(select_from_json(json_string, 'items.*.id'), [1, 2])
+        self.assertEqual(select_from_json(json_string, 'total.*'), [3])
+        self.assertEqual(select_from_json(json_string, 'items.1.*'), [2])
+
+    def test_slice_selector(self):
+        from smoketest.tests import select_from_json
+        json_string = """
+            [0, 1, 2, 3]
+        """
+        self.assertEqual(select_from_json(json_string, '1:3'), [1, 2])
+        self.assertEqual(select_from_json(json_string, '-2:'), [2, 3])
+        self.assertEqual(select_from_json(json_string, '5:'), [])
+
+    def test_slice_selector_for_object(self):
+        from smoketest.tests import select_from_json
+        json_string = """
+            {"foo": "bar"}
+        """
+        try:
+            select_from_json(json_string, '0:1')
+        except Exception as e:
+            self.assertIsInstance(e, ValueError)
+            self.assertEqual(e.args[0], 'Object found at 0:1')
+        else:
+            assert False, 'No exception was raised!'
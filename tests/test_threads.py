@@ -0,0 +1,60 @@
+import threading
+import unittest
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def test_runs_dry(self):
+        from smoketest.threads import WorkQueue
+        queue = WorkQueue()
+        stop_event = threading.Event()
+        queue.put('a')
+        queue.put('b')
+        self.assertEqual(queue.get(stop_event), 'a')
+        self.assertEqual(queue.get(stop_event), 'b')
+        queue.task_done()
+        queue.task_done()
+        self.assertIsNone(queue.get(stop_event))
+
+    def test_delayed_work_waits_its_turn(self):
+        from smoketest.threads import WorkQueue
+        now = [0.0]
+        queue = WorkQueue(clock=lambda: now[0])
+        stop_event = threading.Event()
+        queue.put('later', delay=5)
+        queue.put('now')
+        self.assertEqual(queue.get(stop_event), 'now')
+        queue.task_done()
+        now[0] = 5
+        self.assertEqual(queue.get(stop_event), 'later')
+
+    def test_stop_event(self):
+        from smoketest.threads import WorkQueue
+        queue = WorkQueue()
+        stop_event = threading.Event()
+        stop_event.set()
+        queue.put('a')
+        self.assertIsNone(queue.get(stop_event))
+
+    def test_threads_run_rescheduled_work(self):
+        from smoketest.threads import get_threads_and_stop_event
+        done = []
+
+        class Directive(object):
+            def __init__(self, name):
+                self.name = name
+
+            def run(self):
+                # Schedule a quick retry, like a transient error would
+                return [(0.01, lambda: done.append(self.name))]
+
+        threads, _ = get_threads_and_stop_event(
+            [Directive('a'), Directive('b'), Directive('c')],
+            2,
+        )
+        self.assertEqual(len(threads), 2)
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(sorted(done), ['a', 'b', 'c'])
@@ -0,0 +1,171 @@
+import unittest
+
+from mock import patch
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_burst_then_wait(self):
+        from smoketest.throttling import TokenBucket
+        clock = FakeClock()
+        bucket = TokenBucket(10, burst=3, clock=clock)
+
+        # The first three requests go straight through
+        self.assertEqual(
+            [bucket.reserve() for _ in range(3)],
+            [0.0, 0.0, 0.0],
+        )
+
+        # After that each request waits its turn
+        self.assertAlmostEqual(bucket.reserve(), 0.1)
+        self.assertAlmostEqual(bucket.reserve(), 0.2)
+
+    def test_refill(self):
+        from smoketest.throttling import TokenBucket
+        clock = FakeClock()
+        bucket = TokenBucket(10, burst=1, clock=clock)
+        self.assertEqual(bucket.reserve(), 0.0)
+        clock.now += 0.1
+        self.assertEqual(bucket.reserve(), 0.0)
+
+        # Tokens never pile up past the burst size
+        clock.now += 60
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1)
+
+    def test_default_burst(self):
+        from smoketest.throttling import TokenBucket
+        self.assertEqual(TokenBucket(200).burst, 200)
+        self.assertEqual(TokenBucket(0.5).burst, 1)
+
+    def test_invalid_rate(self):
+        from smoketest.throttling import TokenBucket
+        self.assertRaises(ValueError, TokenBucket, 0)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_host_bucket_and_throttled_time(self):
+        from smoketest.throttling import (
+            RateLimiter,
+            TokenBucket,
+        )
+        clock = FakeClock()
+        sleeps = []
+        limiter = RateLimiter(
+            [TokenBucket(100, burst=100, clock=clock)],
+            {'www-stag.usnews.com': TokenBucket(1, burst=1, clock=clock)},
+            sleep=sleeps.append,
+        )
+
+        limiter.wait('http://www-stag.usnews.com/a')
+        limiter.wait('http://www.usnews.com/a')
+        self.assertEqual(sleeps, [])
+
+        # Only the stag host is out of tokens
+        limiter.wait('http://www-stag.usnews.com/b')
+        self.assertEqual(len(sleeps), 1)
+        self.assertAlmostEqual(sleeps[0], 1.0)
+        self.assertAlmostEqual(limiter.throttled_time, 1.0)
+        self.assertEqual(limiter.throttled_count, 1)
+
+        limiter.reset_stats()
+        self.assertEqual(limiter.throttled_time, 0.0)
+
+
+class TestGetRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        import smoketest.settings
+        import smoketest.throttling
+        self._old_settings = smoketest.settings._SETTINGS
+        smoketest.throttling.clear()
+
+    def tearDown(self):
+        import smoketest.settings
+        import smoketest.throttling
+        smoketest.settings._SETTINGS = self._old_settings
+        smoketest.throttling.clear()
+
+    def test_no_limits(self):
+        import smoketest.settings
+        from smoketest.throttling import get_rate_limiter
+        smoketest.settings._SETTINGS = {}
+        self.assertIsNone(get_rate_limiter('live'))
+
+    def test_global_level_and_host_limits(self):
+        import smoketest.settings
+        from smoketest.throttling import get_rate_limiter
+        smoketest.settings._SETTINGS = {
+            'rate_limits': {
+                'global': 500,
+                'levels': {
+                    'stag': {'rate': 200, 'burst': 20},
+                    'other': 5,
+                },
+                'hosts': {
+                    'www-stag.usnews.com': 50,
+                },
+            },
+        }
+
+        stag = get_rate_limiter('stag')
+        self.assertEqual(
+            [(b.rate, b.burst) for b in stag.buckets],
+            [(500, 500), (200, 20)],
+        )
+        self.assertEqual(
+            stag.host_buckets['www-stag.usnews.com'].rate,
+            50,
+        )
+        self.assertIs(stag, get_rate_limiter('stag'))
+
+        # The global bucket is shared between levels
+        dev = get_rate_limiter('dev')
+        self.assertIs(dev.buckets[0], stag.buckets[0])
+        self.assertEqual(dev.buckets[1].rate, 5)
+
+    def test_threads_share_a_limiter(self):
+        import threading
+        import time
+        import smoketest.settings
+        from smoketest import throttling
+        smoketest.settings._SETTINGS = {
+            'rate_limits': {'levels': {'stag': 200}},
+        }
+        bucket_from_setting = throttling._bucket_from_setting
+
+        def slow_bucket_from_setting(setting):
+            # Give the other threads time to miss the cache too
+            time.sleep(0.01)
+            return bucket_from_setting(setting)
+
+        limiters = []
+        threads = [
+            threading.Thread(
+                target=lambda: limiters.append(
+                    throttling.get_rate_limiter('stag')
+                ),
+            )
+            for _ in range(8)
+        ]
+        with patch.object(
+            throttling,
+            '_bucket_from_setting',
+            slow_bucket_from_setting,
+        ):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(limiters), 8)
+        self.assertEqual(len(set(id(limiter) for limiter in limiters)), 1)
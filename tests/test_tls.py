@@ -0,0 +1,52 @@
+import ssl
+import unittest
+
+from mock import (
+    Mock,
+    patch,
+)
+
+
+class TestResumingContext(unittest.TestCase):
+
+    def _wrap(self, context, sockets):
+        # Stand in for the handshake with sockets made up by the test
+        with patch('ssl.SSLContext.wrap_socket', side_effect=sockets) as wrap:
+            for _ in sockets:
+                context.wrap_socket(Mock(), server_hostname='www.usnews.com')
+        return [call[1].get('session') for call in wrap.call_args_list]
+
+    @unittest.skipIf(not hasattr(ssl, 'SSLSession'), 'No session resumption')
+    def test_offers_latest_session(self):
+        from smoketest.tls import make_ssl_context
+        context = make_ssl_context(False)
+        first = Mock(session='first', session_reused=False)
+        second = Mock(session='second', session_reused=True)
+        third = Mock(session='third', session_reused=True)
+        # Tickets sent after the handshake replace the first session
+        first.session = 'ticket'
+        sessions = self._wrap(context, [first, second])
+        self.assertEqual(sessions, [None, 'ticket'])
+        sessions = self._wrap(context, [third])
+        self.assertEqual(sessions, ['second'])
+        self.assertEqual(context.handshake_count, 3)
+        self.assertEqual(context.resumed_count, 2)
+        self.assertAlmostEqual(context.resumption_rate, 2.0 / 3)
+        context.reset_stats()
+        self.assertEqual(context.resumption_rate, 0.0)
+
+    def test_verification_follows_ca_path(self):
+        from requests.certs import where
+        from smoketest.tls import make_ssl_context
+        self.assertEqual(make_ssl_context(False).verify_mode, ssl.CERT_NONE)
+        context = make_ssl_context(where())
+        self.assertEqual(context.verify_mode, ssl.CERT_REQUIRED)
+        self.assertTrue(context.check_hostname)
+
+    @patch('smoketest.tls.get_ca_path', Mock(return_value=False))
+    def test_one_context_per_process(self):
+        from smoketest import tls
+        try:
+            self.assertIs(tls.get_ssl_context(), tls.get_ssl_context())
+        finally:
+            tls.clear()
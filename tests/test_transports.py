@@ -0,0 +1,172 @@
+import threading
+import unittest
+
+from mock import (
+    Mock,
+    patch,
+)
+
+from smoketest import transports
+
+
+class TestTransports(unittest.TestCase):
+
+    def tearDown(self):
+        transports.clear()
+
+    def test_default_transport(self):
+        from smoketest.transports import (
+            RequestsTransport,
+            get_transport,
+        )
+        self.assertIsInstance(get_transport(), RequestsTransport)
+
+    def test_use_transport(self):
+        from smoketest.transports import (
+            get_transport,
+            transport_keys,
+            use_transport,
+        )
+        self.assertEqual(transport_keys(), ['requests', 'http2'])
+        transport = use_transport('requests')
+        self.assertIs(get_transport(), transport)
+
+    def test_requests_sessions_count_requests(self):
+        from smoketest.transports import RequestsTransport
+        transport = RequestsTransport()
+        session = transport.new_session()
+        adapter = session.get_adapter('http://www.usnews.com/')
+        with patch('requests.adapters.HTTPAdapter.send'):
+            adapter.send(Mock())
+            adapter.send(Mock())
+        self.assertEqual(transport.stats.request_count, 2)
+        self.assertEqual(
+            list(transport.summary()),
+            ['Number of connections opened', 'Number of requests'],
+        )
+
+    def test_warm_up(self):
+        from six.moves.BaseHTTPServer import (
+            BaseHTTPRequestHandler,
+            HTTPServer,
+        )
+        from six.moves.socketserver import ThreadingMixIn
+        from smoketest.transports import RequestsTransport
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = Server(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        origin = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+        try:
+            transport = RequestsTransport()
+            transport.share_connections(2)
+            self.assertEqual(transport.warm_up([origin], 2, 1), 2)
+            transport.new_session().get(origin + '/')
+            # The request used a warm connection
+            self.assertEqual(transport.stats.connection_count, 2)
+            # and warming up again only tops up what's missing
+            self.assertEqual(transport.warm_up([origin], 2, 1), 0)
+            transport.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_get_origins(self):
+        from smoketest.transports import get_origins
+        directives = [
+            Mock(urls=['http://www.usnews.com/a', 'http://www.usnews.com/b']),
+            Mock(urls=['https://user:pw@www-stag.usnews.com:8443/']),
+        ]
+        self.assertEqual(get_origins(directives), [
+            'http://www.usnews.com',
+            'https://www-stag.usnews.com:8443',
+        ])
+
+    def test_http2_needs_httpx(self):
+        from smoketest.transports import (
+            TransportUnavailable,
+            use_transport,
+        )
+        with patch.object(transports, '_import_httpx', return_value=None):
+            self.assertRaises(TransportUnavailable, use_transport, 'http2')
+
+
+@unittest.skipIf(
+    transports._import_httpx() is None,
+    'httpx[http2] is not installed',
+)
+class TestHttp2Transport(unittest.TestCase):
+
+    def _response(self, stream, http_version='HTTP/2'):
+        response = Mock()
+        response.http_version = http_version
+        response.extensions = {'network_stream': stream}
+        return response
+
+    def test_counts_streams_and_connections(self):
+        from smoketest.transports import Http2Transport
+        transport = Http2Transport()
+        connection = object()
+        transport.count(self._response(connection))
+        transport.count(self._response(connection))
+        transport.count(self._response(object(), 'HTTP/1.1'))
+        self.assertEqual(transport.stats.connection_count, 2)
+        self.assertEqual(transport.stats.request_count, 3)
+        self.assertEqual(transport.summary()['Number of HTTP/2 streams'], 2)
+
+    def test_shared_sessions(self):
+        from smoketest.transports import Http2Transport
+        transport = Http2Transport()
+        shared = transport.new_session()
+        other = transport.new_session()
+        self.assertIs(other._client._transport, shared._client._transport)
+        private = transport.new_session(private=True)
+        self.assertIsNot(
+            private._client._transport, shared._client._transport,
+        )
+        private.close()
+        transport.close()
+
+    def test_shared_sessions_have_their_own_cookies(self):
+        from smoketest.transports import Http2Transport
+        transport = Http2Transport()
+        shared = transport.new_session()
+        other = transport.new_session()
+        shared.cookies.set('session', 'a')
+        self.assertEqual(dict(shared.cookies), {'session': 'a'})
+        self.assertEqual(dict(other.cookies), {})
+        shared.close()
+        self.assertIsNotNone(transport._shared_transport)
+        transport.close()
+
+    def test_errors_look_like_requests_errors(self):
+        import httpx
+        from requests.exceptions import (
+            ConnectionError,
+            Timeout,
+        )
+        from smoketest.transports import Http2Transport
+        transport = Http2Transport()
+        session = transport.new_session(private=True)
+        session._client = Mock()
+        session._client.request.side_effect = httpx.ConnectTimeout('slow')
+        self.assertRaises(Timeout, session.get, 'https://www.usnews.com/')
+        session._client.request.side_effect = httpx.ConnectError('refused')
+        self.assertRaises(
+            ConnectionError, session.get, 'https://www.usnews.com/',
+        )
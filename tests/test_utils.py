@@ -42,6 +42,33 @@ class TestUtilities(unittest.TestCase):
         actual = uncachebust('usnews.com?_=123&b=2&a=1&c=')
         self.assertEqual(expected, actual)
 
+    def test_fingerprint_response(self):
+        from mock import Mock
+        from smoketest.utils import fingerprint_response
+
+        def response(location, body):
+            response = Mock()
+            response.status_code = 301
+            response.headers = {'location': location}
+            response.content = body
+            return response
+
+        # Cachebusters in redirects don't change the fingerprint, but bodies
+        # and locations do.
+        fingerprint = fingerprint_response(response('/a?_=1', b'x'))
+        self.assertEqual(
+            fingerprint,
+            fingerprint_response(response('/a?_=2', b'x')),
+        )
+        self.assertNotEqual(
+            fingerprint,
+            fingerprint_response(response('/a?_=1', b'y')),
+        )
+        self.assertNotEqual(
+            fingerprint,
+            fingerprint_response(response('/b?_=1', b'x')),
+        )
+
 
 class TestTransformUrlBasedOnOptions(unittest.TestCase):
 
@@ -146,3 +173,77 @@ class TestTransformUrlBasedOnOptions(unittest.TestCase):
         options = Options('https', 'stag', None, False)
         transformed = transform_url_based_on_options(url, options)
         self.assertEqual(transformed, 'https://www-stag.usnews.com')
+
+
+class TestUrlTransformer(unittest.TestCase):
+
+    def setUp(self):
+        import smoketest.settings
+        self._old_settings = smoketest.settings._SETTINGS
+        smoketest.settings._SETTINGS = {
+            'special_cases_url_transforms': {'/old/': '/new/'},
+        }
+
+    def tearDown(self):
+        import smoketest.settings
+        smoketest.settings._SETTINGS = self._old_settings
+
+    def test_transform_all(self):
+        from smoketest.utils import get_url_transformer
+        transformer = get_url_transformer(port=8080, level='stag')
+        self.assertEqual(
+            transformer.transform_all([
+                'http://www.usnews.com/old/a?x=1#top',
+                'http://www.usnews.com',
+                'https://www.usnews.com/{LEVEL}/b',
+                '//www.usnews.com/c',
+            ]),
+            [
+                'http://www-stag.usnews.com:8080/new/a?x=1#top',
+                'http://www-stag.usnews.com:8080',
+                'https://www.usnews.com:8080/stag/b',
+                '//www-stag.usnews.com:8080/c',
+            ],
+        )
+        self.assertIs(get_url_transformer(port=8080, level='stag'), transformer)
+
+    def test_new_settings(self):
+        import smoketest.settings
+        from smoketest.utils import transform_url
+        self.assertEqual(
+            transform_url('http://www.usnews.com/old/', level='live'),
+            'http://www.usnews.com/new/',
+        )
+        smoketest.settings._SETTINGS = {}
+        self.assertEqual(
+            transform_url('http://www.usnews.com/old/', level='live'),
+            'http://www.usnews.com/old/',
+        )
+
+    def test_no_special_cases(self):
+        import smoketest.settings
+        from smoketest.utils import get_url_transformer
+        smoketest.settings._SETTINGS = {}
+        transformer = get_url_transformer(level='stag')
+        self.assertEqual(
+            transformer('http://www.usnews.com/a'),
+            'http://www-stag.usnews.com/a',
+        )
+        self.assertIs(get_url_transformer(level='stag'), transformer)
+
+
+class TestReplacements(unittest.TestCase):
+
+    def test_replacements(self):
+        from smoketest.utils import Replacements
+        replace = Replacements({
+            '/a/': '/b/',
+            '/a/b/': '/long/',
+            '/b/': '/c/',
+            'a.b': 'a-b',
+        })
+        # Longest match wins, and replacements aren't replaced again
+        self.assertEqual(replace('/a/b/x/a/y/b/'), '/long/x/b/y/c/')
+        self.assertEqual(replace('http://a.b/'), 'http://a-b/')
+        self.assertEqual(replace('http://axb'), 'http://axb')
+        self.assertEqual(Replacements({})('/a/'), '/a/')